@@ -1,73 +1,3423 @@
 import streamlit as st
+import asyncio
+import base64
+import bisect
+import csv
+import functools
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import itertools
 import json
+import math
+import multiprocessing
 import os
-import random
+import secrets
+import shutil
+import smtplib
+import socket
+import sqlite3
 import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+import urllib.parse
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
 import pandas as pd
+from streamlit.errors import StreamlitAPIException
+try:
+    import fcntl
+except ImportError:  # Windows não tem fcntl: vale apenas a trava entre threads
+    fcntl = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet é opcional: sem pyarrow, importação e exportação apenas em CSV
+    pa = pq = None
 
-# Função para gerar uma senha temporária
+# Tempo de validade da senha temporária enviada na recuperação de senha
+PASSWORD_RESET_SECONDS = 3600
+
+# Função para gerar uma senha temporária (com um gerador próprio para segredos)
 def generate_temp_password():
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+    return ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(8))
+
+# Versão atual do formato dos dados dos alunos (campo "schema_version")
+SCHEMA_VERSION = 6
+
+# Campos de cada aluno guardados fora do resumo da lista, carregados só quando o aluno é aberto
+DETAIL_FIELDS = ("workouts", "weight_history")
+
+# Função para criar a estrutura inicial dos dados de um treinador (resumo da lista de alunos)
+def new_trainer_students():
+    return {"schema_version": SCHEMA_VERSION, "version": 0, "events_applied": 0, "last_id": 0, "students": {}}
+
+# Função para criar a estrutura inicial dos detalhes de um aluno (treinos e histórico de peso)
+def new_student_detail():
+    history = new_weight_history()
+    return {"version": 0, "events_applied": 0, "workouts": [], "weight_history": history,
+            "weight_stats": compute_weight_stats(history)}
+
+# Médias móveis mantidas nas estatísticas do peso (quantidade de medições de cada janela)
+WEIGHT_MOVING_AVERAGES = (7, 30)
+# Maior peso aceito (kg) nos formulários, na importação e na sincronização
+MAX_WEIGHT_KG = 500.0
+
+# Função para criar o histórico de peso em colunas: uma lista de datas e outra de pesos
+# (sem repetir as chaves de cada medição, como na lista de {"weight", "date"} antiga)
+def new_weight_history():
+    return {"dates": [], "weights": []}
+
+# Função para converter a lista antiga de medições {"weight", "date"} para colunas
+def weight_history_from_entries(entries):
+    return {"dates": [entry["date"] for entry in entries], "weights": [entry["weight"] for entry in entries]}
+
+# Função para calcular do zero as estatísticas do histórico de peso
+def compute_weight_stats(history):
+    weights = history["weights"]
+    stats = {
+        "count": len(weights),
+        "latest": weights[-1] if weights else None,
+        "min": min(weights, default=None),
+        "max": max(weights, default=None),
+    }
+    for window in WEIGHT_MOVING_AVERAGES:
+        recent = weights[-window:]
+        stats[f"ma{window}"] = sum(recent) / len(recent) if recent else None
+    return stats
+
+# Função para registrar uma medição de peso nos detalhes do aluno, na posição da sua data.
+# Uma medição no final atualiza as estatísticas só com ela (e as janelas das médias móveis),
+# sem percorrer o histórico inteiro; uma medição com data antiga faz recalculá-las
+def append_weight(detail, weight, date):
+    history = detail["weight_history"]
+    position = bisect.bisect_right(history["dates"], date)
+    history["dates"].insert(position, date)
+    history["weights"].insert(position, weight)
+    stats = detail.get("weight_stats")
+    if stats is None or stats["count"] != len(history["weights"]) - 1 or position < len(history["weights"]) - 1:
+        detail["weight_stats"] = compute_weight_stats(history)
+        return
+    stats["count"] += 1
+    stats["latest"] = weight
+    stats["min"] = weight if stats["min"] is None else min(stats["min"], weight)
+    stats["max"] = weight if stats["max"] is None else max(stats["max"], weight)
+    for window in WEIGHT_MOVING_AVERAGES:
+        recent = history["weights"][-window:]
+        stats[f"ma{window}"] = sum(recent) / len(recent)
+
+# Função para calcular o IMC (altura em cm); None se o peso ou a altura não foram informados
+def body_mass_index(weight, height):
+    if not weight or not height:
+        return None
+    return weight / (height / 100) ** 2
+
+# Função para criar a biblioteca de modelos de treino de um treinador: o catálogo de exercícios
+# (cada nome guardado uma única vez) e os modelos, que referenciam os exercícios pelo ID.
+# Os treinos dos alunos guardam só o ID do modelo, as marcações e o que o aluno tiver de diferente.
+def new_template_library():
+    return {"version": 0, "last_exercise_id": 0, "exercises": {}, "templates": {}}
+
+# Função para cadastrar exercícios no catálogo, reaproveitando os que já existem com o mesmo nome
+# (sem diferenciar maiúsculas e acentos). Retorna os IDs na ordem recebida
+def catalog_exercises(library, names):
+    known = {normalize_text(name).strip(): exercise_id for exercise_id, name in library["exercises"].items()}
+    exercise_ids = []
+    for name in names:
+        key = normalize_text(name).strip()
+        if key not in known:
+            library["last_exercise_id"] += 1
+            known[key] = str(library["last_exercise_id"])
+            library["exercises"][known[key]] = name.strip()
+        exercise_ids.append(known[key])
+    return exercise_ids
+
+# Função para criar (ou alterar, se o ID for informado) um modelo de treino.
+# Alterações no modelo valem para todos os alunos que o usam
+def save_template(library, name, description, exercise_names, template_id=None):
+    template_id = template_id or new_workout_id()
+    library["templates"][template_id] = {
+        "name": name,
+        "description": description,
+        "exercises": catalog_exercises(library, exercise_names),
+    }
+    return template_id
+
+# Função para criar o treino de um aluno a partir de um modelo
+def new_template_workout(library, template_id):
+    count = len(library["templates"][template_id]["exercises"])
+    return {"id": new_workout_id(), "template_id": template_id, "completed": [False] * count}
+
+# Campos de um treino que o aluno pode ter diferentes do modelo
+WORKOUT_OVERRIDE_FIELDS = ("name", "description", "exercises")
+
+# Função para montar o treino completo de um aluno (modelo + o que o aluno tem de diferente)
+def resolve_workout(workout, library):
+    if "template_id" not in workout:
+        return workout
+    template = library["templates"].get(workout["template_id"])
+    if template is None:
+        resolved = {"name": "Treino sem modelo", "description": "", "exercises": []}
+    else:
+        resolved = {
+            "name": template["name"],
+            "description": template["description"],
+            "exercises": [library["exercises"][exercise_id] for exercise_id in template["exercises"]],
+        }
+    resolved.update(workout)
+    # O modelo pode ter ganhado ou perdido exercícios depois que o treino foi atribuído ao aluno
+    count = len(resolved["exercises"])
+    resolved["completed"] = (list(workout["completed"]) + [False] * count)[:count]
+    return resolved
+
+# Histórico de treinos: cada treino finalizado vira uma sessão guardada fora da lista de treinos
+# ativos, num arquivo por mês ("AAAA-MM"), lido só quando o histórico é aberto.
+# Treinos finalizados antes do histórico existir não têm data e ficam no período "anterior"
+LEGACY_HISTORY_PERIOD = "anterior"
+
+# Função para montar a sessão de um treino finalizado (cópia do treino com as marcações do dia)
+def workout_session(workout, finished_at):
+    session = {"workout_id": workout["id"], "finished_at": finished_at, "completed": list(workout["completed"])}
+    for field in ("template_id",) + WORKOUT_OVERRIDE_FIELDS:
+        if field in workout:
+            session[field] = workout[field]
+    return session
+
+# Função para obter o período (mês) em que uma sessão é guardada
+def history_period(session):
+    finished_at = session.get("finished_at")
+    return finished_at[:7] if finished_at else LEGACY_HISTORY_PERIOD
+
+# Função para ordenar os períodos do histórico do mais recente ao mais antigo
+def sort_history_periods(periods):
+    return sorted(periods, key=lambda period: (period != LEGACY_HISTORY_PERIOD, period), reverse=True)
+
+# Função para gerar o identificador estável de um treino
+def new_workout_id():
+    return uuid.uuid4().hex[:12]
+
+# Migração 0 -> 1: preenche os campos que não existiam nas primeiras versões do app
+def migrate_v1_backfill_fields(data):
+    if "students" not in data:
+        data["students"] = {}
+    # Garantir que o campo "last_id" exista (continuando a partir do maior ID já usado)
+    if "last_id" not in data:
+        data["last_id"] = max((int(student_id) for student_id in data["students"] if student_id.isdigit()), default=0)
+    
+    # Garantir que todos os alunos tenham os campos necessários
+    for student_id, student_info in data["students"].items():
+        if "password" not in student_info:
+            student_info["password"] = None  # Inicializa a senha como None se não existir
+        if "completed_workouts" not in student_info:
+            student_info["completed_workouts"] = 0  # Contador de treinos realizados
+        if "weight_history" not in student_info:
+            student_info["weight_history"] = []  # Histórico de peso
+        if "login" not in student_info:
+            # Gera um login padrão se não existir
+            student_info["login"] = f"{student_info['name'].split()[0].lower()}_{student_id}"
+        if "email" not in student_info:
+            student_info["email"] = ""  # Inicializa o e-mail como vazio se não existir
+        if "workouts" not in student_info:
+            student_info["workouts"] = []
+        for workout in student_info["workouts"]:
+            if "completed" not in workout:
+                workout["completed"] = [False] * len(workout.get("exercises", []))
+
+# Migração 1 -> 2: cada treino ganha um ID estável (usado pelos eventos do diário)
+def migrate_v2_workout_ids(data):
+    data.setdefault("events_applied", 0)
+    for student_info in data["students"].values():
+        for workout in student_info["workouts"]:
+            if "id" not in workout:
+                workout["id"] = new_workout_id()
+
+# Migração 2 -> 3: treinos e histórico de peso saem do resumo da lista de alunos.
+# Os detalhes ficam em data["details"] para o armazenamento gravá-los separadamente.
+def migrate_v3_split_details(data):
+    data["details"] = {}
+    for student_id, student_info in data["students"].items():
+        detail = new_student_detail()
+        for field in DETAIL_FIELDS:
+            detail[field] = student_info.pop(field)
+        data["details"][student_id] = detail
+
+# Migração 3 -> 4: histórico de peso em colunas, com as estatísticas já calculadas.
+# Os detalhes chegam em data["details"]: criados pela migração 3 ou, para resumos que
+# já estavam na versão 3, carregados pelo armazenamento dos arquivos de cada aluno
+def migrate_v4_columnar_weight_history(data):
+    for detail in data.get("details", {}).values():
+        if isinstance(detail["weight_history"], list):
+            detail["weight_history"] = weight_history_from_entries(detail["weight_history"])
+        detail["weight_stats"] = compute_weight_stats(detail["weight_history"])
+
+# Migração 4 -> 5: o resumo de cada aluno guarda o peso inicial (primeira medição do histórico),
+# usado pelos relatórios de evolução de peso sem precisar ler os detalhes
+def migrate_v5_initial_weight(data):
+    details = data.get("details", {})
+    for student_id, student_info in data["students"].items():
+        weights = details[student_id]["weight_history"]["weights"] if student_id in details else []
+        student_info["initial_weight"] = weights[0] if weights else student_info.get("weight")
+
+# Migração 5 -> 6: treinos ocultos (finalizados pelo aluno) saem dos detalhes e vão para o histórico.
+# As sessões ficam em data["archive"] para o armazenamento gravá-las no período "anterior"
+def migrate_v6_archive_hidden_workouts(data):
+    data["archive"] = {}
+    for student_id, detail in data.get("details", {}).items():
+        hidden = [workout for workout in detail["workouts"] if workout.get("hidden")]
+        if hidden:
+            detail["workouts"] = [workout for workout in detail["workouts"] if not workout.get("hidden")]
+            data["archive"][student_id] = [workout_session(workout, None) for workout in hidden]
+
+# Migrações em ordem: a de índice i leva os dados da versão i para a versão i + 1
+SCHEMA_MIGRATIONS = [
+    migrate_v1_backfill_fields,
+    migrate_v2_workout_ids,
+    migrate_v3_split_details,
+    migrate_v4_columnar_weight_history,
+    migrate_v5_initial_weight,
+    migrate_v6_archive_hidden_workouts,
+]
+
+# Função para atualizar os dados de um treinador para a versão atual do formato
+# Retorna True se alguma migração foi aplicada (e os dados precisam ser regravados)
+def migrate_trainer_students(data):
+    version = data.get("schema_version", 0)
+    for number, migration in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+        migration(data)
+        data["schema_version"] = number
+    return version < SCHEMA_VERSION
+
+# Erro levantado ao salvar dados que foram alterados por outra sessão depois de lidos.
+# A classe fica no cache de recursos: o Streamlit executa o script de novo a cada interação
+# (e cria as classes de novo), mas o armazenamento compartilhado, criado numa execução anterior,
+# levanta a classe daquela execução; com uma única classe o "except StaleDataError" a reconhece
+@st.cache_resource
+def stale_data_error_class():
+    class StaleDataError(Exception):
+        pass
+    return StaleDataError
+
+StaleDataError = stale_data_error_class()
+
+# Funções para aplicar um evento do diário (alteração pequena de um aluno).
+# Tipos de evento:
+#   exercise_toggled: {"student_id", "workout_id", "exercise", "completed"}
+#   workout_finished: {"student_id", "workout_id", "action": "archive" (com a "session" guardada
+#                     no histórico), ou "remove"/"hide" nos diários gravados antes do histórico}
+#   weight_recorded:  {"student_id", "weight", "date", "latest"} ("latest": a medição é a mais recente
+#                     do histórico; sem o campo, nos diários antigos, conta como a mais recente)
+# apply_event altera o resumo da lista de alunos; apply_detail_event, os detalhes do aluno.
+def apply_event(data, event):
+    data["events_applied"] = data.get("events_applied", 0) + 1
+    student = data["students"].get(event["student_id"])
+    if student is None:
+        return
+    if event["type"] == "weight_recorded":
+        # Uma medição com data anterior à mais recente só entra no histórico
+        if event.get("latest", True):
+            student["weight"] = event["weight"]
+    elif event["type"] == "workout_finished":
+        student["completed_workouts"] += 1  # Incrementa o contador de treinos realizados
+
+def apply_detail_event(detail, event):
+    detail["events_applied"] = detail.get("events_applied", 0) + 1
+    if event["type"] == "weight_recorded":
+        append_weight(detail, event["weight"], event["date"])
+        return
+    for i, workout in enumerate(detail["workouts"]):
+        if workout["id"] != event["workout_id"]:
+            continue
+        if event["type"] == "exercise_toggled":
+            completed = workout["completed"]
+            # Treinos de modelo podem ter mais exercícios (modelo alterado) do que marcações guardadas
+            if event["exercise"] >= len(completed):
+                completed.extend([False] * (event["exercise"] + 1 - len(completed)))
+            completed[event["exercise"]] = event["completed"]
+        elif event["type"] == "workout_finished":
+            if event["action"] == "hide":
+                workout["hidden"] = True
+            else:
+                detail["workouts"].pop(i)
+        return
+
+# Instrumentação: duração das operações, bytes lidos/gravados e arquivos abertos.
+# PLANOT_METRICS_LOG: arquivo onde cada execução da página grava uma linha JSON com suas medições
+# PLANOT_METRICS_PORT: porta do endpoint HTTP /metrics com os totais no formato texto do Prometheus
+# PLANOT_DEBUG=1: mostra as medições da execução atual na barra lateral
+METRICS_LOG_FILE = os.environ.get("PLANOT_METRICS_LOG")
+METRICS_HOST = os.environ.get("PLANOT_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("PLANOT_METRICS_PORT", "0"))
+DEBUG_SIDEBAR = os.environ.get("PLANOT_DEBUG") == "1"
+# Quantidade de durações recentes guardadas por operação para calcular p50/p99
+METRICS_SAMPLES = 1024
+
+# Medições compartilhadas por todas as sessões. Os totais valem para o processo inteiro;
+# as medições de cada execução da página ficam na thread da sessão (threading.local)
+class Metrics:
+    COUNTERS = ("bytes_read", "bytes_written", "files_opened")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # operação -> [quantidade, soma em segundos, durações recentes]
+        self.durations = {}
+        self.counters = dict.fromkeys(self.COUNTERS + ("reruns",), 0)
+
+    # Medições da execução atual da página nesta thread (None fora de uma execução)
+    @property
+    def current(self):
+        return getattr(self.local, "current", None)
+
+    def begin_rerun(self):
+        self.local.current = {"started": time.perf_counter(), "timings": {}, **dict.fromkeys(self.COUNTERS, 0)}
+
+    # Encerra a execução atual e grava suas medições no log estruturado (se configurado)
+    def end_rerun(self):
+        current = self.current
+        self.local.current = None
+        if current is None:
+            return None
+        duration = time.perf_counter() - current.pop("started")
+        self.observe("rerun", duration)
+        record = {"time": datetime.now().isoformat(timespec="seconds"), "rerun_seconds": round(duration, 6), **current}
+        with self.lock:
+            self.counters["reruns"] += 1
+            if METRICS_LOG_FILE:
+                with open(METRICS_LOG_FILE, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+        return record
+
+    def observe(self, name, seconds):
+        with self.lock:
+            entry = self.durations.setdefault(name, [0, 0.0, deque(maxlen=METRICS_SAMPLES)])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2].append(seconds)
+        current = self.current
+        if current is not None:
+            timing = current["timings"].setdefault(name, [0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    # Registra a abertura de um arquivo e os bytes lidos/gravados nele
+    def count_io(self, read=0, written=0):
+        amounts = {"bytes_read": read, "bytes_written": written, "files_opened": 1}
+        with self.lock:
+            for counter, amount in amounts.items():
+                self.counters[counter] += amount
+        current = self.current
+        if current is not None:
+            for counter, amount in amounts.items():
+                current[counter] += amount
+
+    # Totais no formato texto do Prometheus
+    def prometheus_text(self):
+        lines = ["# HELP planot_operation_seconds Duração das operações do PlanoT",
+                 "# TYPE planot_operation_seconds summary"]
+        with self.lock:
+            for name, (count, total, samples) in sorted(self.durations.items()):
+                ordered = sorted(samples)
+                for quantile in (0.5, 0.99):
+                    value = ordered[min(len(ordered) - 1, int(len(ordered) * quantile))]
+                    lines.append(f'planot_operation_seconds{{operation="{name}",quantile="{quantile}"}} {value:.6f}')
+                lines.append(f'planot_operation_seconds_count{{operation="{name}"}} {count}')
+                lines.append(f'planot_operation_seconds_sum{{operation="{name}"}} {total:.6f}')
+            for counter, value in self.counters.items():
+                lines.append(f"# TYPE planot_{counter}_total counter")
+                lines.append(f"planot_{counter}_total {value}")
+        return "\n".join(lines) + "\n"
+
+# Função para obter as medições compartilhadas do processo
+@st.cache_resource
+def get_metrics():
+    return Metrics()
+
+# Decorador para medir a duração de uma função
+def instrumented(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_metrics().timed(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Função para iniciar (uma única vez por processo) o endpoint HTTP /metrics do Prometheus
+@st.cache_resource
+def start_metrics_server(host, port):
+    metrics = get_metrics()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Sem uma linha de log a cada coleta
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+# Função para gravar um JSON de forma atômica: escreve num arquivo temporário
+# e o renomeia por cima do original (uma queda no meio nunca deixa o arquivo truncado)
+@instrumented("atomic_write_json")
+def atomic_write_json(filename, obj):
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+    try:
+        raw = json.dumps(obj).encode()
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filename)
+        get_metrics().count_io(written=len(raw))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+# Tamanho do diário de eventos (em bytes) a partir do qual ele é compactado em segundo plano
+JOURNAL_COMPACT_BYTES = int(os.environ.get("PLANOT_JOURNAL_COMPACT_BYTES", str(64 * 1024)))
+
+# Backend de armazenamento escolhido pela variável de ambiente PLANOT_STORAGE ("json", "sqlite" ou
+# "remote", que usa o serviço de dados; veja serve_data)
+STORAGE_BACKEND = os.environ.get("PLANOT_STORAGE", "json")
+# Caminho do banco SQLite usado pelo backend "sqlite"
+SQLITE_DB_FILE = os.environ.get("PLANOT_DB", "planot.db")
+
+# Armazenamento em arquivos JSON: trainers.json, um resumo da lista de alunos por treinador
+# ({treinador}_students.json), um arquivo de detalhes por aluno ({treinador}_students/{ID}.json)
+# e o diário de eventos ainda não incorporados ({treinador}_events.jsonl)
+class JSONStorage:
+    # Arquivo com o índice global de login/e-mail dos alunos -> (treinador, ID do aluno)
+    STUDENT_INDEX_FILE = "students_index.json"
+    # Pasta com o relatório pré-calculado de cada treinador (reports/{treinador}.json)
+    REPORTS_DIR = "reports"
+    # Arquivo único com os relatórios de todos os treinadores, usado antes da pasta
+    LEGACY_REPORTS_FILE = "reports.json"
+
+    def __init__(self):
+        # Uma trava por arquivo: sessões de treinadores diferentes gravam em paralelo
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        # Treinadores com compactação do diário em andamento
+        self._compacting = set()
+        # Treinadores cujos arquivos já foram verificados (e migrados) por este processo
+        self._migrated = set()
+        # Entradas do índice de alunos gravadas por este processo para cada treinador e a versão
+        # do arquivo do índice depois da última gravação (se mudar, outro processo gravou)
+        self._indexed = {}
+        self._index_version = None
+
+    # Trava exclusiva de um arquivo, entre threads (sessões) e entre processos (fcntl)
+    @contextmanager
+    def lock(self, name):
+        with self._locks_guard:
+            thread_lock = self._locks.setdefault(name, threading.Lock())
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{name}.lock", "a") as lock_file:
+                get_metrics().count_io()
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_json(self, filename, default):
+        if os.path.exists(filename):
+            with open(filename, "rb") as f:
+                raw = f.read()
+            metrics = get_metrics()
+            metrics.count_io(read=len(raw))
+            with metrics.timed("json_parse"):
+                return json.loads(raw)
+        else:
+            return default
+
+    def load_trainers(self):
+        return self.read_json("trainers.json", {})
+
+    def save_trainers(self, trainers):
+        with self.lock("trainers"):
+            atomic_write_json("trainers.json", trainers)
+
+    # Cadastra um treinador; retorna False se o login já existir
+    def add_trainer(self, login, info):
+        with self.lock("trainers"):
+            trainers = self.load_trainers()
+            if login in trainers:
+                return False
+            trainers[login] = info
+            atomic_write_json("trainers.json", trainers)
+            return True
+
+    # Troca a senha (hash) de um treinador; retorna False se o login não existir
+    def set_trainer_password(self, login, password):
+        with self.lock("trainers"):
+            trainers = self.load_trainers()
+            if login not in trainers:
+                return False
+            trainers[login]["password"] = password
+            atomic_write_json("trainers.json", trainers)
+            return True
+
+    def get_trainers_version(self):
+        try:
+            stat = os.stat("trainers.json")
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+
+    def detail_filename(self, trainer_login, student_id):
+        return os.path.join(f"{trainer_login}_students", f"{student_id}.json")
+
+    def write_detail(self, trainer_login, student_id, detail):
+        os.makedirs(f"{trainer_login}_students", exist_ok=True)
+        atomic_write_json(self.detail_filename(trainer_login, student_id), detail)
+
+    # Histórico de treinos: uma pasta por aluno com um arquivo JSON lines por mês
+    def history_dir(self, trainer_login, student_id):
+        return os.path.join(f"{trainer_login}_history", student_id)
+
+    def archive_sessions_locked(self, trainer_login, student_id, sessions):
+        by_period = {}
+        for session in sessions:
+            by_period.setdefault(history_period(session), []).append(session)
+        os.makedirs(self.history_dir(trainer_login, student_id), exist_ok=True)
+        for period, items in by_period.items():
+            lines = "".join(json.dumps(session) + "\n" for session in items)
+            with open(os.path.join(self.history_dir(trainer_login, student_id), f"{period}.jsonl"), "a") as f:
+                f.write(lines)
+            get_metrics().count_io(written=len(lines.encode()))
+
+    def archive_session(self, trainer_login, student_id, session):
+        with self.lock(f"{trainer_login}_students"):
+            self.archive_sessions_locked(trainer_login, student_id, [session])
+
+    def load_history_periods(self, trainer_login, student_id):
+        directory = self.history_dir(trainer_login, student_id)
+        if not os.path.isdir(directory):
+            return []
+        return sort_history_periods(name[:-len(".jsonl")] for name in os.listdir(directory) if name.endswith(".jsonl"))
+
+    def load_history(self, trainer_login, student_id, period):
+        filename = os.path.join(self.history_dir(trainer_login, student_id), f"{period}.jsonl")
+        if not os.path.exists(filename):
+            return []
+        with open(filename, "rb") as f:
+            raw = f.read()
+        get_metrics().count_io(read=len(raw))
+        # Uma linha incompleta (queda no meio de uma gravação) é descartada
+        return [json.loads(line) for line in raw.splitlines(keepends=True) if line.endswith(b"\n")]
+
+    # Lê o resumo da lista de alunos (migrando-o uma única vez se estiver num formato antigo)
+    # As funções terminadas em "_locked" devem ser chamadas com a trava do treinador
+    def read_snapshot_locked(self, trainer_login):
+        filename = f"{trainer_login}_students.json"
+        data = self.read_json(filename, None)
+        if data is None:
+            # Se o arquivo não existir, criar uma estrutura inicial
+            return new_trainer_students()
+        if 3 <= data.get("schema_version", 0) < SCHEMA_VERSION:
+            # Desde a versão 3 os detalhes ficam em arquivos próprios: as migrações também os recebem
+            data["details"] = {}
+            for student_id in data["students"]:
+                detail = self.read_json(self.detail_filename(trainer_login, student_id), None)
+                if detail is not None:
+                    data["details"][student_id] = detail
+        if migrate_trainer_students(data):
+            for student_id, sessions in data.pop("archive", {}).items():
+                self.archive_sessions_locked(trainer_login, student_id, sessions)
+            for student_id, detail in data.pop("details", {}).items():
+                self.write_detail(trainer_login, student_id, detail)
+            atomic_write_json(filename, data)
+        return data
+
+    # Os detalhes podem estar num formato antigo (ou ainda embutidos no resumo): na primeira
+    # vez que o treinador é acessado, lê o resumo para que tudo seja migrado antes dos detalhes
+    def migrate_if_needed_locked(self, trainer_login):
+        if trainer_login not in self._migrated:
+            self.read_snapshot_locked(trainer_login)
+            self._migrated.add(trainer_login)
+
+    def read_detail_locked(self, trainer_login, student_id):
+        return self.read_json(self.detail_filename(trainer_login, student_id), None) or new_student_detail()
+
+    # Lê os eventos do diário ainda não incorporados aos arquivos
+    def read_journal_locked(self, trainer_login):
+        filename = f"{trainer_login}_events.jsonl"
+        if not os.path.exists(filename):
+            return []
+        with open(filename, "rb") as f:
+            raw = f.read()
+        get_metrics().count_io(read=len(raw))
+        # Uma linha incompleta (queda no meio de uma gravação) é descartada
+        return [json.loads(line) for line in raw.splitlines(keepends=True) if line.endswith(b"\n")]
+
+    def truncate_journal_locked(self, trainer_login):
+        filename = f"{trainer_login}_events.jsonl"
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    # Grava o resumo e/ou detalhes recebidos (que já incluem os eventos do diário) e incorpora
+    # os eventos restantes aos arquivos dos demais alunos afetados; depois esvazia o diário
+    def write_compacted_locked(self, trainer_login, data=None, details=None):
+        events = self.read_journal_locked(trainer_login)
+        details = dict(details or {})
+        if data is None and events:
+            data = self.read_snapshot_locked(trainer_login)
+            for event in events:
+                apply_event(data, event)
+        for student_id in {event["student_id"] for event in events} - set(details):
+            detail = self.read_detail_locked(trainer_login, student_id)
+            for event in events:
+                if event["student_id"] == student_id:
+                    apply_detail_event(detail, event)
+            details[student_id] = detail
+        for student_id, detail in details.items():
+            # Eventos de alunos já excluídos são descartados
+            if data is None or student_id in data["students"]:
+                self.write_detail(trainer_login, student_id, detail)
+        if data is not None:
+            atomic_write_json(f"{trainer_login}_students.json", data)
+        self.truncate_journal_locked(trainer_login)
+
+    def load_trainer_students(self, trainer_login):
+        with self.lock(f"{trainer_login}_students"):
+            data = self.read_snapshot_locked(trainer_login)
+            events = self.read_journal_locked(trainer_login)
+        for event in events:
+            apply_event(data, event)
+        return data
+
+    def load_student_detail(self, trainer_login, student_id):
+        with self.lock(f"{trainer_login}_students"):
+            self.migrate_if_needed_locked(trainer_login)
+            detail = self.read_detail_locked(trainer_login, student_id)
+            events = self.read_journal_locked(trainer_login)
+        for event in events:
+            if event["student_id"] == student_id:
+                apply_detail_event(detail, event)
+        return detail
+
+    # Lê os detalhes de vários alunos de uma vez (o diário é lido uma única vez)
+    def load_student_details(self, trainer_login, student_ids):
+        with self.lock(f"{trainer_login}_students"):
+            self.migrate_if_needed_locked(trainer_login)
+            details = {student_id: self.read_detail_locked(trainer_login, student_id) for student_id in student_ids}
+            events = self.read_journal_locked(trainer_login)
+        for event in events:
+            if event["student_id"] in details:
+                apply_detail_event(details[event["student_id"]], event)
+        return details
+
+    # Salva o resumo se ninguém tiver gravado uma versão mais nova (ou eventos) desde a leitura.
+    # "details" são detalhes de alunos novos gravados na mesma operação (cadastro e importação).
+    # Retorna a nova versão do arquivo (usada pelo cache)
+    def save_trainer_students(self, trainer_login, data, details=None):
+        filename = f"{trainer_login}_students.json"
+        with self.lock(f"{trainer_login}_students"):
+            stored = self.read_snapshot_locked(trainer_login) if os.path.exists(filename) else new_trainer_students()
+            current = stored.get("version", 0)
+            events_applied = stored.get("events_applied", 0) + len(self.read_journal_locked(trainer_login))
+            if data.get("version", 0) != current or data.get("events_applied", 0) != events_applied:
+                raise StaleDataError(trainer_login)
+            data["version"] = current + 1
+            try:
+                self.write_compacted_locked(trainer_login, data=data, details=details)
+            except BaseException:
+                data["version"] = current
+                raise
+            # Alunos excluídos: remove também os arquivos de detalhes e o histórico de treinos
+            for student_id in set(stored["students"]) - set(data["students"]):
+                detail_filename = self.detail_filename(trainer_login, student_id)
+                if os.path.exists(detail_filename):
+                    os.remove(detail_filename)
+                shutil.rmtree(self.history_dir(trainer_login, student_id), ignore_errors=True)
+            version = self.get_version(trainer_login)
+        self.update_student_index(trainer_login, data)
+        return version
+
+    # Salva os detalhes de um aluno com a mesma verificação de versão do resumo
+    def save_student_detail(self, trainer_login, student_id, detail):
+        with self.lock(f"{trainer_login}_students"):
+            self.migrate_if_needed_locked(trainer_login)
+            stored = self.read_detail_locked(trainer_login, student_id)
+            pending = sum(1 for event in self.read_journal_locked(trainer_login) if event["student_id"] == student_id)
+            current = stored["version"]
+            if detail.get("version", 0) != current or detail.get("events_applied", 0) != stored["events_applied"] + pending:
+                raise StaleDataError(trainer_login)
+            detail["version"] = current + 1
+            try:
+                self.write_compacted_locked(trainer_login, details={student_id: detail})
+            except BaseException:
+                detail["version"] = current
+                raise
+            return self.get_version(trainer_login, student_id)
+
+    # Acrescenta um evento ao diário do treinador: uma linha pequena em vez de regravar tudo.
+    # Retorna (antes, depois) da parte "diário" das versões do resumo e dos detalhes do aluno,
+    # para o cache poder aplicar o evento em memória
+    def append_event(self, trainer_login, event):
+        return self.append_events(trainer_login, [event])
+
+    # Acrescenta vários eventos de um mesmo aluno numa única gravação do diário
+    def append_events(self, trainer_login, events):
+        with self.lock(f"{trainer_login}_students"):
+            # A sessão de um treino finalizado vai para o histórico antes do evento entrar no diário
+            for event in events:
+                if "session" in event:
+                    self.archive_sessions_locked(trainer_login, event["student_id"], [event["session"]])
+            before = self.journal_size(trainer_login)
+            lines = "".join(json.dumps(event) + "\n" for event in events)
+            with open(f"{trainer_login}_events.jsonl", "a") as f:
+                f.write(lines)
+            get_metrics().count_io(written=len(lines.encode()))
+            after = self.journal_size(trainer_login)
+        if after > JOURNAL_COMPACT_BYTES:
+            self.compact_in_background(trainer_login)
+        return (before, before), (after, after)
+
+    # Incorpora os eventos do diário aos arquivos (sem mudar a versão dos dados)
+    def compact_journal(self, trainer_login):
+        with self.lock(f"{trainer_login}_students"):
+            self.write_compacted_locked(trainer_login)
+
+    def compact_in_background(self, trainer_login):
+        with self._locks_guard:
+            if trainer_login in self._compacting:
+                return
+            self._compacting.add(trainer_login)
+
+        def run():
+            try:
+                self.compact_journal(trainer_login)
+            finally:
+                with self._locks_guard:
+                    self._compacting.discard(trainer_login)
+
+        threading.Thread(target=run, name=f"compact-{trainer_login}", daemon=True).start()
+
+    # Carrega o índice de alunos (reconstrói se o arquivo não existir)
+    def load_student_index(self):
+        index = self.read_json(self.STUDENT_INDEX_FILE, None)
+        if index is None:
+            return self.rebuild_student_index()
+        return index
+
+    def save_student_index(self, index):
+        atomic_write_json(self.STUDENT_INDEX_FILE, index)
+
+    # Monta as entradas do índice a partir dos dados de um treinador
+    def build_student_index_entries(self, trainer_login, data):
+        logins = {}
+        emails = {}
+        for student_id, student_info in data["students"].items():
+            if student_info.get("login"):
+                logins[student_info["login"]] = [trainer_login, student_id]
+            if student_info.get("email"):
+                emails[student_info["email"]] = [trainer_login, student_id]
+        return logins, emails
+
+    # Reconstrói o índice lendo os arquivos de todos os treinadores.
+    # Um login (ou e-mail) repetido fica com o primeiro aluno encontrado, na ordem dos treinadores
+    def rebuild_student_index(self):
+        with self.lock("students_index"):
+            return self.rebuild_student_index_locked()
+
+    def rebuild_student_index_locked(self):
+        index = {"logins": {}, "emails": {}}
+        indexed = {}
+        for trainer_login in self.load_trainers():
+            data = self.load_trainer_students(trainer_login)
+            logins, emails = self.build_student_index_entries(trainer_login, data)
+            for key, entries in (("logins", logins), ("emails", emails)):
+                for value, entry in entries.items():
+                    index[key].setdefault(value, entry)
+            indexed[trainer_login] = (logins, emails)
+        self.save_student_index(index)
+        with self._locks_guard:
+            self._indexed = indexed
+            self._index_version = self.student_index_version()
+        return index
+
+    def student_index_version(self):
+        try:
+            stat = os.stat(self.STUDENT_INDEX_FILE)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # Atualiza no índice apenas as entradas de um treinador. Se nenhum login ou e-mail do
+    # treinador mudou desde a última atualização feita por este processo (e nenhum outro
+    # processo gravou o índice desde então), nada é lido nem gravado
+    def update_student_index(self, trainer_login, data):
+        entries = self.build_student_index_entries(trainer_login, data)
+        with self._locks_guard:
+            if self._indexed.get(trainer_login) == entries and self._index_version == self.student_index_version():
+                return
+        with self.lock("students_index"):
+            if not os.path.exists(self.STUDENT_INDEX_FILE):
+                self.rebuild_student_index_locked()
+                return
+            previous = self.student_index_version()
+            self.update_student_index_locked(trainer_login, entries)
+            with self._locks_guard:
+                # Outro processo gravou o índice: as entradas lembradas dos demais treinadores
+                # podem não estar mais nele
+                if previous != self._index_version:
+                    self._indexed = {}
+                self._indexed[trainer_login] = entries
+                self._index_version = self.student_index_version()
+
+    def update_student_index_locked(self, trainer_login, entries):
+        index = self.read_json(self.STUDENT_INDEX_FILE, {"logins": {}, "emails": {}})
+        changed = False
+        for key, values in zip(("logins", "emails"), entries):
+            # Remove entradas antigas do treinador que não existem mais
+            for value, (owner, _) in list(index[key].items()):
+                if owner == trainer_login and value not in values:
+                    del index[key][value]
+                    changed = True
+            for value, entry in values.items():
+                # Um login ou e-mail de aluno de outro treinador não é sobrescrito: continua com
+                # o aluno que o usava antes (logins novos são únicos, veja unique_student_logins)
+                owner = index[key].get(value)
+                if owner != entry and (owner is None or owner[0] == trainer_login):
+                    index[key][value] = entry
+                    changed = True
+        # Só reescreve o índice se algum login ou e-mail mudou
+        if changed:
+            self.save_student_index(index)
+
+    # Procura no índice o (treinador, ID do aluno) de um login ou e-mail
+    def lookup_student(self, field, value):
+        key = "logins" if field == "login" else "emails"
+        entry = self.load_student_index()[key].get(value)
+        return tuple(entry) if entry else (None, None)
+
+    # Procura vários logins (ou e-mails) de uma vez: {valor: (treinador, ID do aluno)} dos encontrados
+    def lookup_students(self, field, values):
+        entries = self.load_student_index()["logins" if field == "login" else "emails"]
+        return {value: tuple(entries[value]) for value in values if value in entries}
+
+    # Índice desatualizado (arquivo editado fora do app): reconstrói
+    def refresh_student_index(self):
+        self.rebuild_student_index()
+
+    # O índice pode não ter um aluno se alguma lista de alunos foi gravada depois dele
+    # (por outro processo que parou antes de atualizar o índice, por exemplo)
+    def student_index_stale(self):
+        index_version = self.student_index_version()
+        if index_version is None:
+            return True
+        for trainer_login in self.load_trainers():
+            try:
+                if os.stat(f"{trainer_login}_students.json").st_mtime_ns > index_version[0]:
+                    return True
+            except FileNotFoundError:
+                pass
+        return False
+
+    def journal_size(self, trainer_login):
+        try:
+            return os.path.getsize(f"{trainer_login}_events.jsonl")
+        except FileNotFoundError:
+            return 0
+
+    # Versão do resumo de um treinador (ou dos detalhes de um aluno): (arquivo, diário).
+    # Muda sempre que o arquivo é regravado ou o diário cresce.
+    def get_version(self, trainer_login, student_id=None):
+        filename = f"{trainer_login}_students.json" if student_id is None else self.detail_filename(trainer_login, student_id)
+        try:
+            stat = os.stat(filename)
+            file_version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            file_version = None
+        return (file_version, self.journal_size(trainer_login))
+
+    # Relatórios pré-calculados: {treinador: {"version": [versão, eventos], "report": {...}}}
+    # Cada treinador tem o seu arquivo, gravado com a trava do próprio treinador: a atualização
+    # depois de um salvamento ou evento não disputa uma trava global com os outros treinadores
+    def report_filename(self, trainer_login):
+        return os.path.join(self.REPORTS_DIR, f"{trainer_login}.json")
+
+    def load_reports(self):
+        if os.path.exists(self.LEGACY_REPORTS_FILE):
+            self.split_legacy_reports()
+        if not os.path.isdir(self.REPORTS_DIR):
+            return {}
+        reports = {}
+        for name in sorted(os.listdir(self.REPORTS_DIR)):
+            if name.endswith(".json"):
+                entry = self.read_json(os.path.join(self.REPORTS_DIR, name), None)
+                if entry is not None:
+                    reports[name[:-len(".json")]] = entry
+        return reports
+
+    # Grava o relatório de um treinador, a menos que já exista um calculado sobre dados mais novos
+    def save_trainer_report(self, trainer_login, version, report):
+        with self.lock(f"{trainer_login}_students"):
+            self.write_report_locked(trainer_login, {"version": list(version), "report": report})
+
+    def write_report_locked(self, trainer_login, entry, force=False):
+        filename = self.report_filename(trainer_login)
+        stored = None if force else self.read_json(filename, None)
+        if stored is not None and tuple(stored["version"]) > tuple(entry["version"]):
+            return
+        os.makedirs(self.REPORTS_DIR, exist_ok=True)
+        atomic_write_json(filename, entry)
+
+    # Troca todos os relatórios pelos recalculados (e remove os de treinadores que não existem mais)
+    def replace_reports(self, reports):
+        for trainer_login, entry in reports.items():
+            with self.lock(f"{trainer_login}_students"):
+                self.write_report_locked(trainer_login, entry, force=True)
+        for trainer_login in set(self.load_reports()) - set(reports):
+            with self.lock(f"{trainer_login}_students"):
+                if os.path.exists(self.report_filename(trainer_login)):
+                    os.remove(self.report_filename(trainer_login))
+
+    # Converte o arquivo único de relatórios antigo em um arquivo por treinador
+    def split_legacy_reports(self):
+        with self.lock("reports"):
+            legacy = self.read_json(self.LEGACY_REPORTS_FILE, None)
+            if legacy is None:
+                return
+            for trainer_login, entry in legacy.items():
+                with self.lock(f"{trainer_login}_students"):
+                    self.write_report_locked(trainer_login, entry)
+            os.remove(self.LEGACY_REPORTS_FILE)
+
+    # Modelos de treino e catálogo de exercícios do treinador ({treinador}_templates.json)
+    def templates_filename(self, trainer_login):
+        return f"{trainer_login}_templates.json"
+
+    def load_templates(self, trainer_login):
+        return self.read_json(self.templates_filename(trainer_login), None) or new_template_library()
+
+    # Salva os modelos com a mesma verificação de versão do resumo
+    def save_templates(self, trainer_login, library):
+        with self.lock(f"{trainer_login}_templates"):
+            current = self.load_templates(trainer_login)["version"]
+            if library.get("version", 0) != current:
+                raise StaleDataError(trainer_login)
+            library["version"] = current + 1
+            try:
+                atomic_write_json(self.templates_filename(trainer_login), library)
+            except BaseException:
+                library["version"] = current
+                raise
+            return self.get_templates_version(trainer_login)
+
+    def get_templates_version(self, trainer_login):
+        try:
+            stat = os.stat(self.templates_filename(trainer_login))
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+
+# Armazenamento em SQLite (modo WAL) com tabelas normalizadas:
+# cada alteração vira atualização de linhas em vez de reescrever o treinador inteiro
+class SQLiteStorage:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS trainers (
+            login TEXT PRIMARY KEY,
+            email TEXT,
+            password TEXT
+        );
+        CREATE TABLE IF NOT EXISTS rosters (
+            trainer_login TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS students (
+            trainer_login TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            name TEXT,
+            weight REAL,
+            height REAL,
+            email TEXT,
+            login TEXT,
+            password TEXT,
+            completed_workouts INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (trainer_login, student_id)
+        );
+        CREATE INDEX IF NOT EXISTS students_login ON students (login);
+        CREATE INDEX IF NOT EXISTS students_email ON students (email);
+        CREATE TABLE IF NOT EXISTS workouts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trainer_login TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            name TEXT,
+            description TEXT,
+            hidden INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS workouts_student ON workouts (trainer_login, student_id, position);
+        CREATE TABLE IF NOT EXISTS exercises (
+            workout_id INTEGER NOT NULL REFERENCES workouts (id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            name TEXT,
+            completed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (workout_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS weight_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trainer_login TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            weight REAL,
+            date TEXT
+        );
+        CREATE INDEX IF NOT EXISTS weight_history_student ON weight_history (trainer_login, student_id, id);
+    """
+    # Alterações aplicadas sobre o esquema inicial, na ordem (controladas por PRAGMA user_version)
+    UPGRADES = [
+        "ALTER TABLE rosters ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE workouts ADD COLUMN uid TEXT",
+        "UPDATE workouts SET uid = lower(hex(randomblob(6))) WHERE uid IS NULL",
+        "CREATE INDEX IF NOT EXISTS workouts_uid ON workouts (trainer_login, student_id, uid)",
+        "ALTER TABLE rosters ADD COLUMN events_applied INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE students ADD COLUMN detail_version INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE students ADD COLUMN events_applied INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE students ADD COLUMN initial_weight REAL",
+        "UPDATE students SET initial_weight = COALESCE((SELECT h.weight FROM weight_history h "
+        "WHERE h.trainer_login = students.trainer_login AND h.student_id = students.student_id ORDER BY h.id LIMIT 1), weight)",
+        "CREATE TABLE IF NOT EXISTS trainer_reports (trainer_login TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+        "events_applied INTEGER NOT NULL, report TEXT NOT NULL)",
+        "ALTER TABLE workouts ADD COLUMN template_id TEXT",
+        "CREATE TABLE IF NOT EXISTS template_libraries (trainer_login TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+        "library TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS workout_sessions (id INTEGER PRIMARY KEY AUTOINCREMENT, trainer_login TEXT NOT NULL, "
+        "student_id TEXT NOT NULL, period TEXT NOT NULL, session TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS workout_sessions_student ON workout_sessions (trainer_login, student_id, period, id)",
+        # Treinos ocultos vão para o histórico (json_patch descarta os campos nulos)
+        "INSERT INTO workout_sessions (trainer_login, student_id, period, session) "
+        "SELECT trainer_login, student_id, 'anterior', json_patch('{}', json_object("
+        "'workout_id', uid, 'template_id', template_id, 'name', name, 'description', description, "
+        "'exercises', CASE WHEN template_id IS NULL THEN (SELECT json_group_array(e.name) FROM "
+        "(SELECT name FROM exercises WHERE workout_id = workouts.id ORDER BY position) e) END, "
+        "'completed', (SELECT json_group_array(json(CASE WHEN e.completed THEN 'true' ELSE 'false' END)) FROM "
+        "(SELECT completed FROM exercises WHERE workout_id = workouts.id ORDER BY position) e))) "
+        "FROM workouts WHERE hidden = 1 ORDER BY id",
+        "DELETE FROM workouts WHERE hidden = 1",
+        # Versão da tabela de treinadores (invalida o cache de credenciais)
+        "CREATE TABLE IF NOT EXISTS trainers_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO trainers_version (id, version) VALUES (1, 0)",
+        # Senha temporária da recuperação de senha (só substitui a senha depois de usada)
+        "ALTER TABLE students ADD COLUMN reset_password TEXT",
+        "ALTER TABLE students ADD COLUMN reset_expires REAL",
+    ]
+    # Colunas do resumo de cada aluno (o que a lista e o login precisam);
+    # completed_workouts deve ser a última (write_summary usa 0 se não houver valor)
+    SUMMARY_FIELDS = ("name", "weight", "height", "email", "login", "password", "reset_password", "reset_expires",
+                      "initial_weight", "completed_workouts")
+
+    def __init__(self, path):
+        self.path = path
+        # Uma conexão por thread (cada sessão do Streamlit roda em sua própria thread)
+        self._local = threading.local()
+        conn = self.connect()
+        conn.executescript(self.SCHEMA)
+        user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statement in enumerate(self.UPGRADES[user_version:], start=user_version + 1):
+            with self.transaction() as conn:
+                conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def load_trainers(self):
+        rows = self.connect().execute("SELECT login, email, password FROM trainers")
+        return {row["login"]: {"email": row["email"], "password": row["password"]} for row in rows}
+
+    def save_trainers(self, trainers):
+        with self.transaction() as conn:
+            existing = {row["login"] for row in conn.execute("SELECT login FROM trainers")}
+            conn.executemany(
+                "INSERT INTO trainers (login, email, password) VALUES (?, ?, ?) "
+                "ON CONFLICT (login) DO UPDATE SET email = excluded.email, password = excluded.password",
+                [(login, info.get("email"), info.get("password")) for login, info in trainers.items()],
+            )
+            conn.executemany("DELETE FROM trainers WHERE login = ?", [(login,) for login in existing - set(trainers)])
+            conn.execute("UPDATE trainers_version SET version = version + 1")
+
+    # Cadastra um treinador; retorna False se o login já existir
+    def add_trainer(self, login, info):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO trainers (login, email, password) VALUES (?, ?, ?)",
+                (login, info.get("email"), info.get("password")),
+            )
+            conn.execute("UPDATE trainers_version SET version = version + 1")
+            return cursor.rowcount == 1
+
+    # Troca a senha (hash) de um treinador; retorna False se o login não existir
+    def set_trainer_password(self, login, password):
+        with self.transaction() as conn:
+            cursor = conn.execute("UPDATE trainers SET password = ? WHERE login = ?", (password, login))
+            conn.execute("UPDATE trainers_version SET version = version + 1")
+            return cursor.rowcount == 1
+
+    def get_trainers_version(self):
+        return self.connect().execute("SELECT version FROM trainers_version").fetchone()["version"]
+
+    # Lê o resumo dos alunos de um treinador (sem treinos nem histórico de peso)
+    def read_summaries(self, conn, trainer_login):
+        rows = conn.execute("SELECT * FROM students WHERE trainer_login = ? ORDER BY student_id", (trainer_login,))
+        return {row["student_id"]: {field: row[field] for field in self.SUMMARY_FIELDS} for row in rows}
+
+    # Lê os detalhes (treinos e histórico de peso) de um único aluno
+    def read_detail(self, conn, trainer_login, student_id):
+        key = (trainer_login, student_id)
+        row = conn.execute(
+            "SELECT detail_version, events_applied FROM students WHERE trainer_login = ? AND student_id = ?", key).fetchone()
+        detail = new_student_detail()
+        if row is None:
+            return detail
+        detail["version"] = row["detail_version"]
+        detail["events_applied"] = row["events_applied"]
+        workouts_by_id = {}
+        for row in conn.execute(
+                "SELECT * FROM workouts WHERE trainer_login = ? AND student_id = ? ORDER BY position", key):
+            if row["template_id"]:
+                # Treino de modelo: nome e descrição só existem se forem diferentes do modelo
+                workout = {"id": row["uid"], "template_id": row["template_id"], "exercises": [], "completed": []}
+                workout.update({field: row[field] for field in ("name", "description") if row[field] is not None})
+            else:
+                workout = {"id": row["uid"], "name": row["name"], "description": row["description"], "exercises": [], "completed": []}
+            if row["hidden"]:
+                workout["hidden"] = True
+            detail["workouts"].append(workout)
+            workouts_by_id[row["id"]] = workout
+        if workouts_by_id:
+            for row in conn.execute(
+                f"SELECT workout_id, position, name, completed FROM exercises WHERE workout_id IN "
+                f"({','.join('?' * len(workouts_by_id))}) ORDER BY workout_id, position",
+                list(workouts_by_id),
+            ):
+                workout = workouts_by_id[row["workout_id"]]
+                # Posições sem linha (modelo que ganhou exercícios) contam como não marcadas
+                missing = row["position"] - len(workout["completed"])
+                workout["exercises"].extend([None] * missing)
+                workout["completed"].extend([False] * missing)
+                workout["exercises"].append(row["name"])
+                workout["completed"].append(bool(row["completed"]))
+            for workout in workouts_by_id.values():
+                # Exercícios sem nome: o treino usa os exercícios do modelo
+                if "template_id" in workout and all(name is None for name in workout["exercises"]):
+                    del workout["exercises"]
+        history = detail["weight_history"]
+        for row in conn.execute(
+                "SELECT weight, date FROM weight_history WHERE trainer_login = ? AND student_id = ? ORDER BY date, id",
+                key):
+            history["dates"].append(row["date"])
+            history["weights"].append(row["weight"])
+        detail["weight_stats"] = compute_weight_stats(history)
+        return detail
+
+    def load_trainer_students(self, trainer_login):
+        conn = self.connect()
+        row = conn.execute(
+            "SELECT last_id, version, events_applied FROM rosters WHERE trainer_login = ?", (trainer_login,)).fetchone()
+        # O banco já guarda os dados no formato atual (o esquema evolui pelas UPGRADES)
+        return {
+            "schema_version": SCHEMA_VERSION,
+            "version": row["version"] if row else 0,
+            "events_applied": row["events_applied"] if row else 0,
+            "last_id": row["last_id"] if row else 0,
+            "students": self.read_summaries(conn, trainer_login),
+        }
+
+    def load_student_detail(self, trainer_login, student_id):
+        return self.read_detail(self.connect(), trainer_login, student_id)
+
+    def load_student_details(self, trainer_login, student_ids):
+        conn = self.connect()
+        return {student_id: self.read_detail(conn, trainer_login, student_id) for student_id in student_ids}
+
+    # Salva o resumo comparando com o que está no banco: só as linhas que mudaram são gravadas.
+    # A gravação é recusada se outra sessão salvou uma versão mais nova desde a leitura.
+    # "details" são detalhes de alunos novos gravados na mesma transação (cadastro e importação).
+    def save_trainer_students(self, trainer_login, data, details=None):
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT version, events_applied FROM rosters WHERE trainer_login = ?", (trainer_login,)).fetchone()
+            current = row["version"] if row else 0
+            events_applied = row["events_applied"] if row else 0
+            if data.get("version", 0) != current or data.get("events_applied", 0) != events_applied:
+                raise StaleDataError(trainer_login)
+            conn.execute(
+                "INSERT INTO rosters (trainer_login, last_id, version, events_applied) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (trainer_login) DO UPDATE SET last_id = excluded.last_id, version = excluded.version",
+                (trainer_login, data["last_id"], current + 1, events_applied),
+            )
+            stored = self.read_summaries(conn, trainer_login)
+            for student_id in set(stored) - set(data["students"]):
+                self.delete_student(conn, trainer_login, student_id)
+            for student_id, student_info in data["students"].items():
+                if stored.get(student_id) != {field: student_info.get(field) for field in self.SUMMARY_FIELDS}:
+                    self.write_summary(conn, trainer_login, student_id, student_info)
+            for student_id, detail in (details or {}).items():
+                self.write_detail(conn, trainer_login, student_id, detail, self.read_detail(conn, trainer_login, student_id))
+        data["version"] = current + 1
+        return (data["version"], events_applied)
+
+    def delete_student(self, conn, trainer_login, student_id):
+        key = (trainer_login, student_id)
+        conn.execute("DELETE FROM workouts WHERE trainer_login = ? AND student_id = ?", key)
+        conn.execute("DELETE FROM weight_history WHERE trainer_login = ? AND student_id = ?", key)
+        conn.execute("DELETE FROM workout_sessions WHERE trainer_login = ? AND student_id = ?", key)
+        conn.execute("DELETE FROM students WHERE trainer_login = ? AND student_id = ?", key)
+
+    def write_summary(self, conn, trainer_login, student_id, student_info):
+        fields = self.SUMMARY_FIELDS
+        conn.execute(
+            f"INSERT INTO students (trainer_login, student_id, {', '.join(fields)}) "
+            f"VALUES (?, ?, {', '.join('?' * len(fields))}) ON CONFLICT (trainer_login, student_id) DO UPDATE SET "
+            + ", ".join(f"{field} = excluded.{field}" for field in fields),
+            (trainer_login, student_id) + tuple(student_info.get(field) for field in fields[:-1])
+            + (student_info.get("completed_workouts", 0),),
+        )
+
+    # Salva os detalhes de um aluno com a mesma verificação de versão do resumo
+    def save_student_detail(self, trainer_login, student_id, detail):
+        key = (trainer_login, student_id)
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT detail_version, events_applied FROM students WHERE trainer_login = ? AND student_id = ?",
+                key).fetchone()
+            # Aluno inexistente (excluído por outra sessão) também conta como conflito
+            if row is None or detail.get("version", 0) != row["detail_version"] \
+                    or detail.get("events_applied", 0) != row["events_applied"]:
+                raise StaleDataError(trainer_login)
+            self.write_detail(conn, trainer_login, student_id, detail, self.read_detail(conn, trainer_login, student_id))
+            conn.execute("UPDATE students SET detail_version = ? WHERE trainer_login = ? AND student_id = ?",
+                         (row["detail_version"] + 1,) + key)
+        detail["version"] = row["detail_version"] + 1
+        return (detail["version"], row["events_applied"])
+
+    def write_detail(self, conn, trainer_login, student_id, detail, old):
+        key = (trainer_login, student_id)
+
+        # Histórico de peso: novas medições são apenas inseridas no final
+        old_history = old["weight_history"]
+        new_history = detail["weight_history"]
+        start = len(old_history["weights"])
+        if new_history["weights"][:start] != old_history["weights"] or new_history["dates"][:start] != old_history["dates"]:
+            conn.execute("DELETE FROM weight_history WHERE trainer_login = ? AND student_id = ?", key)
+            start = 0
+        conn.executemany(
+            "INSERT INTO weight_history (trainer_login, student_id, weight, date) VALUES (?, ?, ?, ?)",
+            [key + entry for entry in zip(new_history["weights"][start:], new_history["dates"][start:])],
+        )
+
+        # Treinos: se só as marcações mudaram, atualiza apenas os exercícios alterados
+        old_workouts = old["workouts"]
+        new_workouts = detail["workouts"]
+        if old_workouts == new_workouts:
+            return
+        same_shape = len(old_workouts) == len(new_workouts) and all(
+            {k: v for k, v in a.items() if k != "completed"} == {k: v for k, v in b.items() if k != "completed"}
+            for a, b in zip(old_workouts, new_workouts)
+        )
+        if same_shape:
+            workout_ids = [row["id"] for row in conn.execute(
+                "SELECT id FROM workouts WHERE trainer_login = ? AND student_id = ? ORDER BY position", key)]
+            for workout_id, a, b in zip(workout_ids, old_workouts, new_workouts):
+                for position, now in enumerate(b["completed"]):
+                    if position >= len(a["completed"]) or a["completed"][position] != now:
+                        conn.execute(
+                            "INSERT INTO exercises (workout_id, position, completed) VALUES (?, ?, ?) "
+                            "ON CONFLICT (workout_id, position) DO UPDATE SET completed = excluded.completed",
+                            (workout_id, position, int(now)),
+                        )
+            return
+        conn.execute("DELETE FROM workouts WHERE trainer_login = ? AND student_id = ?", key)
+        for position, workout in enumerate(new_workouts):
+            cursor = conn.execute(
+                "INSERT INTO workouts (trainer_login, student_id, position, uid, template_id, name, description, hidden) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (position, workout.get("id") or new_workout_id(), workout.get("template_id"), workout.get("name"),
+                       workout.get("description"), int(workout.get("hidden", False))),
+            )
+            completed = workout.get("completed", [])
+            # Treinos de modelo sem exercícios próprios guardam só as marcações (nome vazio)
+            exercises = workout.get("exercises", [None] * len(completed))
+            conn.executemany(
+                "INSERT INTO exercises (workout_id, position, name, completed) VALUES (?, ?, ?, ?)",
+                [(cursor.lastrowid, j, exercise, int(j < len(completed) and completed[j]))
+                 for j, exercise in enumerate(exercises)],
+            )
+
+    # Procura o (treinador, ID do aluno) de um login ou e-mail usando os índices do banco
+    # (um login ou e-mail repetido fica com o aluno cadastrado primeiro)
+    def lookup_student(self, field, value):
+        column = "login" if field == "login" else "email"
+        row = self.connect().execute(
+            f"SELECT trainer_login, student_id FROM students WHERE {column} = ? ORDER BY rowid LIMIT 1",
+            (value,)).fetchone()
+        return (row["trainer_login"], row["student_id"]) if row else (None, None)
+
+    def lookup_students(self, field, values):
+        column = "login" if field == "login" else "email"
+        values = list(values)
+        found = {}
+        # Em blocos, abaixo do limite de parâmetros do SQLite
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            rows = self.connect().execute(
+                f"SELECT {column} AS value, trainer_login, student_id FROM students "
+                f"WHERE {column} IN ({', '.join('?' * len(chunk))}) ORDER BY rowid DESC", chunk)
+            found.update({row["value"]: (row["trainer_login"], row["student_id"]) for row in rows})
+        return found
+
+    # Os índices do banco são mantidos pelo próprio SQLite
+    def refresh_student_index(self):
+        pass
+
+    def student_index_stale(self):
+        return False
+
+    # Versão do resumo de um treinador (ou dos detalhes de um aluno):
+    # (contador de gravações completas, contador de eventos aplicados)
+    def get_version(self, trainer_login, student_id=None):
+        if student_id is None:
+            row = self.connect().execute(
+                "SELECT version, events_applied FROM rosters WHERE trainer_login = ?", (trainer_login,)).fetchone()
+        else:
+            row = self.connect().execute(
+                "SELECT detail_version AS version, events_applied FROM students WHERE trainer_login = ? AND student_id = ?",
+                (trainer_login, student_id)).fetchone()
+        return (row["version"], row["events_applied"]) if row else (None, None)
+
+    def load_reports(self):
+        rows = self.connect().execute("SELECT * FROM trainer_reports")
+        return {row["trainer_login"]: {"version": [row["version"], row["events_applied"]], "report": json.loads(row["report"])}
+                for row in rows}
+
+    # Grava o relatório de um treinador, a menos que já exista um calculado sobre dados mais novos
+    def save_trainer_report(self, trainer_login, version, report):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO trainer_reports (trainer_login, version, events_applied, report) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (trainer_login) DO UPDATE SET version = excluded.version, "
+                "events_applied = excluded.events_applied, report = excluded.report "
+                "WHERE (excluded.version, excluded.events_applied) >= (trainer_reports.version, trainer_reports.events_applied)",
+                (trainer_login, version[0], version[1], json.dumps(report)),
+            )
+
+    # Modelos de treino e catálogo de exercícios do treinador (um documento JSON por treinador)
+    def load_templates(self, trainer_login):
+        row = self.connect().execute(
+            "SELECT version, library FROM template_libraries WHERE trainer_login = ?", (trainer_login,)).fetchone()
+        if row is None:
+            return new_template_library()
+        library = json.loads(row["library"])
+        library["version"] = row["version"]
+        return library
+
+    # Salva os modelos com a mesma verificação de versão do resumo
+    def save_templates(self, trainer_login, library):
+        with self.transaction() as conn:
+            row = conn.execute("SELECT version FROM template_libraries WHERE trainer_login = ?", (trainer_login,)).fetchone()
+            current = row["version"] if row else 0
+            if library.get("version", 0) != current:
+                raise StaleDataError(trainer_login)
+            conn.execute(
+                "INSERT INTO template_libraries (trainer_login, version, library) VALUES (?, ?, ?) "
+                "ON CONFLICT (trainer_login) DO UPDATE SET version = excluded.version, library = excluded.library",
+                (trainer_login, current + 1, json.dumps(library)),
+            )
+        library["version"] = current + 1
+        return library["version"]
+
+    def get_templates_version(self, trainer_login):
+        row = self.connect().execute(
+            "SELECT version FROM template_libraries WHERE trainer_login = ?", (trainer_login,)).fetchone()
+        return row["version"] if row else None
+
+    def replace_reports(self, reports):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM trainer_reports")
+            conn.executemany(
+                "INSERT INTO trainer_reports (trainer_login, version, events_applied, report) VALUES (?, ?, ?, ?)",
+                [(trainer_login, entry["version"][0], entry["version"][1], json.dumps(entry["report"]))
+                 for trainer_login, entry in reports.items()],
+            )
+
+    # Histórico de treinos: uma linha por sessão, com o mês para a leitura por período
+    def insert_session(self, conn, trainer_login, student_id, session):
+        conn.execute("INSERT INTO workout_sessions (trainer_login, student_id, period, session) VALUES (?, ?, ?, ?)",
+                     (trainer_login, student_id, history_period(session), json.dumps(session)))
+
+    def archive_session(self, trainer_login, student_id, session):
+        with self.transaction() as conn:
+            self.insert_session(conn, trainer_login, student_id, session)
+
+    def load_history_periods(self, trainer_login, student_id):
+        rows = self.connect().execute(
+            "SELECT DISTINCT period FROM workout_sessions WHERE trainer_login = ? AND student_id = ?",
+            (trainer_login, student_id))
+        return sort_history_periods(row["period"] for row in rows)
+
+    def load_history(self, trainer_login, student_id, period):
+        rows = self.connect().execute(
+            "SELECT session FROM workout_sessions WHERE trainer_login = ? AND student_id = ? AND period = ? ORDER BY id",
+            (trainer_login, student_id, period))
+        return [json.loads(row["session"]) for row in rows]
+
+    # No banco cada evento já é uma atualização de poucas linhas: é aplicado direto, sem diário.
+    # Retorna (antes, depois) dos contadores de eventos do treinador e do aluno,
+    # para o cache poder aplicar o evento em memória
+    def append_event(self, trainer_login, event):
+        return self.append_events(trainer_login, [event])
+
+    # Aplica vários eventos de um mesmo aluno numa única transação
+    def append_events(self, trainer_login, events):
+        key = (trainer_login, events[0]["student_id"])
+        with self.transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO rosters (trainer_login) VALUES (?)", (trainer_login,))
+            roster = conn.execute("SELECT events_applied FROM rosters WHERE trainer_login = ?", (trainer_login,)).fetchone()
+            student = conn.execute(
+                "SELECT events_applied FROM students WHERE trainer_login = ? AND student_id = ?", key).fetchone()
+            for event in events:
+                if event["type"] == "weight_recorded":
+                    if event.get("latest", True):
+                        conn.execute("UPDATE students SET weight = ? WHERE trainer_login = ? AND student_id = ?",
+                                     (event["weight"],) + key)
+                    conn.execute("INSERT INTO weight_history (trainer_login, student_id, weight, date) VALUES (?, ?, ?, ?)",
+                                 key + (event["weight"], event["date"]))
+                elif event["type"] == "exercise_toggled":
+                    conn.execute(
+                        "INSERT INTO exercises (workout_id, position, completed) "
+                        "SELECT id, ?, ? FROM workouts WHERE trainer_login = ? AND student_id = ? AND uid = ? "
+                        "ON CONFLICT (workout_id, position) DO UPDATE SET completed = excluded.completed",
+                        (event["exercise"], int(event["completed"])) + key + (event["workout_id"],),
+                    )
+                elif event["type"] == "workout_finished":
+                    if "session" in event:
+                        self.insert_session(conn, trainer_login, event["student_id"], event["session"])
+                    if event["action"] == "hide":
+                        conn.execute("UPDATE workouts SET hidden = 1 WHERE trainer_login = ? AND student_id = ? AND uid = ?",
+                                     key + (event["workout_id"],))
+                    else:
+                        conn.execute("DELETE FROM workouts WHERE trainer_login = ? AND student_id = ? AND uid = ?",
+                                     key + (event["workout_id"],))
+                    conn.execute("UPDATE students SET completed_workouts = completed_workouts + 1 "
+                                 "WHERE trainer_login = ? AND student_id = ?", key)
+            conn.execute("UPDATE rosters SET events_applied = events_applied + ? WHERE trainer_login = ?",
+                         (len(events), trainer_login))
+            conn.execute("UPDATE students SET events_applied = events_applied + ? "
+                         "WHERE trainer_login = ? AND student_id = ?", (len(events),) + key)
+        student_before = student["events_applied"] if student else None
+        student_after = student_before + len(events) if student else None
+        return (roster["events_applied"], student_before), (roster["events_applied"] + len(events), student_after)
+
+# Serviço de dados: um único processo é dono do armazenamento e vários processos (ou máquinas)
+# do Streamlit o acessam por HTTP, com as chamadas agrupadas em lotes. No localhost:
+#   PLANOT_STORAGE=sqlite python PlanoT.py serve-data
+#   PLANOT_STORAGE=remote streamlit run PlanoT.py --server.port 8501   (um por porta)
+# O serviço usa o armazenamento de PLANOT_STORAGE ("json" ou "sqlite") e também pode atender a
+# sincronização dos alunos (veja sync_student) num endereço separado.
+# PLANOT_DATA_URL: endereço do serviço ("http://host:porta" ou "unix:///caminho/do/socket")
+# PLANOT_DATA_TOKEN: segredo compartilhado exigido em cada chamada (obrigatório fora do localhost)
+# PLANOT_SYNC_URL: endereço que atende só a sincronização dos alunos (sem ele, a sincronização fica
+#                  desligada); pode ser público, pois não dá acesso às chamadas ao armazenamento
+DATA_SERVICE_URL = os.environ.get("PLANOT_DATA_URL", "http://127.0.0.1:8765")
+DATA_SERVICE_TOKEN = os.environ.get("PLANOT_DATA_TOKEN")
+SYNC_SERVICE_URL = os.environ.get("PLANOT_SYNC_URL")
+# Threads do serviço que executam as chamadas e conexões mantidas abertas por cada cliente
+DATA_SERVICE_WORKERS = int(os.environ.get("PLANOT_DATA_WORKERS", "16"))
+DATA_POOL_SIZE = int(os.environ.get("PLANOT_DATA_POOL_SIZE", "8"))
+DATA_SERVICE_TIMEOUT = 30
+# Maior corpo de requisição aceito (bytes): as chamadas ao armazenamento levam listas de alunos
+# inteiras; a sincronização, que pode ser pública, só lotes pequenos de alterações
+DATA_MAX_BODY = int(os.environ.get("PLANOT_DATA_MAX_BODY", str(64 * 1024 * 1024)))
+SYNC_MAX_BODY = 1024 * 1024
+
+# Métodos do armazenamento que o serviço aceita
+REMOTE_METHODS = frozenset([
+    "load_trainers", "save_trainers", "add_trainer", "set_trainer_password", "get_trainers_version",
+    "load_trainer_students", "save_trainer_students", "load_student_detail", "load_student_details",
+    "save_student_detail", "append_event", "append_events", "get_version", "lookup_student",
+    "lookup_students", "refresh_student_index", "student_index_stale", "load_templates", "save_templates",
+    "get_templates_version", "load_history_periods", "load_history", "archive_session", "load_reports",
+    "save_trainer_report", "replace_reports",
+])
+# Métodos que gravam a nova "version" no argumento recebido (posição do argumento);
+# o serviço devolve essa versão para o cliente atualizar o seu objeto
+VERSIONED_ARGUMENTS = {"save_trainer_students": 1, "save_student_detail": 2, "save_templates": 1}
+# Métodos que retornam versões: o JSON transforma tuplas em listas e o cache compara tuplas
+VERSION_METHODS = frozenset([
+    "get_version", "get_templates_version", "get_trainers_version", "append_event", "append_events",
+    "save_trainer_students", "save_student_detail", "save_templates",
+])
+# Erros repassados do serviço para quem chamou
+REMOTE_ERRORS = {"StaleDataError": StaleDataError, "ValueError": ValueError}
+
+# Função para separar o endereço do serviço: ("tcp", host, porta) ou ("unix", caminho)
+def parse_data_address(url):
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme == "unix":
+        return ("unix", parsed.path)
+    return ("tcp", parsed.hostname or "127.0.0.1", parsed.port or 8765)
+
+# Função para saber se o endereço só aceita conexões da própria máquina (socket Unix ou localhost)
+def is_loopback_address(address):
+    if address[0] == "unix" or address[1] == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(address[1]).is_loopback
+    except ValueError:
+        return False  # Nome de máquina: pode apontar para qualquer interface
+
+# Função para converter listas (vindas do JSON) de volta em tuplas
+def as_version(value):
+    return tuple(as_version(item) for item in value) if isinstance(value, list) else value
+
+# Conexão HTTP por um socket Unix
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+# Armazenamento remoto: repassa cada chamada ao serviço de dados, por um conjunto de conexões
+# HTTP mantidas abertas (no máximo pool_size chamadas simultâneas por processo)
+class RemoteStorage:
+    def __init__(self, url, pool_size=DATA_POOL_SIZE, token=DATA_SERVICE_TOKEN):
+        self.address = parse_data_address(url)
+        self.token = token
+        self.idle = []
+        self.idle_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(pool_size)
+
+    def new_connection(self):
+        if self.address[0] == "unix":
+            return UnixHTTPConnection(self.address[1], DATA_SERVICE_TIMEOUT)
+        return http.client.HTTPConnection(self.address[1], self.address[2], timeout=DATA_SERVICE_TIMEOUT)
+
+    def post(self, body):
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        with self.slots:
+            with self.idle_lock:
+                conn = self.idle.pop() if self.idle else None
+            # Uma conexão reaproveitada pode ter sido fechada pelo serviço: tenta de novo com uma nova
+            for reused in (conn is not None, False):
+                if not reused:
+                    conn = self.new_connection()
+                try:
+                    conn.request("POST", "/rpc", body, headers)
+                    response = conn.getresponse()
+                    raw = response.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionError) as error:
+                    conn.close()
+                    if not reused:
+                        raise ConnectionError(f"Serviço de dados indisponível: {error}") from error
+                except BaseException:
+                    conn.close()
+                    raise
+            with self.idle_lock:
+                self.idle.append(conn)
+        get_metrics().count_io(read=len(raw), written=len(body))
+        if response.status != 200:
+            raise RuntimeError(f"Serviço de dados respondeu {response.status}: {raw[:200]!r}")
+        return json.loads(raw)
+
+    # Executa várias chamadas numa única requisição (na ordem); levanta o primeiro erro
+    def call_many(self, calls):
+        with get_metrics().timed("remote_call"):
+            results = self.post(json.dumps({"calls": [{"method": method, "args": list(args)}
+                                                      for method, args in calls]}).encode())["results"]
+        for (method, args), result in zip(calls, results):
+            if "error" in result:
+                raise REMOTE_ERRORS.get(result["error"], RuntimeError)(result["message"])
+            if method in VERSIONED_ARGUMENTS:
+                args[VERSIONED_ARGUMENTS[method]]["version"] = result["version"]
+            if method in VERSION_METHODS:
+                result["result"] = as_version(result["result"])
+        return [result["result"] for result in results]
+
+    def call(self, method, *args):
+        return self.call_many([(method, args)])[0]
+
+    def __getattr__(self, method):
+        if method not in REMOTE_METHODS:
+            raise AttributeError(method)
+        return functools.partial(self.call, method)
+
+# Serviço de dados (asyncio): recebe POST /rpc com {"calls": [{"method", "args"}, ...]} e responde
+# {"results": [{"result"} ou {"error", "message"}, ...]}. No endereço da sincronização recebe só
+# POST /sync/login e POST /sync. As chamadas ao armazenamento (que usam arquivos, travas e o
+# SQLite) rodam num conjunto de threads, fora do laço de eventos
+class DataService:
+    def __init__(self, storage, workers=DATA_SERVICE_WORKERS, token=DATA_SERVICE_TOKEN):
+        self.storage = storage
+        self.token = token
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="data")
+        self.login_throttle = LoginThrottle()
+
+    def call(self, method, args):
+        if method not in REMOTE_METHODS:
+            raise ValueError(f"Método desconhecido: {method}")
+        with get_metrics().timed(f"service_{method}"):
+            result = getattr(self.storage, method)(*args)
+        response = {"result": result}
+        if method in VERSIONED_ARGUMENTS:
+            response["version"] = args[VERSIONED_ARGUMENTS[method]].get("version")
+        return response
+
+    def call_many(self, calls):
+        results = []
+        for call in calls:
+            try:
+                results.append(self.call(call["method"], call.get("args", [])))
+            except (StaleDataError, ValueError) as error:
+                results.append({"error": type(error).__name__, "message": str(error)})
+            except Exception as error:
+                results.append({"error": "ServerError", "message": f"{type(error).__name__}: {error}"})
+        return results
+
+    # "sync" indica o endereço da sincronização; "client" é o IP de quem chamou (None no socket Unix)
+    async def respond(self, method, path, headers, body, sync=False, client=None):
+        if method == "GET" and path == "/health":
+            return "200 OK", {"status": "ok"}
+        # A sincronização dos alunos tem a sua própria autenticação (login e senha do aluno)
+        if sync:
+            if method != "POST" or path not in SYNC_ROUTES:
+                return "404 Not Found", {"error": "not found"}
+            return await self.respond_sync(path, body, client)
+        if method != "POST" or path != "/rpc":
+            return "404 Not Found", {"error": "not found"}
+        if self.token and not hmac.compare_digest(headers.get("authorization", "").encode(), f"Bearer {self.token}".encode()):
+            return "401 Unauthorized", {"error": "unauthorized"}
+        try:
+            calls = json.loads(body)["calls"]
+            if not isinstance(calls, list):
+                raise ValueError("calls")
+        except (ValueError, KeyError, TypeError):
+            return "400 Bad Request", {"error": "Requisição inválida"}
+        results = await asyncio.get_running_loop().run_in_executor(self.executor, self.call_many, calls)
+        return "200 OK", {"results": results}
+
+    async def respond_sync(self, path, body, client):
+        try:
+            request = json.loads(body)
+            if not isinstance(request, dict):
+                raise ValueError("Requisição inválida")
+            # Logins com muitas senhas erradas (por aluno e por IP) esperam antes de tentar de novo
+            keys = [("login", str(request.get("login", "")))] + ([("client", client)] if client else [])
+            if path == "/sync/login" and (wait := self.login_throttle.wait(keys)):
+                return "429 Too Many Requests", {"error": "too many attempts", "retry_after": math.ceil(wait)}
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, SYNC_ROUTES[path], request)
+        except ValueError as error:
+            return "400 Bad Request", {"error": str(error)}
+        if path == "/sync/login" and result is None:
+            self.login_throttle.failed(keys)
+        elif path == "/sync/login":
+            self.login_throttle.succeeded(keys[0])  # As falhas do IP continuam contando
+        if result is None:
+            return "401 Unauthorized", {"error": "unauthorized"}
+        return "200 OK", result
+
+    # Lê a linha da requisição e os cabeçalhos; None se o cliente fechou a conexão
+    async def read_head(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method, path, headers
+
+    # Uma conexão pode fazer várias requisições seguidas (keep-alive). Cada leitura tem prazo
+    # (conexões paradas são fechadas) e corpos maiores que o limite são recusados sem ser lidos
+    async def handle(self, reader, writer, sync=False):
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if isinstance(peer, tuple) else None
+        max_body = SYNC_MAX_BODY if sync else DATA_MAX_BODY
+        try:
+            while head := await asyncio.wait_for(self.read_head(reader), DATA_SERVICE_TIMEOUT):
+                method, path, headers = head
+                length = int(headers.get("content-length", "0"))
+                if not 0 <= length <= max_body:
+                    status, payload, close = "413 Content Too Large", {"error": "request too large"}, True
+                else:
+                    body = await asyncio.wait_for(reader.readexactly(length), DATA_SERVICE_TIMEOUT)
+                    status, payload = await self.respond(method, path, headers, body, sync, client)
+                    close = headers.get("connection", "").lower() == "close"
+                raw = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(raw)}\r\n\r\n".encode() + raw)
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+            pass  # Cliente desconectou, ficou parado ou enviou uma requisição inválida
+        finally:
+            writer.close()
+
+    async def listen(self, url, sync=False):
+        handle = functools.partial(self.handle, sync=sync)
+        address = parse_data_address(url)
+        if address[0] == "unix":
+            return await asyncio.start_unix_server(handle, address[1])
+        return await asyncio.start_server(handle, address[1], address[2])
+
+    async def serve(self, url, sync_url=None):
+        servers = [await self.listen(url)]
+        if sync_url:
+            servers.append(await self.listen(sync_url, sync=True))
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+
+# Função para executar o serviço de dados até ser interrompido (python PlanoT.py serve-data)
+def serve_data(url=DATA_SERVICE_URL, sync_url=SYNC_SERVICE_URL):
+    if STORAGE_BACKEND == "remote":
+        raise ValueError("O serviço de dados precisa de PLANOT_STORAGE=json ou sqlite")
+    if not DATA_SERVICE_TOKEN and not is_loopback_address(parse_data_address(url)):
+        raise ValueError("❌ Defina PLANOT_DATA_TOKEN para o serviço de dados escutar fora do localhost")
+    if sync_url and parse_data_address(sync_url) == parse_data_address(url):
+        raise ValueError("❌ PLANOT_SYNC_URL precisa ser diferente de PLANOT_DATA_URL")
+    try:
+        asyncio.run(DataService(get_storage()).serve(url, sync_url))
+    except KeyboardInterrupt:
+        pass
+
+# Função para obter o armazenamento configurado (compartilhado entre as sessões)
+@st.cache_resource
+def get_storage():
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage(SQLITE_DB_FILE)
+    if STORAGE_BACKEND == "remote":
+        return RemoteStorage(DATA_SERVICE_URL)
+    return JSONStorage()
+
+# Quantidade de alunos cujos detalhes são lidos por chamada nas leituras em lote
+DETAIL_BATCH_SIZE = 64
+
+# Função para percorrer os detalhes de muitos alunos, lidos em lotes: (ID do aluno, detalhes)
+def iter_student_details(storage, trainer_login, student_ids, batch_size=DETAIL_BATCH_SIZE):
+    student_ids = iter(student_ids)
+    while batch := list(itertools.islice(student_ids, batch_size)):
+        yield from storage.load_student_details(trainer_login, batch).items()
+
+# Função para migrar de uma vez os arquivos JSON existentes para o banco SQLite
+def migrate_json_to_sqlite(db_path=SQLITE_DB_FILE):
+    source = JSONStorage()
+    target = SQLiteStorage(db_path)
+    trainers = source.load_trainers()
+    target.save_trainers(trainers)
+    for trainer_login in trainers:
+        data = source.load_trainer_students(trainer_login)
+        # As versões de controle de concorrência recomeçam a partir das que estão no banco
+        data["version"], data["events_applied"] = target.get_version(trainer_login)
+        data["version"] = data["version"] or 0
+        data["events_applied"] = data["events_applied"] or 0
+        target.save_trainer_students(trainer_login, data)
+        for student_id in data["students"]:
+            detail = source.load_student_detail(trainer_login, student_id)
+            detail["version"], detail["events_applied"] = target.get_version(trainer_login, student_id)
+            target.save_student_detail(trainer_login, student_id, detail)
+            # O histórico só é copiado uma vez (rodar a migração de novo não duplica as sessões)
+            if not target.load_history_periods(trainer_login, student_id):
+                for period in source.load_history_periods(trainer_login, student_id):
+                    for session in source.load_history(trainer_login, student_id, period):
+                        target.archive_session(trainer_login, student_id, session)
+        library = source.load_templates(trainer_login)
+        library["version"] = target.load_templates(trainer_login)["version"]
+        target.save_templates(trainer_login, library)
+    return len(trainers)
+
+# Função para migrar de uma vez os arquivos JSON de todos os treinadores para o formato atual
+def migrate_all_trainer_files():
+    storage = JSONStorage()
+    migrated = 0
+    for trainer_login in storage.load_trainers():
+        filename = f"{trainer_login}_students.json"
+        if os.path.exists(filename) and storage.read_json(filename, {}).get("schema_version", 0) < SCHEMA_VERSION:
+            with storage.lock(f"{trainer_login}_students"):
+                storage.read_snapshot_locked(trainer_login)
+            migrated += 1
+    return migrated
 
 # Função para carregar os dados dos treinadores
 def load_trainers():
-    if os.path.exists("trainers.json"):
-        with open("trainers.json", "r") as f:
-            return json.load(f)
-    else:
-        return {}
+    return get_storage().load_trainers()
 
 # Função para salvar os dados dos treinadores
 def save_trainers(trainers):
-    with open("trainers.json", "w") as f:
-        json.dump(trainers, f)
+    get_storage().save_trainers(trainers)
+
+# Função para registrar um novo treinador (retorna False se o login já existir)
+def register_trainer(login, info):
+    return get_storage().add_trainer(login, info)
+
+# Quantidade máxima de treinadores (resumos) e de alunos (detalhes) mantidos no cache compartilhado
+CACHE_MAX_TRAINERS = int(os.environ.get("PLANOT_CACHE_MAX_TRAINERS", "64"))
+CACHE_MAX_DETAILS = int(os.environ.get("PLANOT_CACHE_MAX_DETAILS", "512"))
+
+# Funções para copiar os dados guardados no cache. Só as partes que a aplicação altera
+# (dicionários dos alunos, listas de treinos, marcações e pesos) são copiadas; o resto,
+# que nunca é alterado no lugar, é compartilhado. Bem mais barato que copy.deepcopy
+def copy_trainer_students(data):
+    copied = dict(data)
+    copied["students"] = {student_id: dict(student_info) for student_id, student_info in data["students"].items()}
+    return copied
+
+def copy_student_detail(detail):
+    copied = dict(detail)
+    copied["workouts"] = [{field: list(value) if isinstance(value, list) else value for field, value in workout.items()}
+                          for workout in detail["workouts"]]
+    copied["weight_history"] = {column: list(values) for column, values in detail["weight_history"].items()}
+    if "weight_stats" in detail:
+        copied["weight_stats"] = dict(detail["weight_stats"])
+    return copied
+
+def copy_template_library(library):
+    copied = dict(library)
+    copied["exercises"] = dict(library["exercises"])
+    copied["templates"] = {template_id: dict(template, exercises=list(template["exercises"]))
+                           for template_id, template in library["templates"].items()}
+    return copied
+
+# Cache dos dados dos treinadores compartilhado por todas as sessões do processo.
+# Guarda os resumos das listas de alunos e os detalhes dos alunos abertos recentemente.
+# Cada entrada guarda a versão do armazenamento (mtime do arquivo ou contador do banco)
+# de quando foi lida; se a versão mudar, os dados são relidos. As entradas menos
+# usadas recentemente são descartadas quando o limite é atingido (LRU).
+# Os objetos do cache nunca saem dele nem são alterados: cada leitura recebe uma cópia que a
+# sessão pode alterar à vontade, e uma gravação bem-sucedida troca a entrada por uma cópia do
+# que foi gravado. Assim nenhuma sessão vê (nem grava) alterações pela metade de outra.
+class StudentCache:
+    COPIES = {"summary": copy_trainer_students, "detail": copy_student_detail, "templates": copy_template_library}
+
+    def __init__(self, storage, max_trainers, max_details):
+        self.storage = storage
+        self.limits = {"summary": max_trainers, "detail": max_details, "templates": max_trainers}
+        self.entries = {kind: OrderedDict() for kind in self.limits}
+        self.lock = threading.Lock()
+
+    def lookup(self, kind, key, version, load):
+        with self.lock:
+            entry = self.entries[kind].get(key)
+            if entry is not None and entry[0] == version:
+                self.entries[kind].move_to_end(key)
+                value = entry[1]
+            else:
+                value = None
+        if value is not None:
+            return self.COPIES[kind](value)
+        # Lê fora da trava para não bloquear as outras sessões durante o parse
+        with get_metrics().timed(f"storage_load_{kind}"):
+            value = load()
+        self.put(kind, key, version, self.COPIES[kind](value))
+        return value
+
+    def get(self, trainer_login):
+        return self.lookup("summary", trainer_login, self.storage.get_version(trainer_login),
+                           lambda: self.storage.load_trainer_students(trainer_login))
+
+    def get_detail(self, trainer_login, student_id):
+        return self.lookup("detail", (trainer_login, student_id), self.storage.get_version(trainer_login, student_id),
+                           lambda: self.storage.load_student_detail(trainer_login, student_id))
+
+    def get_templates(self, trainer_login):
+        return self.lookup("templates", trainer_login, self.storage.get_templates_version(trainer_login),
+                           lambda: self.storage.load_templates(trainer_login))
+
+    def put(self, kind, key, version, value):
+        with self.lock:
+            entries = self.entries[kind]
+            entries[key] = (version, value)
+            entries.move_to_end(key)
+            while len(entries) > self.limits[kind]:
+                entries.popitem(last=False)
 
-# Função para carregar os dados dos alunos de um treinador
+    def invalidate(self, kind, key):
+        with self.lock:
+            self.entries[kind].pop(key, None)
+
+    def save(self, trainer_login, data, details=None):
+        try:
+            version = self.storage.save_trainer_students(trainer_login, data, details)
+        except StaleDataError:
+            # Os dados em cache estão desatualizados: a próxima leitura busca a versão nova
+            self.invalidate("summary", trainer_login)
+            raise
+        self.put("summary", trainer_login, version, copy_trainer_students(data))
+        for student_id in details or {}:
+            self.invalidate("detail", (trainer_login, student_id))
+
+    def save_detail(self, trainer_login, student_id, detail):
+        key = (trainer_login, student_id)
+        try:
+            version = self.storage.save_student_detail(trainer_login, student_id, detail)
+        except StaleDataError:
+            self.invalidate("detail", key)
+            raise
+        self.put("detail", key, version, copy_student_detail(detail))
+
+    def save_templates(self, trainer_login, library):
+        try:
+            version = self.storage.save_templates(trainer_login, library)
+        except StaleDataError:
+            self.invalidate("templates", trainer_login)
+            raise
+        self.put("templates", trainer_login, version, copy_template_library(library))
+
+    # Registra um evento no armazenamento e o aplica aos dados da sessão (resumo e, se
+    # carregados, detalhes do aluno). Se nada mais mudou desde que as entradas do cache foram
+    # lidas, elas são trocadas por cópias com o evento aplicado e continuam válidas.
+    def record(self, trainer_login, data, detail, event):
+        self.record_many(trainer_login, data, detail, [event])
+
+    # Mesmo que record, para vários eventos de um mesmo aluno (uma única gravação)
+    def record_many(self, trainer_login, data, detail, events):
+        before, after = self.storage.append_events(trainer_login, events)
+        for event in events:
+            apply_event(data, event)
+            if detail is not None:
+                apply_detail_event(detail, event)
+        targets = (("summary", trainer_login, apply_event),
+                   ("detail", (trainer_login, events[0]["student_id"]), apply_detail_event))
+        for position, (kind, key, apply) in enumerate(targets):
+            with self.lock:
+                entry = self.entries[kind].get(key)
+            if entry is None or entry[0][1] != before[position]:
+                self.invalidate(kind, key)
+                continue
+            value = self.COPIES[kind](entry[1])
+            for event in events:
+                apply(value, event)
+            with self.lock:
+                # Outra sessão pode ter trocado a entrada enquanto a cópia era feita
+                if self.entries[kind].get(key) is entry:
+                    self.entries[kind][key] = ((entry[0][0], after[position]), value)
+                else:
+                    self.entries[kind].pop(key, None)
+
+# Função para obter o cache compartilhado dos dados dos treinadores
+@st.cache_resource
+def get_student_cache():
+    return StudentCache(get_storage(), CACHE_MAX_TRAINERS, CACHE_MAX_DETAILS)
+
+# Função para carregar os dados dos alunos de um treinador (resumo da lista de alunos)
+@instrumented("load_trainer_students")
 def load_trainer_students(trainer_login):
-    filename = f"{trainer_login}_students.json"
-    if os.path.exists(filename):
-        with open(filename, "r") as f:
-            data = json.load(f)
-            # Garantir que o campo "last_id" exista
-            if "last_id" not in data:
-                data["last_id"] = 0
-            if "students" not in data:
-                data["students"] = {}
-            
-            # Garantir que todos os alunos tenham os campos necessários
-            for student_id, student_info in data["students"].items():
-                if "password" not in student_info:
-                    student_info["password"] = None  # Inicializa a senha como None se não existir
-                if "completed_workouts" not in student_info:
-                    student_info["completed_workouts"] = 0  # Contador de treinos realizados
-                if "weight_history" not in student_info:
-                    student_info["weight_history"] = []  # Histórico de peso
-                if "login" not in student_info:
-                    # Gera um login padrão se não existir
-                    student_info["login"] = f"{student_info['name'].split()[0].lower()}_{student_id}"
-                if "email" not in student_info:
-                    student_info["email"] = ""  # Inicializa o e-mail como vazio se não existir
-                for workout in student_info.get("workouts", []):
-                    if "completed" not in workout:
-                        workout["completed"] = [False] * len(workout.get("exercises", []))
-            
-            return data
+    return get_student_cache().get(trainer_login)
+
+# Função para carregar os detalhes de um aluno (treinos e histórico de peso)
+@instrumented("load_student_detail")
+def load_student_detail(trainer_login, student_id):
+    return get_student_cache().get_detail(trainer_login, student_id)
+
+# Função para salvar os dados dos alunos de um treinador (e os detalhes de alunos novos, se houver)
+# Levanta StaleDataError se outra sessão salvou alterações depois que os dados foram lidos
+@instrumented("save_trainer_students")
+def save_trainer_students(trainer_login, data, details=None):
+    get_student_cache().save(trainer_login, data, details)
+    update_trainer_report(trainer_login, data)
+
+# Função para salvar os detalhes de um aluno (mesma verificação de conflito do resumo)
+@instrumented("save_student_detail")
+def save_student_detail(trainer_login, student_id, detail):
+    get_student_cache().save_detail(trainer_login, student_id, detail)
+
+# Função para carregar os modelos de treino e o catálogo de exercícios de um treinador
+def load_templates(trainer_login):
+    return get_student_cache().get_templates(trainer_login)
+
+# Função para salvar os modelos de treino (mesma verificação de conflito do resumo)
+def save_templates(trainer_login, library):
+    get_student_cache().save_templates(trainer_login, library)
+
+# Funções para ler o histórico de treinos de um aluno (fora do cache: só é lido quando aberto)
+@instrumented("load_history_periods")
+def load_history_periods(trainer_login, student_id):
+    return get_storage().load_history_periods(trainer_login, student_id)
+
+@instrumented("load_history")
+def load_history(trainer_login, student_id, period):
+    return get_storage().load_history(trainer_login, student_id, period)
+
+# Função para registrar uma alteração pequena (exercício marcado, treino finalizado,
+# peso registrado) no diário de eventos, sem regravar todos os dados do treinador.
+# "detail" são os detalhes do aluno já carregados pela sessão (ou None).
+@instrumented("record_event")
+def record_event(trainer_login, data, detail, event):
+    get_student_cache().record(trainer_login, data, detail, event)
+    # Marcar exercícios não altera os relatórios; treinos finalizados e pesos sim
+    if event["type"] in ("workout_finished", "weight_recorded"):
+        update_trainer_report(trainer_login, data)
+
+# Função para registrar vários eventos de um mesmo aluno de uma vez (uma única gravação no diário)
+@instrumented("record_events")
+def record_events(trainer_login, data, detail, events):
+    get_student_cache().record_many(trainer_login, data, detail, events)
+    if any(event["type"] in ("workout_finished", "weight_recorded") for event in events):
+        update_trainer_report(trainer_login, data)
+
+# Faixas de treinos realizados usadas na distribuição dos relatórios: (mínimo, rótulo)
+COMPLETED_WORKOUT_BUCKETS = ((0, "0"), (1, "1-4"), (5, "5-9"), (10, "10-19"), (20, "20+"))
+
+# Função para criar um relatório vazio (de um treinador ou do total)
+def new_report():
+    return {
+        "students": 0,
+        "active_students": 0,  # Alunos com ao menos um treino realizado
+        "completed_workouts": 0,
+        "completed_distribution": {label: 0 for _, label in COMPLETED_WORKOUT_BUCKETS},
+        "weight_tracked": 0,  # Alunos com peso inicial e atual informados
+        "weight_change": 0.0,  # Soma de (peso atual - peso inicial)
+        "gained": 0,
+        "lost": 0,
+    }
+
+# Função para montar o relatório de um treinador a partir do resumo da lista de alunos
+def build_trainer_report(data):
+    report = new_report()
+    for student_info in data["students"].values():
+        completed = student_info.get("completed_workouts", 0)
+        report["students"] += 1
+        report["active_students"] += completed > 0
+        report["completed_workouts"] += completed
+        label = [label for minimum, label in COMPLETED_WORKOUT_BUCKETS if completed >= minimum][-1]
+        report["completed_distribution"][label] += 1
+        initial, current = student_info.get("initial_weight"), student_info.get("weight")
+        if initial and current:
+            report["weight_tracked"] += 1
+            report["weight_change"] += current - initial
+            report["gained"] += current > initial
+            report["lost"] += current < initial
+    return report
+
+# Função para somar relatórios (total de todos os treinadores)
+def combine_reports(reports):
+    total = new_report()
+    for report in reports:
+        for field, value in report.items():
+            if isinstance(value, dict):
+                for label, count in value.items():
+                    total[field][label] = total[field].get(label, 0) + count
+            else:
+                total[field] += value
+    return total
+
+# Função para atualizar o relatório pré-calculado de um treinador depois de uma alteração
+def update_trainer_report(trainer_login, data):
+    version = (data.get("version", 0), data.get("events_applied", 0))
+    get_storage().save_trainer_report(trainer_login, version, build_trainer_report(data))
+
+# Função executada em cada processo da reconstrução dos relatórios (abre o seu próprio armazenamento)
+def build_trainer_report_job(trainer_login):
+    data = get_storage().load_trainer_students(trainer_login)
+    return trainer_login, [data.get("version", 0), data.get("events_applied", 0)], build_trainer_report(data)
+
+# Função para recalcular do zero os relatórios de todos os treinadores, em paralelo (um processo por núcleo)
+# Os processos são iniciados com "spawn": com "fork" herdariam as conexões SQLite e as travas já abertas aqui
+def rebuild_reports(workers=None):
+    trainers = list(get_storage().load_trainers())
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = list(pool.map(build_trainer_report_job, trainers, chunksize=max(1, len(trainers) // 64)))
+    get_storage().replace_reports({trainer_login: {"version": version, "report": report}
+                                   for trainer_login, version, report in results})
+    return len(results)
+
+# Funções para salvar a partir da interface: em caso de conflito avisam o usuário
+# e interrompem a execução da página (nada do que vem depois do salvamento é executado)
+def commit_trainer_students(trainer_login, data, details=None):
+    try:
+        save_trainer_students(trainer_login, data, details)
+    except StaleDataError:
+        st.error("❌ Os dados foram alterados em outra sessão. Atualize a página e repita a operação.")
+        st.stop()
+
+def commit_student_detail(trainer_login, student_id, detail):
+    try:
+        save_student_detail(trainer_login, student_id, detail)
+    except StaleDataError:
+        st.error("❌ Os dados foram alterados em outra sessão. Atualize a página e repita a operação.")
+        st.stop()
+
+def commit_templates(trainer_login, library):
+    try:
+        save_templates(trainer_login, library)
+    except StaleDataError:
+        st.error("❌ Os dados foram alterados em outra sessão. Atualize a página e repita a operação.")
+        st.stop()
+
+# Função para transformar em modelos os treinos iguais (mesmo nome, descrição e exercícios)
+# copiados em mais de um aluno: cada aluno passa a guardar só a referência e as marcações.
+# Retorna a quantidade de treinos convertidos
+def extract_templates(trainer_login):
+    storage = get_storage()
+    students = list(load_trainer_students(trainer_login)["students"])
+
+    def routine(workout):
+        return (workout["name"], workout["description"], tuple(workout["exercises"]))
+
+    # Primeira passagem: conta as cópias de cada treino, lendo os alunos em lotes
+    copies = {}
+    for _, detail in iter_student_details(storage, trainer_login, students):
+        for workout in detail["workouts"]:
+            if "template_id" not in workout:
+                copies[routine(workout)] = copies.get(routine(workout), 0) + 1
+    library = load_templates(trainer_login)
+    template_ids = {}
+    for (name, description, exercises), count in copies.items():
+        if count > 1:
+            template_ids[(name, description, exercises)] = save_template(library, name, description, list(exercises))
+    if not template_ids:
+        return 0
+    save_templates(trainer_login, library)
+
+    # Segunda passagem: troca as cópias pela referência ao modelo
+    converted = 0
+    for student_id in students:
+        detail = load_student_detail(trainer_login, student_id)
+        changed = False
+        for i, workout in enumerate(detail["workouts"]):
+            template_id = template_ids.get(routine(workout)) if "template_id" not in workout else None
+            if template_id is None:
+                continue
+            reference = {"id": workout["id"], "template_id": template_id, "completed": workout["completed"]}
+            if workout.get("hidden"):
+                reference["hidden"] = True
+            detail["workouts"][i] = reference
+            changed = True
+            converted += 1
+        if changed:
+            save_student_detail(trainer_login, student_id, detail)
+    return converted
+
+# Função para encontrar um aluno pelo login ou e-mail
+# Retorna (treinador, ID do aluno, dados do treinador) ou (None, None, None)
+@instrumented("find_student")
+def find_student(field, value):
+    if not value:
+        return None, None, None
+    storage = get_storage()
+    for attempt in range(2):
+        trainer_login, student_id = storage.lookup_student(field, value)
+        if trainer_login is None:
+            # Fora do índice: reconstrói e procura de novo só se alguma lista de alunos foi
+            # gravada depois do índice (o aluno pode ter sido cadastrado por outro processo)
+            if attempt or not storage.student_index_stale():
+                break
+        else:
+            data = load_trainer_students(trainer_login)
+            student_info = data["students"].get(student_id)
+            if student_info and student_info.get(field) == value:
+                return trainer_login, student_id, data
+        storage.refresh_student_index()
+    return None, None, None
+
+# Autenticação: as senhas são guardadas como hash com sal ("algoritmo$parâmetros$sal$hash").
+# PLANOT_PASSWORD_KDF escolhe o algoritmo das novas senhas ("scrypt" ou "pbkdf2") e
+# PLANOT_SCRYPT_N / PLANOT_PBKDF2_ITERATIONS o custo; hashes com outros parâmetros (e senhas
+# antigas em texto puro) são regravados no formato atual no próximo login bem-sucedido.
+PASSWORD_KDF = os.environ.get("PLANOT_PASSWORD_KDF", "scrypt")
+SCRYPT_N = int(os.environ.get("PLANOT_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = int(os.environ.get("PLANOT_PBKDF2_ITERATIONS", "600000"))
+# Threads que calculam os hashes (o cálculo libera o GIL: as outras sessões continuam rodando)
+AUTH_WORKERS = int(os.environ.get("PLANOT_AUTH_WORKERS", "2"))
+# Quantidade de credenciais mantidas no cache de cada processo
+AUTH_CACHE_SIZE = 256
+
+# Função para calcular o hash de uma senha com os parâmetros atuais
+def hash_password(password, salt=None):
+    salt = salt or os.urandom(16)
+    if PASSWORD_KDF == "pbkdf2":
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${digest.hex()}"
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P,
+                            maxmem=256 * SCRYPT_N * SCRYPT_R, dklen=32)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+# Função para conferir uma senha com o valor guardado (comparação em tempo constante).
+# Retorna (confere, precisa_regravar)
+def verify_password(password, stored):
+    parts = stored.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        n, r, p = (int(value) for value in parts[1:4])
+        expected = bytes.fromhex(parts[5])
+        digest = hashlib.scrypt(password.encode(), salt=bytes.fromhex(parts[4]), n=n, r=r, p=p,
+                                maxmem=256 * n * r, dklen=len(expected))
+        current = PASSWORD_KDF != "pbkdf2" and (n, r, p) == (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        expected = bytes.fromhex(parts[3])
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(parts[2]), int(parts[1]))
+        current = PASSWORD_KDF == "pbkdf2" and int(parts[1]) == PBKDF2_ITERATIONS
     else:
-        # Se o arquivo não existir, criar uma estrutura inicial
-        return {"last_id": 0, "students": {}}
+        # Senha gravada em texto puro, antes dos hashes existirem
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+    return hmac.compare_digest(digest, expected), not current
+
+# Serviço de autenticação: verifica as senhas num conjunto de threads e mantém um cache das
+# credenciais (hash da senha), validado pela versão do arquivo (ou banco) de onde elas vieram
+class Authenticator:
+    def __init__(self, storage, max_entries=AUTH_CACHE_SIZE):
+        self.storage = storage
+        self.max_entries = max_entries
+        self.records = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+        # Hash usado quando a conta não existe, para a resposta levar o mesmo tempo
+        self.dummy_hash = hash_password(uuid.uuid4().hex)
+
+    # Credencial de um treinador (key = login) ou de um aluno (key = (treinador, ID do aluno))
+    def record(self, kind, key):
+        if kind == "trainer":
+            version = self.storage.get_trainers_version()
+        else:
+            version = self.storage.get_version(key[0])
+        with self.lock:
+            entry = self.records.get((kind, key))
+            if entry is not None and entry[0] == version:
+                self.records.move_to_end((kind, key))
+                return entry[1]
+        if kind == "trainer":
+            info = self.storage.load_trainers().get(key)
+        else:
+            info = load_trainer_students(key[0])["students"].get(key[1])
+        record = None if info is None else {field: info.get(field) for field in ("password", "reset_password", "reset_expires")}
+        with self.lock:
+            self.records[(kind, key)] = (version, record)
+            self.records.move_to_end((kind, key))
+            while len(self.records) > self.max_entries:
+                self.records.popitem(last=False)
+        return record
+
+    def invalidate(self, kind, key):
+        with self.lock:
+            self.records.pop((kind, key), None)
+
+    # Calcula o hash de uma nova senha (no conjunto de threads)
+    def hash(self, password):
+        with get_metrics().timed("password_hash"):
+            return self.executor.submit(hash_password, password).result()
+
+    # Confere a senha; se ela estiver em texto puro ou com parâmetros antigos, regrava o hash.
+    # Uma senha temporária (recuperação de senha) ainda válida também é aceita e passa a ser a senha
+    def authenticate(self, kind, key, password):
+        record = self.record(kind, key)
+        stored = record["password"] if record and record["password"] else None
+        with get_metrics().timed("password_verify"):
+            ok, needs_rehash = self.executor.submit(verify_password, password, stored or self.dummy_hash).result()
+        if ok and stored is not None:
+            if needs_rehash:
+                self.rehash(kind, key, password)
+            return True
+        reset = record.get("reset_password") if record else None
+        if reset is None or (record.get("reset_expires") or 0) < time.time():
+            return False
+        with get_metrics().timed("password_verify"):
+            ok, _ = self.executor.submit(verify_password, password, reset).result()
+        if ok:
+            self.redeem(kind, key, reset)
+        return ok
+
+    # Troca a senha pela senha temporária usada no login (apenas alunos têm recuperação de senha)
+    def redeem(self, kind, key, reset):
+        data = load_trainer_students(key[0])
+        student = data["students"].get(key[1])
+        if student is None or student.get("reset_password") != reset:
+            return
+        student["password"] = reset
+        student["reset_password"] = student["reset_expires"] = None
+        try:
+            save_trainer_students(key[0], data)
+        except StaleDataError:
+            return  # Outra sessão gravou antes: a troca é feita no próximo login com a senha temporária
+        self.invalidate(kind, key)
+
+    def rehash(self, kind, key, password):
+        password_hash = self.hash(password)
+        if kind == "trainer":
+            self.storage.set_trainer_password(key, password_hash)
+        else:
+            data = load_trainer_students(key[0])
+            data["students"][key[1]]["password"] = password_hash
+            try:
+                save_trainer_students(key[0], data)
+            except StaleDataError:
+                return  # Outra sessão gravou antes: o hash é regravado no próximo login
+        self.invalidate(kind, key)
+
+# Função para obter o serviço de autenticação (compartilhado entre as sessões)
+@st.cache_resource
+def get_authenticator():
+    return Authenticator(get_storage())
+
+# Sincronização do aluno (modo offline): o aplicativo do aluno faz login uma vez, recebe um
+# resumo pequeno (treinos ativos e pesos recentes) com a versão dos dados, marca exercícios e
+# registra pesos sem conexão e depois envia as alterações em lote, numa única gravação.
+#   POST /sync/login {"login", "password"} -> {"token", "snapshot"}
+#   POST /sync {"token", "version", "deltas": [...]} -> {"version", "applied", "conflicts", "snapshot"}
+# Alterações (deltas) aceitas:
+#   exercise_toggled: {"workout_id", "exercise", "name", "completed"}
+#   workout_finished: {"workout_id", "finished_at"}
+#   weight_recorded:  {"weight", "date"}
+# Cada alteração é conferida com os dados atuais do servidor: treino já finalizado ou removido e
+# exercício trocado de posição (o "name" não confere) são conflitos, devolvidos com o índice da
+# alteração, e o servidor prevalece. Alterações repetidas (reenvio de um lote) são ignoradas.
+# "snapshot" só é enviado se os dados mudaram desde a versão que o aplicativo tinha (senão None).
+# PLANOT_SYNC_SECRET: chave que assina os tokens (sem ela, os tokens valem até o serviço reiniciar)
+SYNC_SECRET = os.environ.get("PLANOT_SYNC_SECRET") or secrets.token_hex(32)
+SYNC_TOKEN_SECONDS = int(os.environ.get("PLANOT_SYNC_TOKEN_HOURS", "720")) * 3600
+# Quantidade de medições de peso enviadas no resumo e de alterações aceitas por lote
+SYNC_RECENT_WEIGHTS = int(os.environ.get("PLANOT_SYNC_RECENT_WEIGHTS", "30"))
+SYNC_MAX_DELTAS = 500
 
-# Função para salvar os dados dos alunos de um treinador
-def save_trainer_students(trainer_login, data):
-    filename = f"{trainer_login}_students.json"
-    with open(filename, "w") as f:
-        json.dump(data, f)
+# Espera depois de logins com senha errada: a partir de SYNC_LOGIN_FREE_ATTEMPTS falhas seguidas,
+# cada nova falha dobra a espera (até SYNC_LOGIN_MAX_WAIT segundos)
+SYNC_LOGIN_FREE_ATTEMPTS = 5
+SYNC_LOGIN_MAX_WAIT = 900
+SYNC_LOGIN_TRACKED = 10000
+
+# Contagem de falhas de login por chave (("login", login) ou ("client", IP)). Usada apenas
+# no laço de eventos do serviço de dados, por isso não precisa de trava
+class LoginThrottle:
+    def __init__(self, free_attempts=SYNC_LOGIN_FREE_ATTEMPTS, max_wait=SYNC_LOGIN_MAX_WAIT,
+                 max_entries=SYNC_LOGIN_TRACKED):
+        self.free_attempts = free_attempts
+        self.max_wait = max_wait
+        self.max_entries = max_entries
+        self.failures = OrderedDict()  # chave -> (falhas seguidas, liberado a partir de)
+
+    # Segundos que ainda faltam para as chaves poderem tentar de novo (0 se nenhuma estiver bloqueada)
+    def wait(self, keys):
+        now = time.time()
+        return max([self.failures[key][1] - now for key in keys if key in self.failures] + [0])
+
+    def succeeded(self, key):
+        self.failures.pop(key, None)
+
+    def failed(self, keys):
+        for key in keys:
+            count = self.failures.pop(key, (0, 0))[0] + 1
+            wait = min(2 ** (count - self.free_attempts), self.max_wait) if count >= self.free_attempts else 0
+            self.failures[key] = (count, time.time() + wait)
+            while len(self.failures) > self.max_entries:
+                self.failures.popitem(last=False)
+
+# Função para assinar um texto com a chave da sincronização
+def sync_signature(text):
+    return hmac.new(SYNC_SECRET.encode(), text.encode(), hashlib.sha256).hexdigest()
+
+# Função para gerar o token do aluno: (treinador, ID do aluno, validade) + assinatura
+def issue_sync_token(trainer_login, student_id):
+    payload = base64.urlsafe_b64encode(
+        json.dumps([trainer_login, student_id, int(time.time()) + SYNC_TOKEN_SECONDS]).encode()).decode()
+    return f"{payload}.{sync_signature(payload)}"
+
+# Função para conferir o token: retorna (treinador, ID do aluno) ou None se inválido ou vencido
+def read_sync_token(token):
+    payload, _, signature = str(token or "").partition(".")
+    if not hmac.compare_digest(signature.encode(), sync_signature(payload).encode()):
+        return None
+    trainer_login, student_id, expires = json.loads(base64.urlsafe_b64decode(payload))
+    return (trainer_login, student_id) if expires > time.time() else None
+
+# Função para obter a versão dos detalhes do aluno usada pela sincronização
+def sync_version(detail):
+    return [detail.get("version", 0), detail.get("events_applied", 0)]
+
+# Função para montar o resumo do aluno enviado ao aplicativo (só o que ele usa sem conexão)
+def student_snapshot(trainer_login, student_id, data, detail):
+    student = data["students"][student_id]
+    library = load_templates(trainer_login)
+    history = detail["weight_history"]
+    workouts = []
+    for workout in detail["workouts"]:
+        workout = resolve_workout(workout, library)
+        if not workout.get("hidden", False):
+            workouts.append({field: workout[field] for field in ("id", "name", "description", "exercises", "completed")})
+    return {
+        "version": sync_version(detail),
+        "student": {field: student[field] for field in ("name", "weight", "height", "completed_workouts")},
+        "workouts": workouts,
+        "weights": {"dates": history["dates"][-SYNC_RECENT_WEIGHTS:],
+                    "weights": list(history["weights"][-SYNC_RECENT_WEIGHTS:])},
+    }
+
+# Função para aplicar um lote de alterações do aplicativo do aluno.
+# Levanta ValueError se alguma alteração for inválida (nada do lote é gravado)
+def sync_student(trainer_login, student_id, version, deltas):
+    if not isinstance(deltas, list) or len(deltas) > SYNC_MAX_DELTAS:
+        raise ValueError(f"Envie no máximo {SYNC_MAX_DELTAS} alterações por lote")
+    data = load_trainer_students(trainer_login)
+    if student_id not in data["students"]:
+        return None
+    detail = load_student_detail(trainer_login, student_id)
+    library = load_templates(trainer_login)
+    # Cópias dos treinos ativos com as alterações do lote já aplicadas (os do cache não são alterados)
+    workouts = {}
+    for workout in detail["workouts"]:
+        if not workout.get("hidden", False):
+            workout = resolve_workout(workout, library)
+            workouts[workout["id"]] = dict(workout, completed=list(workout["completed"]))
+    history = detail["weight_history"]
+    recent_weights = set(zip(history["dates"][-SYNC_RECENT_WEIGHTS:], history["weights"][-SYNC_RECENT_WEIGHTS:]))
+    # Data da medição mais recente, contando as do próprio lote (medições mais antigas não mudam o peso atual)
+    newest_date = history["dates"][-1] if history["dates"] else ""
+    events, conflicts = [], []
+    for index, delta in enumerate(deltas):
+        if not isinstance(delta, dict):
+            raise ValueError(f"Alteração {index}: formato inválido")
+        kind = delta.get("type")
+        if kind == "weight_recorded":
+            try:
+                weight, date = float(delta["weight"]), datetime.strptime(delta["date"], "%Y-%m-%d").strftime("%Y-%m-%d")
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"Alteração {index}: informe o peso e a data (AAAA-MM-DD)")
+            if not (math.isfinite(weight) and 0 < weight <= MAX_WEIGHT_KG):
+                raise ValueError(f"Alteração {index}: o peso deve estar entre 0 e {MAX_WEIGHT_KG:g} kg")
+            if (date, weight) not in recent_weights:
+                recent_weights.add((date, weight))
+                events.append({"type": kind, "student_id": student_id, "weight": weight, "date": date,
+                               "latest": date >= newest_date})
+                newest_date = max(newest_date, date)
+            continue
+        if kind not in ("exercise_toggled", "workout_finished"):
+            raise ValueError(f"Alteração {index}: tipo desconhecido {kind!r}")
+        workout = workouts.get(delta.get("workout_id"))
+        if workout is None:
+            conflicts.append({"delta": index, "reason": "workout_missing"})
+            continue
+        if kind == "exercise_toggled":
+            exercise = delta.get("exercise")
+            if not isinstance(exercise, int) or not 0 <= exercise < len(workout["exercises"]) \
+                    or workout["exercises"][exercise] != delta.get("name", workout["exercises"][exercise]):
+                conflicts.append({"delta": index, "reason": "exercise_changed"})
+                continue
+            completed = bool(delta.get("completed"))
+            if workout["completed"][exercise] != completed:
+                workout["completed"][exercise] = completed
+                events.append({"type": kind, "student_id": student_id, "workout_id": workout["id"],
+                               "exercise": exercise, "completed": completed})
+        else:
+            try:
+                finished_at = datetime.fromisoformat(delta.get("finished_at") or datetime.now().isoformat())
+            except (TypeError, ValueError):
+                raise ValueError(f"Alteração {index}: data de finalização inválida")
+            del workouts[workout["id"]]
+            events.append({"type": kind, "student_id": student_id, "workout_id": workout["id"], "action": "archive",
+                           "session": workout_session(workout, finished_at.isoformat(timespec="seconds"))})
+    if events:
+        record_events(trainer_login, data, detail, events)
+    unchanged = not events and version == sync_version(detail)
+    return {
+        "version": sync_version(detail),
+        "applied": len(events),
+        "conflicts": conflicts,
+        "snapshot": None if unchanged else student_snapshot(trainer_login, student_id, data, detail),
+    }
+
+# Rotas da sincronização no serviço de dados: recebem o corpo da requisição e retornam a
+# resposta, ou None se o aluno não foi autenticado
+def sync_login_route(request):
+    trainer_login, student_id, data = find_student("login", str(request.get("login", "")))
+    if trainer_login is None or not get_authenticator().authenticate(
+            "student", (trainer_login, student_id), str(request.get("password", ""))):
+        return None
+    detail = load_student_detail(trainer_login, student_id)
+    return {"token": issue_sync_token(trainer_login, student_id),
+            "snapshot": student_snapshot(trainer_login, student_id, data, detail)}
+
+def sync_route(request):
+    student = read_sync_token(request.get("token"))
+    if student is None:
+        return None
+    return sync_student(student[0], student[1], request.get("version"), request.get("deltas", []))
+
+SYNC_ROUTES = {"/sync/login": sync_login_route, "/sync": sync_route}
+
+# Quantidade máxima de resultados de uma busca de alunos
+SEARCH_RESULT_LIMIT = int(os.environ.get("PLANOT_SEARCH_RESULT_LIMIT", "200"))
+# Quantidade de alunos exibidos por página na lista do treinador
+STUDENTS_PAGE_SIZE = int(os.environ.get("PLANOT_STUDENTS_PAGE_SIZE", "50"))
+
+# Função para normalizar um texto para busca (minúsculas e sem acentos)
+def normalize_text(text):
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+# Índice de busca dos alunos de um treinador: IDs e palavras dos nomes ordenados,
+# para encontrar prefixos por busca binária em vez de percorrer todos os alunos
+class StudentSearchIndex:
+    def __init__(self, students):
+        self.ids = sorted(students)
+        self.names = {student_id: normalize_text(info["name"]) for student_id, info in students.items()}
+        self.postings = {}
+        for student_id, name in self.names.items():
+            for token in name.split():
+                self.postings.setdefault(token, set()).add(student_id)
+        self.tokens = sorted(self.postings)
+
+    @staticmethod
+    def prefix_range(sorted_values, prefix):
+        start = bisect.bisect_left(sorted_values, prefix)
+        end = bisect.bisect_left(sorted_values, prefix + "\uffff")
+        return sorted_values[start:end]
+
+    # Retorna os IDs encontrados, do mais relevante para o menos relevante:
+    # ID exato, ID começando pelo termo (em ordem de ID) e depois nomes com todas as palavras
+    # buscadas (palavras inteiras antes de prefixos, em ordem de nome). Sem termo, retorna
+    # todos os alunos por ID.
+    def search(self, query, limit):
+        query = normalize_text(query or "").strip()
+        if not query:
+            return self.ids
+        scores = {}
+        for student_id in self.prefix_range(self.ids, query):
+            scores[student_id] = 3 if student_id == query else 2
+        terms = query.split()
+        name_scores = None
+        for term in terms:
+            term_scores = {}
+            for token in self.prefix_range(self.tokens, term):
+                for student_id in self.postings[token]:
+                    term_scores[student_id] = max(term_scores.get(student_id, 0), 1 if token == term else 0.5)
+            if name_scores is None:
+                name_scores = term_scores
+            else:
+                name_scores = {sid: score + term_scores[sid] for sid, score in name_scores.items() if sid in term_scores}
+            if not name_scores:
+                break
+        for student_id, score in (name_scores or {}).items():
+            scores.setdefault(student_id, 1 + score / (len(terms) + 1))
+        ranked = sorted(scores, key=lambda sid: (-scores[sid], sid if scores[sid] >= 2 else self.names[sid], sid))
+        return ranked[:limit]
+
+# Função para obter o armazenamento dos índices de busca (compartilhado entre as sessões):
+# (trava, {treinador: (chave, índice)} do menos ao mais usado recentemente)
+@st.cache_resource
+def get_search_index_store():
+    return threading.Lock(), OrderedDict()
+
+# Função para obter o índice de busca de um treinador, reconstruído só quando
+# os dados são salvos por completo (eventos do diário não alteram nomes nem IDs)
+def get_search_index(trainer_login, data):
+    lock, store = get_search_index_store()
+    key = (data.get("version"), len(data["students"]))
+    with lock:
+        entry = store.get(trainer_login)
+        if entry is not None and entry[0] == key:
+            store.move_to_end(trainer_login)
+            return entry[1]
+    # Monta o índice fora da trava para não bloquear as buscas de outros treinadores
+    with get_metrics().timed("search_index_build"):
+        index = StudentSearchIndex(data["students"])
+    with lock:
+        store[trainer_login] = (key, index)
+        store.move_to_end(trainer_login)
+        while len(store) > CACHE_MAX_TRAINERS:
+            store.popitem(last=False)
+    return index
 
 # Função para gerar um ID numérico sequencial
 def generate_id(data):
     data["last_id"] += 1
     return f"{data['last_id']:03}"  # Formata o ID com 3 dígitos (001, 002, etc.)
 
+# Função para garantir que os logins de alunos novos ({ID do aluno: login}) sejam únicos.
+# Os IDs se repetem entre treinadores, então "ana_001" pode já ser de um aluno de outro
+# treinador: nesse caso o login recebe um sufixo ("ana_001_2"). Retorna {ID do aluno: login}
+def unique_student_logins(data, candidates):
+    storage = get_storage()
+    taken = {student_info.get("login") for student_info in data["students"].values()}
+    logins = {}
+    attempt = 1
+    while candidates:
+        names = {student_id: login if attempt == 1 else f"{login}_{attempt}" for student_id, login in candidates.items()}
+        taken.update(storage.lookup_students("login", list(names.values())))
+        pending = {}
+        for student_id, name in names.items():
+            if name in taken:
+                pending[student_id] = candidates[student_id]
+            else:
+                logins[student_id] = name
+                taken.add(name)
+        candidates = pending
+        attempt += 1
+    return logins
+
+# Quantidade de linhas lidas e gravadas de cada vez na importação e na exportação em lote
+IMPORT_BATCH_SIZE = int(os.environ.get("PLANOT_IMPORT_BATCH_SIZE", "500"))
+EXPORT_BATCH_SIZE = int(os.environ.get("PLANOT_EXPORT_BATCH_SIZE", "5000"))
+# Colunas aceitas na importação de alunos ("name" é obrigatória)
+IMPORT_COLUMNS = ("name", "weight", "height", "email")
+# Colunas (e tipos no Parquet) de cada exportação: lista de alunos, treinos (um exercício por linha) e pesos
+EXPORT_COLUMNS = {
+    "students": (("student_id", "string"), ("name", "string"), ("weight", "float64"), ("height", "float64"),
+                 ("email", "string"), ("login", "string"), ("completed_workouts", "int64")),
+    "workouts": (("student_id", "string"), ("workout_id", "string"), ("workout", "string"), ("description", "string"),
+                 ("hidden", "bool"), ("position", "int64"), ("exercise", "string"), ("completed", "bool")),
+    "weights": (("student_id", "string"), ("date", "string"), ("weight", "float64")),
+}
+EXPORT_LABELS = {"students": "Lista de alunos", "workouts": "Treinos", "weights": "Histórico de peso"}
+
+# Função para descobrir o formato (csv ou parquet) pela extensão do arquivo
+def table_format(filename):
+    return "parquet" if filename.lower().endswith(".parquet") else "csv"
+
+def require_pyarrow():
+    if pq is None:
+        raise ValueError("❌ Arquivos Parquet precisam do pacote pyarrow (pip install pyarrow).")
+
+# Função para ler um CSV ou Parquet em blocos de até chunk_size linhas (DataFrames)
+def read_table_chunks(source, file_format, chunk_size):
+    if file_format == "parquet":
+        require_pyarrow()
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype={"name": str, "email": str})
+
+# Erro de uma importação interrompida depois que alguns blocos já foram gravados
+class ImportInterruptedError(ValueError):
+    def __init__(self, imported, error):
+        super().__init__(f"❌ Importação interrompida: {imported} aluno(s) já tinham sido importados antes do erro ({error}).")
+        self.imported = imported
+
+# Função para importar alunos de um CSV ou Parquet lido em blocos.
+# Cada bloco recebe IDs sequenciais (como generate_id) e logins como no formulário de cadastro,
+# e é gravado de uma vez (resumo e detalhes) em vez de um salvamento por aluno.
+# As colunas são conferidas antes de gravar o primeiro bloco (o cabeçalho do CSV e o esquema do
+# Parquet valem para o arquivo inteiro); um erro depois disso levanta ImportInterruptedError
+# com a quantidade de alunos já gravados. Retorna a quantidade de alunos importados
+def import_students(trainer_login, source, file_format="csv", batch_size=IMPORT_BATCH_SIZE):
+    chunks = read_table_chunks(source, file_format, batch_size)
+    first = next(chunks, None)
+    if first is None:
+        return 0
+    if "name" not in first.columns:
+        raise ValueError("❌ O arquivo precisa de uma coluna \"name\" com o nome dos alunos.")
+    imported = 0
+    try:
+        for chunk in itertools.chain([first], chunks):
+            imported += import_students_chunk(trainer_login, chunk)
+    except Exception as error:
+        if imported == 0:
+            raise
+        raise ImportInterruptedError(imported, error) from error
+    return imported
+
+# Função para gravar um bloco da importação; retorna a quantidade de alunos gravados
+def import_students_chunk(trainer_login, chunk):
+    today = datetime.now().strftime("%Y-%m-%d")
+    chunk = chunk.reindex(columns=IMPORT_COLUMNS)
+    names = chunk["name"].fillna("").astype(str).str.strip()
+    weights = pd.to_numeric(chunk["weight"], errors="coerce").fillna(0.0)
+    weights = weights.where(weights.between(0.0, MAX_WEIGHT_KG), 0.0)  # Peso fora do intervalo conta como não informado
+    heights = pd.to_numeric(chunk["height"], errors="coerce").fillna(0.0)
+    emails = chunk["email"].fillna("").astype(str).str.strip()
+    rows = [row for row in zip(names, weights, heights, emails) if row[0]]  # Linhas sem nome são ignoradas
+    # Em caso de conflito com outra sessão o bloco é montado de novo sobre os dados atuais
+    for attempt in range(3):
+        data = load_trainer_students(trainer_login)
+        details = {}
+        new_students = {generate_id(data): row for row in rows}
+        logins = unique_student_logins(
+            data, {student_id: f"{row[0].split()[0].lower()}_{student_id}" for student_id, row in new_students.items()})
+        for student_id, (name, weight, height, email) in new_students.items():
+            data["students"][student_id] = {
+                "name": name,
+                "weight": float(weight),
+                "height": float(height),
+                "email": email,
+                "initial_weight": float(weight),
+                "login": logins[student_id],
+                "password": None,
+                "completed_workouts": 0,
+            }
+            details[student_id] = new_student_detail()
+            append_weight(details[student_id], float(weight), today)
+        try:
+            save_trainer_students(trainer_login, data, details)
+            break
+        except StaleDataError:
+            if attempt == 2:
+                raise
+    return len(rows)
+
+# Função para gerar as linhas de uma exportação, lendo os detalhes de um aluno por vez
+# (direto do armazenamento, sem ocupar o cache compartilhado)
+def iter_export_rows(trainer_login, kind):
+    storage = get_storage()
+    data = storage.load_trainer_students(trainer_login)
+    library = storage.load_templates(trainer_login)
+    if kind == "students":
+        for student_id, student_info in data["students"].items():
+            yield (student_id, student_info["name"], student_info["weight"], student_info["height"],
+                   student_info["email"], student_info["login"], student_info["completed_workouts"])
+        return
+    for student_id, detail in iter_student_details(storage, trainer_login, data["students"]):
+        if kind == "weights":
+            history = detail["weight_history"]
+            for date, weight in zip(history["dates"], history["weights"]):
+                yield (student_id, date, weight)
+        else:
+            for workout in detail["workouts"]:
+                workout = resolve_workout(workout, library)
+                for position, exercise in enumerate(workout["exercises"]):
+                    yield (student_id, workout["id"], workout["name"], workout["description"],
+                           workout.get("hidden", False), position, exercise, workout["completed"][position])
+
+# Função para exportar a lista de alunos, os treinos ou os pesos de um treinador em CSV ou Parquet.
+# As linhas são gravadas em blocos à medida que são lidas. Retorna a quantidade de linhas
+def export_table(trainer_login, kind, target, file_format="csv", batch_size=EXPORT_BATCH_SIZE):
+    columns = EXPORT_COLUMNS[kind]
+    rows = iter_export_rows(trainer_login, kind)
+    count = 0
+    if file_format == "parquet":
+        require_pyarrow()
+        schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in columns])
+        with pq.ParquetWriter(target, schema) as writer:
+            while batch := list(itertools.islice(rows, batch_size)):
+                values = zip(*batch)
+                writer.write_table(pa.Table.from_pydict({name: list(next(values)) for name, _ in columns}, schema=schema))
+                count += len(batch)
+        return count
+    writer = csv.writer(target)
+    writer.writerow([name for name, _ in columns])
+    while batch := list(itertools.islice(rows, batch_size)):
+        writer.writerows(batch)
+        count += len(batch)
+    return count
+
+# Função para exportar para um arquivo (usada pela tarefa de exportação em segundo plano)
+# Retorna a quantidade de linhas exportadas
+def export_to_file(trainer_login, kind, file_format, filename):
+    if file_format == "parquet":
+        with open(filename, "wb") as target:
+            return export_table(trainer_login, kind, target, "parquet")
+    with open(filename, "w", encoding="utf-8", newline="") as target:
+        return export_table(trainer_login, kind, target, "csv")
+
+# Tarefas em segundo plano (e-mails, exportações, relatórios): a página só enfileira a tarefa e
+# consulta a situação dela; um conjunto de threads executa as tarefas fora da execução da página.
+# A fila fica num banco SQLite próprio, compartilhado por todos os processos do app.
+# PLANOT_JOBS_DB: arquivo da fila
+# PLANOT_JOB_WORKERS: threads que executam tarefas em cada processo
+# PLANOT_JOB_WORKER=0: o app não executa tarefas (ficam para "python PlanoT.py run-jobs")
+JOBS_DB_FILE = os.environ.get("PLANOT_JOBS_DB", "jobs.db")
+JOB_WORKERS = int(os.environ.get("PLANOT_JOB_WORKERS", "2"))
+JOB_WORKER_IN_APP = os.environ.get("PLANOT_JOB_WORKER", "1") == "1"
+# Tentativas por tarefa; a espera antes de cada nova tentativa dobra a partir de JOB_RETRY_SECONDS
+JOB_MAX_ATTEMPTS = int(os.environ.get("PLANOT_JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_SECONDS = float(os.environ.get("PLANOT_JOB_RETRY_SECONDS", "30"))
+# Tempo máximo de uma execução: depois dele a tarefa volta a ficar disponível (processo que caiu)
+JOB_LEASE_SECONDS = 600
+JOB_POLL_SECONDS = 1.0
+# Tarefas concluídas ou com falha são apagadas (com os arquivos gerados) depois deste tempo
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+# Pasta dos arquivos gerados pelas exportações
+EXPORTS_DIR = os.environ.get("PLANOT_EXPORTS_DIR", "exports")
+
+# Fila persistente de tarefas. Situações: queued -> running -> done ou failed
+# (uma falha volta para queued enquanto houver tentativas)
+class JobQueue:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            owner TEXT,
+            label TEXT,
+            payload TEXT,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_after REAL NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after);
+        CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created_at);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # Acorda as threads deste processo assim que uma tarefa é enfileirada
+        self.wakeup = threading.Event()
+        self.connect().executescript(self.SCHEMA)
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    # Situação de uma tarefa (sem os dados de entrada, que podem conter senhas)
+    def row_to_job(self, row):
+        job = {field: row[field] for field in ("id", "kind", "owner", "label", "status", "attempts", "max_attempts",
+                                                "error", "created_at", "updated_at")}
+        job["result"] = json.loads(row["result"]) if row["result"] else None
+        job["retriable"] = row["status"] == "failed" and row["payload"] is not None
+        return job
+
+    # Enfileira uma tarefa e retorna o seu ID
+    def enqueue(self, kind, payload, owner=None, label=None, max_attempts=JOB_MAX_ATTEMPTS):
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, owner, label, payload, status, max_attempts, run_after, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, owner, label, json.dumps(payload), max_attempts, now, now, now),
+            )
+        self.wakeup.set()
+        return job_id
+
+    # Pega a próxima tarefa pronta (ou cuja execução anterior passou do prazo) e a marca como em execução
+    def claim(self):
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') AND run_after <= ? ORDER BY run_after LIMIT 1",
+                (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, run_after = ?, updated_at = ? "
+                         "WHERE id = ?", (now + JOB_LEASE_SECONDS, now, row["id"]))
+        job = self.row_to_job(row)
+        job["attempts"] += 1
+        job["payload"] = json.loads(row["payload"])
+        return job
+
+    # Conclui a tarefa; os dados de entrada são descartados
+    def complete(self, job_id, result):
+        with self.transaction() as conn:
+            conn.execute("UPDATE jobs SET status = 'done', payload = NULL, result = ?, error = NULL, updated_at = ? "
+                         "WHERE id = ?", (json.dumps(result), time.time(), job_id))
+
+    # Registra uma falha: a tarefa volta para a fila (com espera crescente) enquanto houver tentativas.
+    # Sem mais tentativas os dados de entrada (que podem conter senhas) são descartados, a menos que
+    # "keep_payload" permita guardá-los para um novo pedido de execução (retry)
+    def fail(self, job_id, error, keep_payload=False):
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row["attempts"] < row["max_attempts"]:
+                conn.execute("UPDATE jobs SET status = 'queued', run_after = ?, error = ?, updated_at = ? WHERE id = ?",
+                             (now + JOB_RETRY_SECONDS * 2 ** (row["attempts"] - 1), error, now, job_id))
+            elif keep_payload:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                             (error, now, job_id))
+            else:
+                conn.execute("UPDATE jobs SET status = 'failed', payload = NULL, error = ?, updated_at = ? WHERE id = ?",
+                             (error, now, job_id))
+
+    # Coloca de novo na fila uma tarefa que esgotou as tentativas (só se os dados de entrada foram guardados)
+    def retry(self, job_id):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute("UPDATE jobs SET status = 'queued', attempts = 0, run_after = ?, updated_at = ? "
+                         "WHERE id = ? AND status = 'failed' AND payload IS NOT NULL", (now, now, job_id))
+        self.wakeup.set()
+
+    def get(self, job_id):
+        row = self.connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self.row_to_job(row) if row else None
+
+    # Tarefas mais recentes (de um dono ou de todos)
+    def list_jobs(self, owner=None, limit=50):
+        if owner is None:
+            rows = self.connect().execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        else:
+            rows = self.connect().execute(
+                "SELECT * FROM jobs WHERE owner = ? ORDER BY created_at DESC LIMIT ?", (owner, limit))
+        return [self.row_to_job(row) for row in rows]
+
+    # Apaga as tarefas terminadas antes de "before" e os arquivos que elas geraram
+    def purge(self, before):
+        with self.transaction() as conn:
+            rows = conn.execute("SELECT result FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                                (before,)).fetchall()
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (before,))
+        for row in rows:
+            path = (json.loads(row["result"]) or {}).get("path") if row["result"] else None
+            if path and os.path.exists(path):
+                os.remove(path)
+        return len(rows)
+
+# Executor das tarefas: uma thread busca as tarefas prontas e as entrega a um conjunto de threads
+class JobWorker:
+    def __init__(self, queue, workers):
+        self.queue = queue
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.slots = threading.Semaphore(workers)
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name="job-dispatcher", daemon=True).start()
+        return self
+
+    def run(self):
+        last_purge = 0
+        while not self.stopped.is_set():
+            if time.time() - last_purge > 3600:
+                self.queue.purge(time.time() - JOB_RETENTION_SECONDS)
+                last_purge = time.time()
+            self.slots.acquire()
+            job = self.queue.claim()
+            if job is None:
+                self.slots.release()
+                self.queue.wakeup.wait(JOB_POLL_SECONDS)
+                self.queue.wakeup.clear()
+                continue
+            self.pool.submit(self.execute, job)
+
+    def execute(self, job):
+        try:
+            with get_metrics().timed(f"job_{job['kind']}"):
+                result = JOB_HANDLERS[job["kind"]](job["payload"])
+        except Exception as error:
+            self.queue.fail(job["id"], f"{type(error).__name__}: {error}", keep_payload=job["kind"] in RETRIABLE_JOBS)
+        else:
+            self.queue.complete(job["id"], result)
+        finally:
+            self.slots.release()
+
+    def stop(self):
+        self.stopped.set()
+        self.queue.wakeup.set()
+        self.pool.shutdown(wait=True)
+
+# Função para obter a fila de tarefas (compartilhada entre as sessões)
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(JOBS_DB_FILE)
+
+# Função para iniciar (uma única vez por processo) as threads que executam as tarefas
+@st.cache_resource
+def start_job_worker():
+    return JobWorker(get_job_queue(), JOB_WORKERS).start()
+
+# Função para enfileirar uma tarefa; "owner" é quem pode acompanhá-la (login do treinador)
+def enqueue_job(kind, payload, owner=None, label=None):
+    return get_job_queue().enqueue(kind, payload, owner=owner, label=label)
+
+# Envio de e-mails. PLANOT_MAIL_SENDER escolhe o envio:
+#   "log" (padrão): não envia nada, apenas registra destinatário e assunto na saída do servidor
+#   "log-body": registra também o texto da mensagem (só para desenvolvimento: o texto pode conter senhas)
+#   "smtp": envia por PLANOT_SMTP_HOST:PLANOT_SMTP_PORT (para testes, um servidor SMTP local
+#           como "python -m aiosmtpd -n -l localhost:1025" recebe e mostra as mensagens)
+MAIL_SENDER = os.environ.get("PLANOT_MAIL_SENDER", "log")
+MAIL_FROM = os.environ.get("PLANOT_MAIL_FROM", "planot@localhost")
+SMTP_HOST = os.environ.get("PLANOT_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("PLANOT_SMTP_PORT", "25"))
+SMTP_USER = os.environ.get("PLANOT_SMTP_USER")
+SMTP_PASSWORD = os.environ.get("PLANOT_SMTP_PASSWORD")
+SMTP_STARTTLS = os.environ.get("PLANOT_SMTP_STARTTLS") == "1"
+
+# "delivers" indica se a mensagem chega de fato ao destinatário
+class LogMailSender:
+    delivers = False
+
+    def __init__(self, include_body=False):
+        self.include_body = include_body
+
+    def send(self, message):
+        body = f"\n{message.get_content()}" if self.include_body else " (texto omitido)"
+        print(f"📧 E-mail para {message['To']}: {message['Subject']}{body}", flush=True)
+
+class SMTPMailSender:
+    delivers = True
+
+    def __init__(self, host, port, user=None, password=None, starttls=False):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+
+    def send(self, message):
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            smtp.send_message(message)
+
+# Formas de envio disponíveis: cada uma é uma função que cria o objeto com o método send(mensagem)
+MAIL_SENDERS = {
+    "log": LogMailSender,
+    "log-body": lambda: LogMailSender(include_body=True),
+    "smtp": lambda: SMTPMailSender(SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_STARTTLS),
+}
+
+@st.cache_resource
+def get_mail_sender():
+    return MAIL_SENDERS[MAIL_SENDER]()
+
+# Funções que executam cada tipo de tarefa: recebem os dados enfileirados e retornam o resultado.
+# "retriable": os dados de entrada não têm segredos e são guardados depois da falha, para o
+# administrador pedir uma nova execução (os e-mails, que levam senhas temporárias, não são)
+JOB_HANDLERS = {}
+RETRIABLE_JOBS = set()
+
+def job_handler(kind, retriable=False):
+    def decorator(function):
+        JOB_HANDLERS[kind] = function
+        if retriable:
+            RETRIABLE_JOBS.add(kind)
+        return function
+    return decorator
+
+@job_handler("send_email")
+def send_email_job(payload):
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = payload["to"]
+    message["Subject"] = payload["subject"]
+    message.set_content(payload["body"])
+    sender = get_mail_sender()
+    sender.send(message)
+    return {"to": payload["to"], "delivered": sender.delivers}
+
+@job_handler("export", retriable=True)
+def export_job(payload):
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+    filename = os.path.join(
+        EXPORTS_DIR, f"{payload['trainer_login']}_{payload['kind']}_{uuid.uuid4().hex[:8]}.{payload['format']}")
+    try:
+        rows = export_to_file(payload["trainer_login"], payload["kind"], payload["format"], filename)
+    except BaseException:
+        if os.path.exists(filename):
+            os.remove(filename)
+        raise
+    return {"path": filename, "rows": rows}
+
+# A reconstrução usa vários processos: roda o comando do próprio app em um processo separado
+@job_handler("rebuild_reports", retriable=True)
+def rebuild_reports_job(payload):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "rebuild-reports"],
+                            capture_output=True, text=True)
+    # Sem a linha final de resumo a reconstrução não terminou (mesmo com código 0): mostra o erro
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"rebuild-reports terminou com código {result.returncode}: "
+                           f"{result.stderr.strip()[-500:] or 'nenhuma saída'}")
+    return {"message": lines[-1]}
+
+# Função para executar as tarefas neste processo até ser interrompido (python PlanoT.py run-jobs)
+def run_job_worker():
+    worker = JobWorker(get_job_queue(), JOB_WORKERS)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
+
+# Quantidade máxima de pontos do gráfico de peso e de medições exibidas na tabela
+CHART_MAX_POINTS = int(os.environ.get("PLANOT_CHART_MAX_POINTS", "200"))
+RECENT_WEIGHTS_SHOWN = 10
+
+# Função para reduzir o histórico de peso a no máximo max_points pontos (média de cada intervalo),
+# para o gráfico custar o mesmo qualquer que seja o tamanho do histórico
+def downsample_weight_history(history, max_points):
+    weights = np.asarray(history["weights"], dtype=float)
+    dates = history["dates"]
+    if len(weights) <= max_points:
+        return dates, weights
+    starts = np.linspace(0, len(weights), max_points, endpoint=False).astype(int)
+    sizes = np.diff(np.append(starts, len(weights)))
+    means = np.add.reduceat(weights, starts) / sizes
+    # Cada ponto fica na data da última medição do seu intervalo
+    return [dates[i] for i in starts + sizes - 1], means
+
+# Partes da página que reexecutam sozinhas (st.fragment, Streamlit 1.37+): marcar um exercício ou
+# salvar os dados do aluno reexecuta só a parte afetada, que lê os próprios dados do cache.
+# Em versões sem st.fragment, a página inteira é reexecutada como antes.
+fragment = getattr(st, "fragment", None) or (lambda function: function)
+
+# Função para reexecutar só a parte atual da página (ou a página inteira, sem st.fragment
+# ou quando a parte foi executada junto com a página inteira)
+def rerun_fragment():
+    if hasattr(st, "fragment"):
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            pass
+    st.rerun()
+
+# Função para exibir o histórico de peso: estatísticas, gráfico reduzido e as últimas medições
+def show_weight_history(detail, height):
+    history = detail["weight_history"]
+    if not history["weights"]:
+        st.info("Nenhum dado de peso registrado.")
+        return
+    stats = detail.get("weight_stats") or compute_weight_stats(history)
+    bmi = body_mass_index(stats["latest"], height)
+    bmi_average = body_mass_index(stats["ma30"], height)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Peso atual", f"{stats['latest']:.1f} kg", delta=f"{stats['latest'] - stats['ma7']:+.1f} kg vs média de 7")
+    with col2:
+        st.metric("Mínimo / Máximo", f"{stats['min']:.1f} / {stats['max']:.1f} kg")
+    with col3:
+        st.metric("Média das últimas 30", f"{stats['ma30']:.1f} kg")
+    with col4:
+        if bmi is None:
+            st.metric("IMC", "—")
+        else:
+            # Tendência do IMC: atual comparado ao IMC da média das últimas 30 medições
+            st.metric("IMC", f"{bmi:.1f}", delta=f"{bmi - bmi_average:+.1f}", delta_color="inverse")
+
+    with get_metrics().timed("weight_history_chart"):
+        dates, weights = downsample_weight_history(history, CHART_MAX_POINTS)
+        chart_df = pd.DataFrame({"Peso (kg)": weights}, index=pd.to_datetime(dates, errors="coerce"))
+    st.line_chart(chart_df)
+    with st.expander(f"🗒️ Últimas {RECENT_WEIGHTS_SHOWN} medições", expanded=False):
+        st.dataframe(pd.DataFrame({
+            "date": history["dates"][-RECENT_WEIGHTS_SHOWN:][::-1],
+            "weight": history["weights"][-RECENT_WEIGHTS_SHOWN:][::-1],
+        }))
+
+# Função para exibir o histórico de treinos de um aluno, um mês por vez
+def show_workout_history(trainer_login, student_id, library):
+    periods = load_history_periods(trainer_login, student_id)
+    if not periods:
+        st.info("Nenhum treino finalizado ainda.")
+        return
+    period = st.selectbox(
+        "Mês", [None] + periods,
+        format_func=lambda option: "Selecione um mês" if option is None
+        else "Antes do histórico" if option == LEGACY_HISTORY_PERIOD else option,
+        key=f"history_period_{student_id}")
+    if period is None:
+        return
+    # Mais recentes primeiro
+    for session in reversed(load_history(trainer_login, student_id, period)):
+        session = resolve_workout(session, library)
+        done = sum(session["completed"])
+        finished_at = session.get("finished_at") or "data não registrada"
+        with st.expander(f"📅 {finished_at.replace('T', ' ')}: {session['name']} ({done}/{len(session['completed'])})", expanded=False):
+            for exercise, completed in zip(session["exercises"], session["completed"]):
+                st.write(f"{'✅' if completed else '⬜'} {exercise}")
+
+# Histórico de peso de um aluno como parte independente da página
+@fragment
+def weight_history_panel(trainer_login, student_id):
+    student = load_trainer_students(trainer_login)["students"][student_id]
+    show_weight_history(load_student_detail(trainer_login, student_id), student["height"])
+
+# Função chamada quando uma marcação muda: grava o valor escolhido como um evento pequeno no
+# diário do treinador, comparando com os dados atuais (outra sessão pode ter marcado antes)
+def toggle_exercise(trainer_login, student_id, workout_id, exercise, key):
+    completed = st.session_state[key]
+    data = load_trainer_students(trainer_login)
+    detail = load_student_detail(trainer_login, student_id)
+    workout = next((workout for workout in detail["workouts"] if workout["id"] == workout_id), None)
+    if workout is None or resolve_workout(workout, load_templates(trainer_login))["completed"][exercise] == completed:
+        return
+    record_event(trainer_login, data, detail, {
+        "type": "exercise_toggled", "student_id": student_id,
+        "workout_id": workout_id, "exercise": exercise, "completed": completed,
+    })
+    st.session_state[f"{key}_stored"] = completed
+
+# Lista de exercícios de um treino: cada marcação reexecuta e grava só este treino.
+# Finalizar o treino muda a lista de treinos: aí a página inteira é reexecutada
+@fragment
+def workout_checklist(trainer_login, student_id, workout_id, finish_label):
+    data = load_trainer_students(trainer_login)
+    detail = load_student_detail(trainer_login, student_id)
+    workout = next((workout for workout in detail["workouts"] if workout["id"] == workout_id), None)
+    if workout is None:
+        st.info("Este treino já foi finalizado.")
+        return
+    workout = resolve_workout(workout, load_templates(trainer_login))
+    st.write(f"**Descrição:** {workout['description']}")
+    st.write("**Exercícios:**")
+    for j, exercise in enumerate(workout["exercises"]):
+        key = f"{workout['id']}_{j}"
+        # Marcação alterada fora desta sessão (outra sessão ou sincronização): a caixa volta a mostrar
+        # o valor gravado, em vez de manter o antigo e gravá-lo de novo na próxima execução
+        if st.session_state.get(f"{key}_stored") != workout["completed"][j]:
+            st.session_state[key] = st.session_state[f"{key}_stored"] = workout["completed"][j]
+        st.checkbox(exercise, key=key, on_change=toggle_exercise,
+                    args=(trainer_login, student_id, workout["id"], j, key))
+
+    if st.button(finish_label, key=f"finish_{workout['id']}"):
+        # Move o treino para o histórico do aluno e incrementa o contador de treinos realizados
+        record_event(trainer_login, data, detail, {
+            "type": "workout_finished", "student_id": student_id,
+            "workout_id": workout["id"], "action": "archive",
+            "session": workout_session(workout, datetime.now().isoformat(timespec="seconds")),
+        })
+        st.success("✅ Treino finalizado com sucesso!")
+        st.rerun()  # Recarrega a página inteira para atualizar a lista de treinos
+
+# Dados do aluno selecionado pelo treinador (informações, histórico de peso e edição)
+@fragment
+def student_detail_panel(trainer_login, student_id):
+    data = load_trainer_students(trainer_login)
+    student = data["students"][student_id]
+    detail = load_student_detail(trainer_login, student_id)
+
+    # Exibir informações do aluno selecionado
+    st.header(f"👤 Aluno: {student['name']}")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("ID", student_id)
+    with col2:
+        st.metric("Peso", f"{student['weight']} kg")
+    with col3:
+        st.metric("Altura", f"{student['height']} cm")
+
+    # Exibir histórico de peso (estatísticas e gráfico)
+    st.subheader("📊 Histórico de Peso")
+    show_weight_history(detail, student["height"])
+
+    # Aviso ao treinador se o aluno completou um número X de treinos
+    if student["completed_workouts"] >= 5:  # Número X de treinos (ajuste conforme necessário)
+        st.warning(f"⚠️ O aluno {student['name']} completou {student['completed_workouts']} treinos. Considere editar o treino.")
+
+    # Menu suspenso para editar informações do aluno
+    with st.expander("✏️ Editar Informações do Aluno", expanded=False):
+        with st.form("edit_student_info"):
+            new_name = st.text_input("Nome", value=student["name"], key="edit_name")
+            new_weight = st.number_input("Peso (kg)", min_value=0.0, max_value=MAX_WEIGHT_KG,
+                                         value=min(max(float(student["weight"]), 0.0), MAX_WEIGHT_KG), key="edit_weight")
+            new_height = st.number_input("Altura (cm)", value=student["height"], key="edit_height")
+            new_email = st.text_input("E-mail", value=student["email"], key="edit_email")
+            submitted = st.form_submit_button("Salvar Alterações")
+
+            if submitted:
+                renamed = new_name != student["name"]
+                student["name"] = new_name
+                student["height"] = new_height
+                student["email"] = new_email
+                commit_trainer_students(trainer_login, data)
+                # Só depois de salvar o resto (em caso de conflito a execução para antes daqui):
+                # atualiza o peso e adiciona o novo peso ao histórico (evento no diário)
+                today = datetime.now().strftime("%Y-%m-%d")
+                dates = detail["weight_history"]["dates"]
+                record_event(trainer_login, data, detail, {
+                    "type": "weight_recorded", "student_id": student_id,
+                    "weight": new_weight, "date": today, "latest": not dates or today >= dates[-1],
+                })
+                st.success("✅ Informações do aluno atualizadas com sucesso!")
+                # Um novo nome muda a lista de alunos: aí a página inteira é reexecutada
+                if renamed:
+                    st.rerun()
+                rerun_fragment()
+
+# Rótulos da situação das tarefas em segundo plano
+JOB_STATUS_LABELS = {"queued": "⏳ Na fila", "running": "⚙️ Em execução", "done": "✅ Concluída", "failed": "❌ Falhou"}
+
+# Função para exibir a situação de uma tarefa enfileirada pela sessão; retorna a tarefa (ou None)
+def show_job_status(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return None
+    if job["status"] in ("queued", "running"):
+        # Número da tentativa atual (ou da próxima, se a tarefa voltou para a fila depois de uma falha)
+        number = job["attempts"] + (job["status"] == "queued")
+        attempt = f" (tentativa {number} de {job['max_attempts']})" if number > 1 else ""
+        st.info(f"{JOB_STATUS_LABELS[job['status']]}: {job['label'] or job['kind']}{attempt}")
+        if job["error"]:
+            st.caption(f"Última falha: {job['error']}")
+        if st.button("🔄 Atualizar", key=f"refresh_{job_id}"):
+            st.rerun()
+    elif job["status"] == "failed":
+        st.error(f"❌ {job['label'] or job['kind']}: {job['error']}")
+    return job
+
+# Função para exibir uma lista de tarefas
+def show_jobs_table(jobs):
+    st.dataframe(pd.DataFrame([
+        {"tarefa": job["label"] or job["kind"], "situação": JOB_STATUS_LABELS[job["status"]],
+         "tentativas": f"{job['attempts']}/{job['max_attempts']}", "erro": job["error"],
+         "criada em": datetime.fromtimestamp(job["created_at"]).strftime("%Y-%m-%d %H:%M:%S")}
+        for job in jobs
+    ]))
+
 # Interface do Treinador
 def trainer_interface(trainer_login):
     st.title(f"🏋️‍♂️ Interface do Treinador: {trainer_login}")
@@ -89,26 +3439,30 @@ def trainer_interface(trainer_login):
             with col1:
                 student_name = st.text_input("Nome do Aluno", key="student_name")
             with col2:
-                student_weight = st.number_input("Peso do Aluno (kg)", min_value=0.0, key="student_weight")
+                student_weight = st.number_input("Peso do Aluno (kg)", min_value=0.0, max_value=MAX_WEIGHT_KG,
+                                                 key="student_weight")
             student_height = st.number_input("Altura do Aluno (cm)", min_value=0.0, key="student_height")
             student_email = st.text_input("E-mail do Aluno", key="student_email")
             submitted = st.form_submit_button("Adicionar Aluno")
             
             if submitted:
                 student_id = generate_id(data)
-                login = f"{student_name.split()[0].lower()}_{student_id}"  # Gera o login com o primeiro nome e ID
+                # Gera o login com o primeiro nome e ID (com um sufixo se outro aluno já o usar)
+                login = unique_student_logins(data, {student_id: f"{student_name.split()[0].lower()}_{student_id}"})[student_id]
                 data["students"][student_id] = {
                     "name": student_name,
                     "weight": student_weight,
                     "height": student_height,
                     "email": student_email,  # Adiciona o e-mail do aluno
+                    "initial_weight": student_weight,  # Peso inicial (usado nos relatórios)
                     "login": login,  # Adiciona o login gerado
                     "password": None,  # Senha inicialmente não definida
-                    "completed_workouts": 0,  # Contador de treinos realizados
-                    "weight_history": [{"weight": student_weight, "date": datetime.now().strftime("%Y-%m-%d")}],  # Inicializa o histórico de peso
-                    "workouts": []
+                    "completed_workouts": 0  # Contador de treinos realizados
                 }
-                save_trainer_students(trainer_login, data)
+                # Treinos e histórico de peso ficam nos detalhes do aluno, gravados junto com o resumo
+                detail = new_student_detail()
+                append_weight(detail, student_weight, datetime.now().strftime("%Y-%m-%d"))  # Inicializa o histórico de peso
+                commit_trainer_students(trainer_login, data, {student_id: detail})
                 st.success(f"✅ Aluno adicionado com sucesso! ID do Aluno: {student_id}, Login: {login}")
                 
                 # Limpar os campos após adicionar o aluno
@@ -118,15 +3472,103 @@ def trainer_interface(trainer_login):
                 st.session_state.student_email = ""
                 st.rerun()  # Recarrega a página para atualizar a lista de alunos
 
+    # Importar e exportar alunos em lote
+    with st.expander("📦 Importar / Exportar Alunos", expanded=False):
+        uploaded_file = st.file_uploader(
+            "Arquivo CSV ou Parquet com as colunas name, weight, height e email", type=["csv", "parquet"], key="import_file")
+        if uploaded_file is not None and st.button("📥 Importar Alunos"):
+            try:
+                imported = import_students(trainer_login, uploaded_file, table_format(uploaded_file.name))
+            except ImportInterruptedError as error:
+                st.error(str(error))
+                data = load_trainer_students(trainer_login)  # Mostra os alunos que já foram importados
+            except ValueError as error:
+                st.error(str(error))
+            except StaleDataError:
+                st.error("❌ Os dados foram alterados em outra sessão. Atualize a página e repita a operação.")
+            else:
+                st.success(f"✅ {imported} aluno(s) importado(s) com sucesso!")
+                data = load_trainer_students(trainer_login)  # Atualiza a lista exibida abaixo
+        col1, col2 = st.columns(2)
+        with col1:
+            export_kind = st.selectbox("Exportar", list(EXPORT_LABELS), format_func=EXPORT_LABELS.get, key="export_kind")
+        with col2:
+            export_format = st.selectbox("Formato", ["csv", "parquet"], key="export_format")
+        if st.button("📤 Gerar Arquivo"):
+            try:
+                if export_format == "parquet":
+                    require_pyarrow()
+            except ValueError as error:
+                st.error(str(error))
+            else:
+                # O arquivo é gerado em segundo plano; a página só acompanha a tarefa
+                st.session_state.export_job = enqueue_job(
+                    "export", {"trainer_login": trainer_login, "kind": export_kind, "format": export_format},
+                    owner=trainer_login, label=f"Exportação: {EXPORT_LABELS[export_kind]} ({export_format})")
+        if st.session_state.get("export_job"):
+            job = show_job_status(st.session_state.export_job)
+            if job is not None and job["status"] == "done" and os.path.exists(job["result"]["path"]):
+                with open(job["result"]["path"], "rb") as export_file:
+                    st.download_button(f"💾 Baixar ({job['result']['rows']} linhas)", export_file,
+                                       file_name=os.path.basename(job["result"]["path"]))
+        jobs = get_job_queue().list_jobs(owner=trainer_login, limit=10)
+        if jobs:
+            st.caption("Últimas tarefas")
+            show_jobs_table(jobs)
+
+    # Modelos de treino: uma rotina cadastrada uma vez e atribuída a vários alunos
+    library = load_templates(trainer_login)
+    with st.expander("📚 Modelos de Treino", expanded=False):
+        with st.form("add_template", clear_on_submit=True):
+            st.write("Crie um modelo (ou escolha um existente para alterá-lo em todos os alunos):")
+            template_choice = st.selectbox(
+                "Modelo", [None] + list(library["templates"]),
+                format_func=lambda option: "➕ Novo modelo" if option is None else library["templates"][option]["name"],
+                key="template_choice")
+            template_name = st.text_input("Nome do Modelo")
+            template_description = st.text_area("Descrição do Modelo")
+            template_exercises = st.text_area("Exercícios do Modelo (um por linha)")
+            if st.form_submit_button("Salvar Modelo"):
+                exercise_names = [line for line in template_exercises.split("\n") if line.strip()]
+                if template_choice is None and (not template_name or not exercise_names):
+                    st.error("❌ Informe o nome e os exercícios do modelo.")
+                else:
+                    template = library["templates"].get(template_choice)
+                    if template is not None and not exercise_names:
+                        exercise_names = [library["exercises"][exercise_id] for exercise_id in template["exercises"]]
+                    save_template(
+                        library,
+                        template_name or template["name"],
+                        template_description or (template["description"] if template else ""),
+                        exercise_names,
+                        template_choice,
+                    )
+                    commit_templates(trainer_login, library)
+                    st.success("✅ Modelo salvo com sucesso!")
+        for template in library["templates"].values():
+            st.write(f"**{template['name']}**: {len(template['exercises'])} exercício(s)")
+        if library["exercises"]:
+            st.caption(f"Catálogo com {len(library['exercises'])} exercício(s)")
+
     # Lista de todos os alunos com busca integrada
     st.header("📋 Lista de Alunos")
     search_term = st.text_input("🔍 Buscar Aluno por ID ou Nome")
     
+    # Busca no índice (ID por prefixo, nome por palavras sem acento) e mostra uma página por vez
+    with get_metrics().timed("search_students"):
+        matches = get_search_index(trainer_login, data).search(search_term, SEARCH_RESULT_LIMIT)
+    pages = max(1, -(-len(matches) // STUDENTS_PAGE_SIZE))
+    if search_term and not matches:
+        st.info("Nenhum aluno encontrado com o termo de busca.")
+    elif pages > 1:
+        limit_note = " (limite atingido, refine a busca)" if search_term and len(matches) == SEARCH_RESULT_LIMIT else ""
+        st.caption(f"{len(matches)} aluno(s) encontrado(s){limit_note}")
+    page = st.number_input("Página", min_value=1, max_value=pages, value=1, step=1, key="student_page") if pages > 1 else 1
+    page_ids = matches[(page - 1) * STUDENTS_PAGE_SIZE:page * STUDENTS_PAGE_SIZE]
+    
     # Adicionar a opção "Nenhum aluno" com ID 000
     filtered_students = [("000", {"name": "Nenhum aluno", "weight": 0, "height": 0})]
-    for student_id, student_info in data["students"].items():
-        if not search_term or search_term.lower() in student_id.lower() or search_term.lower() in student_info["name"].lower():
-            filtered_students.append((student_id, student_info))
+    filtered_students += [(student_id, data["students"][student_id]) for student_id in page_ids]
     
     if filtered_students:
         # Exibir lista de alunos filtrados
@@ -139,102 +3581,69 @@ def trainer_interface(trainer_login):
         
         # Verificar se o aluno selecionado não é "Nenhum aluno"
         if selected_student_id != "000":
-            student = data["students"][selected_student_id]
-            
-            # Exibir informações do aluno selecionado
-            st.header(f"👤 Aluno: {student['name']}")
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("ID", selected_student_id)
-            with col2:
-                st.metric("Peso", f"{student['weight']} kg")
-            with col3:
-                st.metric("Altura", f"{student['height']} cm")
-            
-            # Exibir histórico de peso em uma tabela
-            st.subheader("📊 Histórico de Peso")
-            if student["weight_history"]:
-                # Converter o histórico de peso em um DataFrame
-                weight_history_df = pd.DataFrame(student["weight_history"])
-                st.dataframe(weight_history_df)
-            else:
-                st.info("Nenhum dado de peso registrado.")
+            # Treinos e histórico de peso são carregados só para o aluno selecionado
+            detail = load_student_detail(trainer_login, selected_student_id)
             
-            # Aviso ao treinador se o aluno completou um número X de treinos
-            if student["completed_workouts"] >= 5:  # Número X de treinos (ajuste conforme necessário)
-                st.warning(f"⚠️ O aluno {student['name']} completou {student['completed_workouts']} treinos. Considere editar o treino.")
+            # Informações, histórico de peso e edição do aluno (reexecutam sem o resto da página)
+            student_detail_panel(trainer_login, selected_student_id)
             
             # Botão para excluir o aluno
             if st.button(f"🗑️ Excluir Aluno {selected_student_id}"):
                 del data["students"][selected_student_id]
-                save_trainer_students(trainer_login, data)
+                commit_trainer_students(trainer_login, data)
                 st.success(f"✅ Aluno {selected_student_id} excluído com sucesso!")
                 st.rerun()  # Recarrega a página para atualizar a lista de alunos
             
-            # Menu suspenso para editar informações do aluno
-            with st.expander("✏️ Editar Informações do Aluno", expanded=False):
-                with st.form("edit_student_info"):
-                    new_name = st.text_input("Nome", value=student["name"], key="edit_name")
-                    new_weight = st.number_input("Peso (kg)", value=student["weight"], key="edit_weight")
-                    new_height = st.number_input("Altura (cm)", value=student["height"], key="edit_height")
-                    new_email = st.text_input("E-mail", value=student["email"], key="edit_email")
-                    submitted = st.form_submit_button("Salvar Alterações")
-                    
-                    if submitted:
-                        student["name"] = new_name
-                        student["weight"] = new_weight
-                        student["height"] = new_height
-                        student["email"] = new_email
-                        # Adiciona o novo peso ao histórico
-                        student["weight_history"].append({"weight": new_weight, "date": datetime.now().strftime("%Y-%m-%d")})
-                        save_trainer_students(trainer_login, data)
-                        st.success("✅ Informações do aluno atualizadas com sucesso!")
-                        st.rerun()  # Recarrega a página para atualizar as informações
-
             # Menu suspenso para adicionar treino
             with st.expander("➕ Adicionar Treino", expanded=False):
-                with st.form("add_workout"):
+                with st.form("add_workout", clear_on_submit=True):  # Limpa os campos após adicionar o treino
+                    template_id = st.selectbox(
+                        "Modelo de Treino", [None] + list(library["templates"]),
+                        format_func=lambda option: "Treino personalizado" if option is None else library["templates"][option]["name"],
+                        key="workout_template")
+                    st.caption("Com um modelo escolhido, os campos preenchidos abaixo substituem os do modelo só para este aluno.")
                     workout_name = st.text_input("Nome do Treino", key="workout_name")
                     workout_description = st.text_area("Descrição do Treino", key="workout_description")
                     exercises = st.text_area("Exercícios (um por linha)", key="exercises")
                     submitted = st.form_submit_button("Adicionar Treino")
                     
                     if submitted:
-                        student["workouts"].append({
-                            "name": workout_name,
-                            "description": workout_description,
-                            "exercises": exercises.split("\n"),
-                            "completed": [False] * len(exercises.split("\n"))  # Inicializa as marcações como False
-                        })
-                        save_trainer_students(trainer_login, data)
+                        if template_id is not None:
+                            # O aluno guarda só a referência ao modelo e o que tiver de diferente
+                            workout = new_template_workout(library, template_id)
+                            if workout_name:
+                                workout["name"] = workout_name
+                            if workout_description:
+                                workout["description"] = workout_description
+                            if exercises.strip():
+                                workout["exercises"] = exercises.split("\n")
+                                workout["completed"] = [False] * len(workout["exercises"])
+                        else:
+                            workout = {
+                                "id": new_workout_id(),
+                                "name": workout_name,
+                                "description": workout_description,
+                                "exercises": exercises.split("\n"),
+                                "completed": [False] * len(exercises.split("\n"))  # Inicializa as marcações como False
+                            }
+                        detail["workouts"].append(workout)
+                        commit_student_detail(trainer_login, selected_student_id, detail)
                         st.success("✅ Treino adicionado com sucesso!")
-                        
-                        # Limpar os campos após adicionar o treino
-                        st.session_state.workout_name = ""
-                        st.session_state.workout_description = ""
-                        st.session_state.exercises = ""
-                        st.rerun()  # Recarrega a página para limpar os campos
+                        st.rerun()  # Recarrega a página para exibir o novo treino
 
             # Exibir treinos do aluno
             st.header("📝 Treinos do Aluno")
-            if not student["workouts"]:
+            if not detail["workouts"]:
                 st.info("Nenhum treino disponível para este aluno.")
             else:
-                for i, workout in enumerate(student["workouts"]):
+                for i, workout in enumerate(detail["workouts"]):
+                    workout = resolve_workout(workout, library)
                     with st.expander(f"🏋️‍♂️ Treino {i + 1}: {workout['name']}", expanded=False):
-                        st.write(f"**Descrição:** {workout['description']}")
-                        st.write("**Exercícios:**")
-                        for j, exercise in enumerate(workout["exercises"]):
-                            completed = st.checkbox(exercise, value=workout["completed"][j], key=f"{workout['name']}_{j}")
-                            workout["completed"][j] = completed
-                        
-                        if st.button(f"✅ Finalizar Treino {i + 1}", key=f"finish_{i}"):
-                            # Remove o treino da lista de treinos do aluno
-                            student["workouts"].pop(i)
-                            student["completed_workouts"] += 1  # Incrementa o contador de treinos realizados
-                            save_trainer_students(trainer_login, data)
-                            st.success("✅ Treino finalizado com sucesso!")
-                            st.rerun()  # Recarrega a página para atualizar as caixas de marcação
+                        workout_checklist(trainer_login, selected_student_id, workout["id"], f"✅ Finalizar Treino {i + 1}")
+
+            # Histórico de treinos finalizados (lido só quando um mês é escolhido)
+            with st.expander("📜 Histórico de Treinos", expanded=False):
+                show_workout_history(trainer_login, selected_student_id, library)
     else:
         st.info("Nenhum aluno encontrado com o termo de busca.")
 
@@ -242,13 +3651,6 @@ def trainer_interface(trainer_login):
 def student_interface():
     st.title("👤 Interface do Aluno")
     
-    # Carregar os dados dos alunos de todos os treinadores
-    trainers = load_trainers()
-    all_students = {}
-    for trainer_login in trainers:
-        data = load_trainer_students(trainer_login)
-        all_students.update(data["students"])
-    
     # Estado da sessão para controlar se o aluno já fez login
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
@@ -266,18 +3668,13 @@ def student_interface():
         
         # Botão para acessar treinos
         if st.button("🚀 Acessar Treinos"):
-            # Encontrar o aluno pelo login
+            # Encontrar o aluno pelo login (consulta ao índice + leitura de um único arquivo)
             student = None
-            for trainer_login in trainers:
-                data = load_trainer_students(trainer_login)
-                for student_id, student_info in data["students"].items():
-                    if student_info.get("login") == student_login:  # Verifica o login
-                        student = student_info
-                        st.session_state.student_id = student_id
-                        st.session_state.trainer_login = trainer_login  # Salva o login do treinador
-                        break
-                if student:
-                    break
+            trainer_login, student_id, data = find_student("login", student_login)
+            if trainer_login:
+                student = data["students"][student_id]
+                st.session_state.student_id = student_id
+                st.session_state.trainer_login = trainer_login  # Salva o login do treinador
             
             if student:
                 # Salvar o login se a caixa "Lembrar do Login" estiver marcada
@@ -300,6 +3697,8 @@ def student_interface():
         
         # Botão para recuperar senha (menor e abaixo do botão "Acessar Treinos")
         if st.button("🔓 Esqueci minha senha", key="forgot_password_button"):
+            st.session_state.password_recovery = True
+        if st.session_state.get("password_recovery"):
             with st.form("forgot_password_form"):
                 st.write("🔐 Recuperação de Senha")
                 recovery_email = st.text_input("Digite seu e-mail para recuperar a senha")
@@ -307,26 +3706,35 @@ def student_interface():
                 
                 if submitted:
                     student = None
-                    for trainer_login in trainers:
-                        data = load_trainer_students(trainer_login)
-                        for student_id, student_info in data["students"].items():
-                            if student_info.get("email") == recovery_email:  # Verifica o e-mail
-                                student = student_info
-                                break
-                        if student:
-                            break
+                    trainer_login, student_id, data = find_student("email", recovery_email)
+                    if trainer_login:
+                        student = data["students"][student_id]
                     
                     if student:
-                        # Gerar uma nova senha temporária
+                        # Gerar uma senha temporária: a senha atual continua valendo até ela ser usada
                         temp_password = generate_temp_password()
-                        student["password"] = temp_password
+                        student["reset_password"] = get_authenticator().hash(temp_password)
+                        student["reset_expires"] = time.time() + PASSWORD_RESET_SECONDS
                         
-                        # Salvar a nova senha
-                        save_trainer_students(trainer_login, data)
-                        st.success(f"✅ Um e-mail foi enviado para {recovery_email} com a nova senha temporária: **{temp_password}**")
-                        st.info("🔑 Use esta senha para fazer login e altere-a após o acesso.")
+                        # Salvar a senha temporária
+                        commit_trainer_students(trainer_login, data)
+                        # O e-mail é enviado em segundo plano (com novas tentativas em caso de falha)
+                        st.session_state.recovery_job = enqueue_job("send_email", {
+                            "to": recovery_email,
+                            "subject": "Recuperação de senha",
+                            "body": f"Sua nova senha temporária é: {temp_password}\n"
+                                    f"Ela vale por {PASSWORD_RESET_SECONDS // 3600} hora(s) e passa a ser a sua senha "
+                                    "no primeiro login; até lá a senha atual continua valendo.",
+                        }, label=f"Recuperação de senha: {recovery_email}")
                     else:
                         st.error("❌ E-mail do Aluno não encontrado.")
+            if st.session_state.get("recovery_job"):
+                job = show_job_status(st.session_state.recovery_job)
+                if job is not None and job["status"] == "done" and not job["result"].get("delivered", True):
+                    st.warning("⚠️ O envio de e-mails não está configurado neste servidor. Procure o seu treinador.")
+                elif job is not None and job["status"] == "done":
+                    st.success(f"✅ Um e-mail foi enviado para {job['result']['to']} com a nova senha temporária.")
+                    st.info("🔑 Use esta senha para fazer login e altere-a após o acesso.")
         
         # Se for o primeiro acesso, mostrar formulário para definir senha
         if "first_access" in st.session_state and st.session_state.first_access:
@@ -340,8 +3748,8 @@ def student_interface():
                     if new_password == confirm_password:
                         # Salvar a senha no perfil do aluno
                         data = load_trainer_students(st.session_state.trainer_login)
-                        data["students"][st.session_state.student_id]["password"] = new_password
-                        save_trainer_students(st.session_state.trainer_login, data)
+                        data["students"][st.session_state.student_id]["password"] = get_authenticator().hash(new_password)
+                        commit_trainer_students(st.session_state.trainer_login, data)
                         st.session_state.logged_in = True
                         st.session_state.first_access = False
                         st.rerun()  # Recarrega a página para esconder o formulário de senha
@@ -353,9 +3761,8 @@ def student_interface():
             password = st.text_input("🔑 Digite sua senha", type="password")
             
             if st.button("🔓 Confirmar Senha"):
-                data = load_trainer_students(st.session_state.trainer_login)
-                student = data["students"][st.session_state.student_id]
-                if password == student["password"]:
+                if get_authenticator().authenticate(
+                        "student", (st.session_state.trainer_login, st.session_state.student_id), password):
                     st.session_state.logged_in = True
                     st.rerun()  # Recarrega a página para esconder a caixa de login
                 else:
@@ -364,6 +3771,8 @@ def student_interface():
         # Aluno já fez login, exibir treinos
         data = load_trainer_students(st.session_state.trainer_login)
         student = data["students"][st.session_state.student_id]
+        detail = load_student_detail(st.session_state.trainer_login, st.session_state.student_id)
+        library = load_templates(st.session_state.trainer_login)
         
         st.header(f"👤 Aluno: {student['name']}")
         col1, col2, col3 = st.columns(3)
@@ -374,13 +3783,9 @@ def student_interface():
         with col3:
             st.metric("Treinos Realizados", student["completed_workouts"])
         
-        # Exibir histórico de peso em uma tabela
+        # Exibir histórico de peso (estatísticas e gráfico)
         st.subheader("📊 Histórico de Peso")
-        if student["weight_history"]:
-            weight_history_df = pd.DataFrame(student["weight_history"])
-            st.dataframe(weight_history_df)
-        else:
-            st.info("Nenhum dado de peso registrado.")
+        weight_history_panel(st.session_state.trainer_login, st.session_state.student_id)
         
         # Botão para sair
         if st.button("🚪 Sair"):
@@ -391,26 +3796,87 @@ def student_interface():
         
         # Exibir treinos do aluno
         st.header("📝 Treinos do Aluno")
-        if not student["workouts"]:
+        if not detail["workouts"]:
             st.info("Nenhum treino disponível no momento.")
         else:
-            for i, workout in enumerate(student["workouts"]):
-                if not workout.get("hidden", False):  # Exibir apenas treinos não ocultos
+            for i, workout in enumerate(detail["workouts"]):
+                workout = resolve_workout(workout, library)
+                if not workout.get("hidden", False):  # Treinos ocultos de diários antigos ainda não migrados
                     with st.expander(f"🏋️‍♂️ Treino: {workout['name']}", expanded=False):
-                        st.write(f"**Descrição:** {workout['description']}")
-                st.write("**Exercícios:**")
-                for j, exercise in enumerate(workout["exercises"]):
-                    completed = st.checkbox(exercise, value=workout["completed"][j], key=f"{workout['name']}_{j}")
-                    workout["completed"][j] = completed
-                    
-                    if st.button(f"✅ Finalizar Treino: {workout['name']}", key=f"finish_{i}"):
-                    # Ocultar o treino ao finalizar
-                     workout["hidden"] = True
-                    student["completed_workouts"] += 1  # Incrementa o contador de treinos realizados
-                    save_trainer_students(st.session_state.trainer_login, data)
-                    st.success("✅ Treino finalizado com sucesso!")
-                    st.rerun()  # Recarrega a página para atualizar a lista de treinos
+                        workout_checklist(st.session_state.trainer_login, st.session_state.student_id, workout["id"],
+                                          f"✅ Finalizar Treino: {workout['name']}")
+
+
+# Senha do painel do administrador (sem ela o painel não é exibido)
+ADMIN_PASSWORD = os.environ.get("PLANOT_ADMIN_PASSWORD")
+
+# Interface do Administrador: totais de todos os treinadores a partir dos relatórios pré-calculados
+def admin_interface():
+    st.title("🏢 Painel do Administrador")
+
+    # Botão para sair
+    if st.button("🚪 Sair"):
+        st.session_state.admin_logged_in = False
+        st.rerun()
+
+    reports = get_storage().load_reports()
+    total = combine_reports(entry["report"] for entry in reports.values())
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Treinadores", len(reports))
+    with col2:
+        st.metric("Alunos", total["students"])
+    with col3:
+        st.metric("Alunos Ativos", total["active_students"])
+    with col4:
+        st.metric("Treinos Realizados", total["completed_workouts"])
+
+    st.subheader("📊 Distribuição de Treinos Realizados")
+    st.bar_chart(pd.Series(total["completed_distribution"], name="Alunos"))
+
+    st.subheader("⚖️ Evolução de Peso")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        average = total["weight_change"] / total["weight_tracked"] if total["weight_tracked"] else 0.0
+        st.metric("Variação Média", f"{average:+.1f} kg")
+    with col2:
+        st.metric("Perderam Peso", total["lost"])
+    with col3:
+        st.metric("Ganharam Peso", total["gained"])
+
+    st.subheader("👨‍🏫 Por Treinador")
+    if reports:
+        st.dataframe(pd.DataFrame([
+            {"treinador": trainer_login, "alunos": entry["report"]["students"],
+             "ativos": entry["report"]["active_students"], "treinos": entry["report"]["completed_workouts"],
+             "variação média (kg)": round(entry["report"]["weight_change"] / entry["report"]["weight_tracked"], 1)
+             if entry["report"]["weight_tracked"] else None}
+            for trainer_login, entry in sorted(reports.items())
+        ]))
+    else:
+        st.info("Nenhum relatório calculado ainda.")
 
+    # A reconstrução roda em segundo plano; a página só acompanha a tarefa
+    if st.button("🔄 Recalcular Relatórios"):
+        st.session_state.rebuild_job = enqueue_job("rebuild_reports", {}, label="Recalcular relatórios")
+    if st.session_state.get("rebuild_job"):
+        job = show_job_status(st.session_state.rebuild_job)
+        if job is not None and job["status"] == "done":
+            st.success(job["result"]["message"])
+
+    st.subheader("📬 Tarefas em Segundo Plano")
+    jobs = get_job_queue().list_jobs()
+    if jobs:
+        show_jobs_table(jobs)
+        failed = [job for job in jobs if job["retriable"]]
+        if failed:
+            job_id = st.selectbox("Tarefa com falha", [job["id"] for job in failed],
+                                  format_func=lambda option: next(job["label"] or job["kind"] for job in failed if job["id"] == option))
+            if st.button("🔁 Tentar novamente"):
+                get_job_queue().retry(job_id)
+                st.rerun()
+    else:
+        st.info("Nenhuma tarefa registrada.")
 
 # Interface de Início
 def home_interface():
@@ -425,6 +3891,8 @@ def home_interface():
         trainer_interface(st.session_state.trainer_login)
     elif st.session_state.logged_in:
         student_interface()
+    elif st.session_state.get("admin_logged_in"):
+        admin_interface()
     else:
         # Layout da tela inicial
         st.title("🏋️‍♂️ Bem-vindo ao App de Treinos")
@@ -447,6 +3915,11 @@ def home_interface():
                 st.session_state.user_type = "Aluno"
                 st.rerun()
         
+        # Acesso do administrador (só se a senha estiver configurada)
+        if ADMIN_PASSWORD and st.button("🏢 Acessar como Administrador"):
+            st.session_state.user_type = "Administrador"
+            st.rerun()
+        
         # Se o usuário escolheu uma opção, exibir o formulário correspondente
         if "user_type" in st.session_state:
             if st.session_state.user_type == "Treinador":
@@ -464,15 +3937,10 @@ def home_interface():
                         
                         if submitted:
                             if password == confirm_password:
-                                trainers = load_trainers()
-                                if login in trainers:
+                                # O cadastro verifica e grava o login de forma atômica
+                                if not register_trainer(login, {"email": email, "password": get_authenticator().hash(password)}):
                                     st.error("❌ Login já existe. Escolha outro login.")
                                 else:
-                                    trainers[login] = {
-                                        "email": email,
-                                        "password": password
-                                    }
-                                    save_trainers(trainers)
                                     st.success("✅ Treinador registrado com sucesso!")
                             else:
                                 st.error("❌ As senhas não coincidem. Tente novamente.")
@@ -486,8 +3954,7 @@ def home_interface():
                         submitted = st.form_submit_button("Login")
                         
                         if submitted:
-                            trainers = load_trainers()
-                            if login in trainers and trainers[login]["password"] == password:
+                            if get_authenticator().authenticate("trainer", login, password):
                                 # Salvar o login se a caixa "Lembrar do Login" estiver marcada
                                 if remember_login:
                                     st.session_state.saved_trainer_login = login
@@ -505,10 +3972,80 @@ def home_interface():
             elif st.session_state.user_type == "Aluno":
                 # Direcionar para a interface do aluno
                 student_interface()
+            
+            elif st.session_state.user_type == "Administrador" and ADMIN_PASSWORD:
+                with st.form("admin_login_form"):
+                    st.write("🔑 Login do Administrador")
+                    password = st.text_input("Senha", type="password")
+                    submitted = st.form_submit_button("Login")
+                    
+                    if submitted:
+                        if hmac.compare_digest(password.encode(), ADMIN_PASSWORD.encode()):
+                            st.session_state.admin_logged_in = True
+                            st.rerun()
+                        else:
+                            st.error("❌ Senha incorreta.")
+
+# Barra lateral de depuração com as medições da execução atual da página
+def show_debug_sidebar(metrics):
+    current = metrics.current
+    with st.sidebar:
+        st.subheader("🐞 Medições desta execução")
+        st.metric("Tempo total", f"{(time.perf_counter() - current['started']) * 1000:.1f} ms")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Lidos", f"{current['bytes_read'] / 1024:.1f} KB")
+        with col2:
+            st.metric("Gravados", f"{current['bytes_written'] / 1024:.1f} KB")
+        with col3:
+            st.metric("Arquivos", current["files_opened"])
+        if current["timings"]:
+            st.dataframe(pd.DataFrame(
+                [{"operação": name, "chamadas": count, "ms": round(seconds * 1000, 2)}
+                 for name, (count, seconds) in sorted(current["timings"].items(), key=lambda item: -item[1][1])]
+            ))
 
 # Menu principal
 def main():
-    home_interface()
+    metrics = get_metrics()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
+    if JOB_WORKER_IN_APP:
+        start_job_worker()
+    metrics.begin_rerun()
+    try:
+        home_interface()
+        if DEBUG_SIDEBAR:
+            show_debug_sidebar(metrics)
+    finally:
+        metrics.end_rerun()
 
 if __name__ == "__main__":
-    main()
+    # python PlanoT.py migrate-sqlite -> migra os arquivos JSON para o banco SQLite
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate-sqlite":
+        print(f"✅ {migrate_json_to_sqlite()} treinador(es) migrado(s) para {SQLITE_DB_FILE}")
+    # python PlanoT.py migrate-schema -> atualiza todos os arquivos JSON para o formato atual
+    elif len(sys.argv) > 1 and sys.argv[1] == "migrate-schema":
+        print(f"✅ {migrate_all_trainer_files()} arquivo(s) atualizado(s) para a versão {SCHEMA_VERSION}")
+    # python PlanoT.py rebuild-reports -> recalcula os relatórios de todos os treinadores (em paralelo)
+    elif len(sys.argv) > 1 and sys.argv[1] == "rebuild-reports":
+        print(f"✅ Relatórios de {rebuild_reports()} treinador(es) recalculados")
+    # python PlanoT.py serve-data -> executa o serviço de dados em PLANOT_DATA_URL (para PLANOT_STORAGE=remote)
+    elif len(sys.argv) > 1 and sys.argv[1] == "serve-data":
+        serve_data()
+    # python PlanoT.py run-jobs -> executa as tarefas em segundo plano (para PLANOT_JOB_WORKER=0)
+    elif len(sys.argv) > 1 and sys.argv[1] == "run-jobs":
+        run_job_worker()
+    # python PlanoT.py extract-templates <treinador> -> transforma treinos repetidos em modelos
+    elif len(sys.argv) == 3 and sys.argv[1] == "extract-templates":
+        print(f"✅ {extract_templates(sys.argv[2])} treino(s) convertido(s) em referências a modelos")
+    # python PlanoT.py import-students <treinador> <arquivo.csv|arquivo.parquet>
+    elif len(sys.argv) == 4 and sys.argv[1] == "import-students":
+        print(f"✅ {import_students(sys.argv[2], sys.argv[3], table_format(sys.argv[3]))} aluno(s) importado(s)")
+    # python PlanoT.py export <treinador> <students|workouts|weights> <arquivo.csv|arquivo.parquet>
+    elif len(sys.argv) == 5 and sys.argv[1] == "export":
+        file_format = table_format(sys.argv[4])
+        with open(sys.argv[4], "wb" if file_format == "parquet" else "w", newline=None if file_format == "parquet" else "") as f:
+            print(f"✅ {export_table(sys.argv[2], sys.argv[3], f, file_format)} linha(s) exportada(s) para {sys.argv[4]}")
+    else:
+        main()
@@ -0,0 +1,249 @@
+# Benchmark e teste de carga dos caminhos de dados do PlanoT.py
+#
+# Gera dados sintéticos (N treinadores x M alunos x K treinos, com históricos de peso longos)
+# num diretório temporário e mede leitura/gravação, busca de login, filtro de busca, eventos
+# do diário e, se o Streamlit estiver instalado, uma execução completa (sem navegador) de cada
+# página via AppTest. Exemplos:
+#
+#   python benchmark.py --trainers 50 --students 200 --workouts 5 --history 365
+#   python benchmark.py --storage sqlite --output resultado.json
+#   python benchmark.py --baseline resultado.json --tolerance 1.5   # falha se ficar 50% mais lento
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PlanoT.py")
+
+FIRST_NAMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Heitor", "Íris", "João",
+               "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael", "Sofia", "Tiago", "Vitória", "Wagner"]
+LAST_NAMES = ["Silva", "Souza", "Oliveira", "Santos", "Pereira", "Lima", "Carvalho", "Ferreira", "Gonçalves", "Araújo"]
+EXERCISES = ["Supino reto 4x10", "Agachamento livre 4x8", "Remada curvada 3x12", "Leg press 4x12",
+             "Desenvolvimento 3x10", "Rosca direta 3x12", "Tríceps corda 3x15", "Prancha 3x60s"]
+
+# Função para gerar os dados sintéticos usando as funções de armazenamento do app
+def generate_data(app, trainers, students, workouts, history, seed):
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=history)
+    logins = []
+    for t in range(trainers):
+        trainer_login = f"treinador{t:04}"
+        app.register_trainer(trainer_login, {"email": f"{trainer_login}@exemplo.com", "password": "senha"})
+        data = app.load_trainer_students(trainer_login)
+        details = {}
+        for _ in range(students):
+            student_id = app.generate_id(data)
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            login = f"{name.split()[0].lower()}_{student_id}"
+            weight = round(rng.uniform(50, 110), 1)
+            data["students"][student_id] = {
+                "name": name,
+                "weight": weight,
+                "height": round(rng.uniform(150, 200), 1),
+                "email": f"{login}.{trainer_login}@exemplo.com",
+                "initial_weight": weight,
+                "login": login,
+                "password": "senha",
+                "completed_workouts": rng.randint(0, 10),
+            }
+            detail = app.new_student_detail()
+            for day in range(history):
+                weight = round(weight + rng.uniform(-0.3, 0.3), 1)
+                app.append_weight(detail, weight, (start + timedelta(days=day)).isoformat())
+            for w in range(workouts):
+                exercises = rng.sample(EXERCISES, rng.randint(3, len(EXERCISES)))
+                detail["workouts"].append({
+                    "id": app.new_workout_id(),
+                    "name": f"Treino {chr(ord('A') + w)}",
+                    "description": "Treino gerado para benchmark",
+                    "exercises": exercises,
+                    "completed": [False] * len(exercises),
+                })
+            details[student_id] = detail
+            logins.append((trainer_login, login))
+        app.save_trainer_students(trainer_login, data)
+        for student_id, detail in details.items():
+            app.save_student_detail(trainer_login, student_id, detail)
+    return logins
+
+# Função para medir uma operação repetida: retorna vazão (op/s) e latências p50/p99 (ms)
+def measure(operation, repeat):
+    samples = []
+    started = time.perf_counter()
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        operation(i)
+        samples.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        "ops": repeat,
+        "throughput": repeat / elapsed if elapsed else float("inf"),
+        "p50_ms": statistics.median(samples),
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+# Função para executar os cenários de dados (sem interface)
+def run_data_benchmarks(app, logins, repeat, seed):
+    rng = random.Random(seed)
+    storage = app.get_storage()
+    trainer_logins = sorted({trainer_login for trainer_login, _ in logins})
+    results = {}
+
+    def pick_trainer(i):
+        return trainer_logins[i % len(trainer_logins)]
+
+    # Leitura sem cache (parse do armazenamento) e com o cache compartilhado
+    results["load_trainer_students_cold"] = measure(lambda i: storage.load_trainer_students(pick_trainer(i)), repeat)
+    results["load_trainer_students_cached"] = measure(lambda i: app.load_trainer_students(pick_trainer(i)), repeat)
+
+    def load_detail(i):
+        trainer_login = pick_trainer(i)
+        student_id = rng.choice(list(app.load_trainer_students(trainer_login)["students"]))
+        storage.load_student_detail(trainer_login, student_id)
+    results["load_student_detail_cold"] = measure(load_detail, repeat)
+
+    # Gravação completa do resumo (o que um cadastro ou edição de aluno custa)
+    def save_summary(i):
+        trainer_login = pick_trainer(i)
+        data = app.load_trainer_students(trainer_login)
+        student = data["students"][rng.choice(list(data["students"]))]
+        student["height"] = round(student["height"] + 0.1, 1)
+        app.save_trainer_students(trainer_login, data)
+    results["save_trainer_students"] = measure(save_summary, repeat)
+
+    # Evento pequeno do diário (marcar um exercício)
+    def toggle_exercise(i):
+        trainer_login = pick_trainer(i)
+        data = app.load_trainer_students(trainer_login)
+        student_id = rng.choice(list(data["students"]))
+        detail = app.load_student_detail(trainer_login, student_id)
+        if not detail["workouts"]:
+            return
+        workout = rng.choice(detail["workouts"])
+        j = rng.randrange(len(workout["exercises"]))
+        app.record_event(trainer_login, data, detail, {
+            "type": "exercise_toggled", "student_id": student_id,
+            "workout_id": workout["id"], "exercise": j, "completed": not workout["completed"][j],
+        })
+    results["record_event_toggle"] = measure(toggle_exercise, repeat)
+
+    # Busca do aluno pelo login (tela de acesso do aluno)
+    results["find_student_login"] = measure(lambda i: app.find_student("login", rng.choice(logins)[1]), repeat)
+
+    # Filtro de busca do treinador
+    terms = [name.lower()[:3] for name in FIRST_NAMES] + ["0", "00", "silva", "ana sil"]
+
+    def search(i):
+        trainer_login = pick_trainer(i)
+        data = app.load_trainer_students(trainer_login)
+        app.get_search_index(trainer_login, data).search(rng.choice(terms), app.SEARCH_RESULT_LIMIT)
+    results["search_students"] = measure(search, repeat)
+    return results
+
+# Função para executar as páginas completas sem navegador (streamlit.testing.v1.AppTest)
+def run_page_benchmarks(logins, repeat):
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("⚠️ Streamlit não instalado: páginas não medidas (pip install streamlit)")
+        return {}
+    trainer_login, student_login = logins[0]
+    app = __import__("PlanoT")
+    trainer_id, student_id, _ = app.find_student("login", student_login)
+    results = {}
+
+    def trainer_page(i):
+        at = AppTest.from_file(APP_FILE, default_timeout=60)
+        at.session_state["trainer_logged_in"] = True
+        at.session_state["trainer_login"] = trainer_login
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    results["rerun_trainer_page"] = measure(trainer_page, repeat)
+
+    def student_page(i):
+        at = AppTest.from_file(APP_FILE, default_timeout=60)
+        at.session_state["logged_in"] = True
+        at.session_state["trainer_login"] = trainer_id
+        at.session_state["student_id"] = student_id
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    results["rerun_student_page"] = measure(student_page, repeat)
+    return results
+
+# Função para comparar com um resultado anterior: lista os cenários cuja p50 piorou além da tolerância
+def compare_with_baseline(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous and result["p50_ms"] > previous["p50_ms"] * tolerance:
+            regressions.append(f"{name}: p50 {previous['p50_ms']:.2f} ms -> {result['p50_ms']:.2f} ms")
+    return regressions
+
+def print_results(results):
+    print(f"{'cenário':<32}{'op/s':>12}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    for name, result in results.items():
+        print(f"{name:<32}{result['throughput']:>12.1f}{result['p50_ms']:>12.3f}{result['p99_ms']:>12.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos caminhos de dados do PlanoT")
+    parser.add_argument("--trainers", type=int, default=20, help="quantidade de treinadores")
+    parser.add_argument("--students", type=int, default=100, help="alunos por treinador")
+    parser.add_argument("--workouts", type=int, default=4, help="treinos por aluno")
+    parser.add_argument("--history", type=int, default=365, help="medições de peso por aluno")
+    parser.add_argument("--repeat", type=int, default=200, help="repetições por cenário de dados")
+    parser.add_argument("--page-repeat", type=int, default=10, help="repetições por página (AppTest)")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json", help="backend de armazenamento")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="grava os resultados neste arquivo JSON")
+    parser.add_argument("--baseline", help="arquivo JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="piora máxima aceita na p50 (1.5 = 50%%)")
+    parser.add_argument("--keep", action="store_true", help="mantém o diretório com os dados gerados")
+    args = parser.parse_args()
+
+    # O app lê a configuração do ambiente ao ser importado e usa o diretório atual para os dados
+    workdir = tempfile.mkdtemp(prefix="planot-bench-")
+    os.environ["PLANOT_STORAGE"] = args.storage
+    os.environ["PLANOT_DB"] = os.path.join(workdir, "planot.db")
+    sys.path.insert(0, os.path.dirname(APP_FILE))
+    os.chdir(workdir)
+
+    try:
+        import PlanoT as app
+        t0 = time.perf_counter()
+        logins = generate_data(app, args.trainers, args.students, args.workouts, args.history, args.seed)
+        print(f"📦 {len(logins)} alunos gerados em {time.perf_counter() - t0:.1f}s ({args.storage}, {workdir})")
+        results = run_data_benchmarks(app, logins, args.repeat, args.seed)
+        results.update(run_page_benchmarks(logins, args.page_repeat))
+        print_results(results)
+
+        report = {"config": vars(args), "results": results}
+        if args.output:
+            with open(os.path.join(os.path.dirname(APP_FILE), args.output) if not os.path.isabs(args.output) else args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        if args.baseline:
+            baseline_path = args.baseline if os.path.isabs(args.baseline) else os.path.join(os.path.dirname(APP_FILE), args.baseline)
+            with open(baseline_path, "r") as f:
+                regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+            if regressions:
+                print("❌ Regressões de desempenho:")
+                for line in regressions:
+                    print(f"   {line}")
+                return 1
+            print("✅ Nenhuma regressão em relação ao baseline")
+        return 0
+    finally:
+        if not args.keep:
+            os.chdir(os.path.dirname(APP_FILE))
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
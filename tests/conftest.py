@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+import streamlit as st
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PlanoT  # noqa: E402
+
+
+# Cada teste roda numa pasta vazia, com o armazenamento JSON e sem os objetos compartilhados do teste anterior
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(PlanoT, "STORAGE_BACKEND", "json")
+    st.cache_resource.clear()
+    yield tmp_path
+    st.cache_resource.clear()
@@ -0,0 +1,146 @@
+import os
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import PlanoT
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "PlanoT.py")
+
+
+@pytest.fixture
+def workout():
+    PlanoT.get_storage().add_trainer("ana", {"email": "ana@example.com", "password": None})
+    detail = PlanoT.new_student_detail()
+    detail["workouts"].append({"id": "w1", "name": "Treino A", "description": "",
+                               "exercises": ["Agachamento", "Supino"], "completed": [False, False]})
+    PlanoT.save_trainer_students("ana", {
+        "schema_version": PlanoT.SCHEMA_VERSION, "version": 0, "events_applied": 0, "last_id": 1,
+        "students": {"001": {"name": "Aluno", "weight": 70.0, "height": 170.0, "email": "aluno@example.com",
+                             "initial_weight": 70.0, "login": "aluno_001", "password": None, "completed_workouts": 0}},
+    }, {"001": detail})
+    return ("ana", "001", "w1")
+
+
+# Uma sessão do treinador com o aluno 001 aberto
+def trainer_session():
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.session_state.trainer_logged_in = True
+    at.session_state.trainer_login = "ana"
+    at.run()
+    next(box for box in at.selectbox if box.label.startswith("Selecione")).select_index(1).run()
+    assert not at.exception
+    return at
+
+
+def stored_marks(trainer_login, student_id):
+    return PlanoT.load_student_detail(trainer_login, student_id)["workouts"][0]["completed"]
+
+
+def test_checklist_rerun_does_not_write_back_a_stale_mark(workout):
+    trainer_login, student_id, workout_id = workout
+    page = trainer_session()
+    page.checkbox[0].check().run()
+    assert stored_marks(trainer_login, student_id) == [True, False]
+
+    # O aluno desmarca pelo aplicativo: a próxima execução da página não pode marcar de novo
+    PlanoT.sync_student(trainer_login, student_id, None,
+                        [{"type": "exercise_toggled", "workout_id": workout_id, "exercise": 0, "completed": False}])
+    page.run()
+
+    assert stored_marks(trainer_login, student_id) == [False, False]
+    assert [box.value for box in page.checkbox] == [False, False]
+
+
+def test_checklist_keeps_marks_from_two_sessions(workout):
+    trainer_login, student_id, _ = workout
+    first, second = trainer_session(), trainer_session()
+    first.checkbox[0].check().run()
+    second.checkbox[1].check().run()
+    first.run()
+
+    assert stored_marks(trainer_login, student_id) == [True, True]
+    assert [box.value for box in first.checkbox] == [True, True]
+
+
+def submit_student_edit(page, name, weight):
+    page.text_input(key="edit_name").input(name)
+    page.number_input(key="edit_weight").set_value(weight)
+    next(button for button in page.button if button.label == "Salvar Alterações").click().run()
+
+
+# Outro processo salva a lista de alunos depois da última leitura desta sessão: o arquivo muda
+# de versão sem mudar de tamanho nem de data, e o cache deste processo continua com a leitura antiga
+def save_from_another_process(trainer_login):
+    filename = f"{trainer_login}_students.json"
+    stat = os.stat(filename)
+    with open(filename) as f:
+        stored = f.read()
+    with open(filename, "w") as f:
+        f.write(stored.replace('"version": 1,', '"version": 2,', 1))
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_conflict_after_a_rerun_is_reported_to_the_user(workout):
+    trainer_login, _, _ = workout
+    page = trainer_session()  # Duas execuções: o armazenamento compartilhado vem da primeira
+    save_from_another_process(trainer_login)
+
+    submit_student_edit(page, "Aluno Editado", 72.0)
+
+    assert not page.exception
+    assert any("alterados em outra sessão" in error.value for error in page.error)
+
+
+def test_student_edit_saves_details_and_weight(workout):
+    trainer_login, student_id, _ = workout
+    page = trainer_session()
+    submit_student_edit(page, "Aluno Editado", 72.0)
+
+    assert not page.exception
+    student = PlanoT.load_trainer_students(trainer_login)["students"][student_id]
+    assert (student["name"], student["weight"]) == ("Aluno Editado", 72.0)
+    assert PlanoT.load_student_detail(trainer_login, student_id)["weight_history"]["weights"] == [72.0]
+
+
+def test_student_edit_conflict_saves_nothing(workout):
+    trainer_login, student_id, _ = workout
+    page = trainer_session()
+    save_from_another_process(trainer_login)
+
+    submit_student_edit(page, "Aluno Editado", 72.0)
+
+    PlanoT.st.cache_resource.clear()  # Relê do armazenamento, sem o cache do processo
+    student = PlanoT.load_trainer_students(trainer_login)["students"][student_id]
+    assert (student["name"], student["weight"]) == ("Aluno", 70.0)
+    assert PlanoT.load_student_detail(trainer_login, student_id)["weight_history"]["weights"] == []
+
+
+def student_options(page):
+    return next(box for box in page.selectbox if box.label.startswith("Selecione")).options
+
+
+def test_student_list_is_paged_and_searchable(monkeypatch):
+    monkeypatch.setenv("PLANOT_STUDENTS_PAGE_SIZE", "5")
+    PlanoT.get_storage().add_trainer("ana", {"email": "ana@example.com", "password": None})
+    data = PlanoT.new_trainer_students()
+    for number in range(1, 13):
+        name = "Maria" if number % 4 == 0 else "Aluno"
+        data["students"][f"{number:03d}"] = {
+            "name": f"{name} {number}", "weight": 70.0, "height": 170.0, "email": "", "initial_weight": 70.0,
+            "login": f"aluno_{number:03d}", "password": None, "completed_workouts": 0}
+    data["last_id"] = 12
+    PlanoT.save_trainer_students("ana", data)
+    page = AppTest.from_file(APP, default_timeout=60)
+    page.session_state.trainer_logged_in = True
+    page.session_state.trainer_login = "ana"
+    page.run()
+
+    assert student_options(page) == ["000 - Nenhum aluno"] + [f"{n:03d} - Aluno {n}" for n in (1, 2, 3)] \
+        + ["004 - Maria 4", "005 - Aluno 5"]
+    page.number_input(key="student_page").set_value(3).run()
+    assert student_options(page) == ["000 - Nenhum aluno", "011 - Aluno 11", "012 - Maria 12"]
+
+    next(box for box in page.text_input if box.label.startswith("🔍 Buscar")).input("mar").run()
+    assert not page.exception
+    assert student_options(page) == ["000 - Nenhum aluno", "012 - Maria 12", "004 - Maria 4", "008 - Maria 8"]
@@ -0,0 +1,915 @@
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+import streamlit as st
+
+import PlanoT
+
+
+# Fila de tarefas: falha -> nova tentativa -> falha definitiva
+
+def run_job(queue, handler):
+    job = queue.claim()
+    try:
+        handler(job["payload"])
+    except Exception as error:
+        queue.fail(job["id"], f"{type(error).__name__}: {error}",
+                   keep_payload=job["kind"] in PlanoT.RETRIABLE_JOBS)
+    else:
+        queue.complete(job["id"], {})
+    return job
+
+
+def failing_handler(payload):
+    raise RuntimeError("servidor indisponível")
+
+
+def stored_payload(queue, job_id):
+    return queue.connect().execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()["payload"]
+
+
+def test_failed_job_is_queued_again_while_attempts_remain(monkeypatch):
+    monkeypatch.setattr(PlanoT, "JOB_RETRY_SECONDS", 0)
+    queue = PlanoT.JobQueue("jobs.db")
+    job_id = queue.enqueue("send_email", {"body": "senha"}, max_attempts=2)
+
+    assert run_job(queue, failing_handler)["attempts"] == 1
+    job = queue.get(job_id)
+    assert job["status"] == "queued"
+    assert job["error"] == "RuntimeError: servidor indisponível"
+    assert stored_payload(queue, job_id) is not None
+
+    assert run_job(queue, failing_handler)["attempts"] == 2
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_failed_job_drops_its_payload():
+    queue = PlanoT.JobQueue("jobs.db")
+    job_id = queue.enqueue("send_email", {"body": "senha"}, max_attempts=1)
+    run_job(queue, failing_handler)
+
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert not job["retriable"]
+    assert stored_payload(queue, job_id) is None
+    queue.retry(job_id)
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_retriable_job_keeps_its_payload_for_retry():
+    queue = PlanoT.JobQueue("jobs.db")
+    job_id = queue.enqueue("export", {"trainer_login": "ana"}, max_attempts=1)
+    run_job(queue, failing_handler)
+
+    assert queue.get(job_id)["retriable"]
+    queue.retry(job_id)
+    job = queue.get(job_id)
+    assert job["status"] == "queued"
+    assert job["attempts"] == 0
+
+
+def test_completed_job_drops_its_payload():
+    queue = PlanoT.JobQueue("jobs.db")
+    job_id = queue.enqueue("send_email", {"body": "senha"})
+    run_job(queue, lambda payload: None)
+
+    assert queue.get(job_id)["status"] == "done"
+    assert stored_payload(queue, job_id) is None
+
+
+@pytest.mark.parametrize("returncode, stdout, stderr, message", [
+    (1, "", "Traceback ... sqlite3.OperationalError: database is locked\n", "database is locked"),
+    (0, "", "", "código 0: nenhuma saída"),
+    (-9, "", "", "código -9: nenhuma saída"),
+])
+def test_rebuild_reports_job_reports_a_failed_child(monkeypatch, returncode, stdout, stderr, message):
+    monkeypatch.setattr(PlanoT.subprocess, "run", lambda *args, **kwargs: PlanoT.subprocess.CompletedProcess(
+        args, returncode, stdout, stderr))
+
+    with pytest.raises(RuntimeError, match=message):
+        PlanoT.rebuild_reports_job({})
+
+
+def test_rebuild_reports_job_returns_the_summary_line(monkeypatch):
+    monkeypatch.setattr(PlanoT.subprocess, "run", lambda *args, **kwargs: PlanoT.subprocess.CompletedProcess(
+        args, 0, "aviso\n✅ Relatórios de 2 treinador(es) recalculados\n", ""))
+
+    assert PlanoT.rebuild_reports_job({}) == {"message": "✅ Relatórios de 2 treinador(es) recalculados"}
+
+
+# Sincronização: validação das alterações enviadas pelo aplicativo do aluno
+
+@pytest.fixture
+def student():
+    PlanoT.save_trainer_students("ana", {
+        "schema_version": PlanoT.SCHEMA_VERSION, "version": 0, "events_applied": 0, "last_id": 1,
+        "students": {"001": {"name": "Aluno", "weight": 70.0, "height": 170.0, "email": "aluno@example.com",
+                             "initial_weight": 70.0, "login": "aluno_001", "password": None, "completed_workouts": 0}},
+    }, {"001": PlanoT.new_student_detail()})
+    return ("ana", "001")
+
+
+def weight_delta(weight, date="2026-01-02"):
+    return {"type": "weight_recorded", "weight": weight, "date": date}
+
+
+def test_sync_records_weight(student):
+    result = PlanoT.sync_student(*student, None, [weight_delta(72.5)])
+
+    assert result["applied"] == 1
+    assert result["snapshot"]["student"]["weight"] == 72.5
+    assert PlanoT.load_student_detail(*student)["weight_history"]["weights"][-1] == 72.5
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_sync_inserts_older_weight_in_date_order(monkeypatch, backend):
+    monkeypatch.setattr(PlanoT, "STORAGE_BACKEND", backend)
+    st.cache_resource.clear()
+    PlanoT.save_trainer_students("ana", {
+        "schema_version": PlanoT.SCHEMA_VERSION, "version": 0, "events_applied": 0, "last_id": 1,
+        "students": {"001": {"name": "Aluno", "weight": 70.0, "height": 170.0, "email": "aluno@example.com",
+                             "initial_weight": 70.0, "login": "aluno_001", "password": None, "completed_workouts": 0}},
+    }, {"001": PlanoT.new_student_detail()})
+    PlanoT.sync_student("ana", "001", None, [weight_delta(72.0, "2026-01-10")])
+
+    # Um lote fora de ordem: só a medição mais nova muda o peso atual
+    result = PlanoT.sync_student("ana", "001", None, [weight_delta(71.0, "2026-01-05"), weight_delta(73.0, "2026-01-12"),
+                                                      weight_delta(72.5, "2026-01-11")])
+
+    assert result["applied"] == 3
+    history = PlanoT.load_student_detail("ana", "001")["weight_history"]
+    assert history == {"dates": ["2026-01-05", "2026-01-10", "2026-01-11", "2026-01-12"],
+                       "weights": [71.0, 72.0, 72.5, 73.0]}
+    assert PlanoT.load_student_detail("ana", "001")["weight_stats"]["latest"] == 73.0
+    assert PlanoT.load_trainer_students("ana")["students"]["001"]["weight"] == 73.0
+    st.cache_resource.clear()  # Relê do armazenamento, sem o cache do processo
+    assert PlanoT.load_student_detail("ana", "001")["weight_history"] == history
+    assert PlanoT.load_trainer_students("ana")["students"]["001"]["weight"] == 73.0
+
+
+def test_sync_ignores_repeated_weight(student):
+    PlanoT.sync_student(*student, None, [weight_delta(72.5)])
+
+    assert PlanoT.sync_student(*student, None, [weight_delta(72.5)])["applied"] == 0
+
+
+@pytest.mark.parametrize("weight", [float("nan"), float("inf"), -70.0, 0, PlanoT.MAX_WEIGHT_KG + 1])
+def test_sync_rejects_weight_out_of_range(student, weight):
+    with pytest.raises(ValueError, match="peso deve estar entre"):
+        PlanoT.sync_student(*student, None, [weight_delta(weight)])
+    assert PlanoT.load_student_detail(*student)["weight_history"]["weights"] == []
+
+
+@pytest.mark.parametrize("delta", [
+    weight_delta("pesado"),
+    weight_delta(70.0, date="02/01/2026"),
+    {"type": "weight_recorded"},
+    {"type": "desconhecido"},
+    "weight_recorded",
+])
+def test_sync_rejects_malformed_delta(student, delta):
+    with pytest.raises(ValueError, match="Alteração 1"):
+        PlanoT.sync_student(*student, None, [weight_delta(71.0), delta])
+    assert PlanoT.load_student_detail(*student)["weight_history"]["weights"] == []
+
+
+def test_sync_rejects_too_many_deltas(student):
+    with pytest.raises(ValueError):
+        PlanoT.sync_student(*student, None, [weight_delta(71.0)] * (PlanoT.SYNC_MAX_DELTAS + 1))
+
+
+def test_sync_reports_missing_workout_as_conflict(student):
+    result = PlanoT.sync_student(*student, None, [{"type": "workout_finished", "workout_id": "nenhum"}])
+
+    assert result["applied"] == 0
+    assert result["conflicts"] == [{"delta": 0, "reason": "workout_missing"}]
+
+
+# Serviço de dados: token do /rpc e requisições inválidas
+
+def respond(service, path, body, headers=None, sync=False):
+    raw = body if isinstance(body, bytes) else json.dumps(body).encode()
+    return asyncio.run(service.respond("POST", path, headers or {}, raw, sync=sync, client="203.0.113.7"))
+
+
+@pytest.fixture
+def service():
+    return PlanoT.DataService(PlanoT.get_storage(), workers=2, token="segredo")
+
+
+@pytest.mark.parametrize("headers", [{}, {"authorization": "Bearer outro"}, {"authorization": "segredo"}])
+def test_rpc_rejects_missing_or_wrong_token(service, headers):
+    status, payload = respond(service, "/rpc", {"calls": [{"method": "load_trainers"}]}, headers)
+
+    assert status == "401 Unauthorized"
+    assert "results" not in payload
+
+
+def test_rpc_accepts_token(service):
+    status, payload = respond(service, "/rpc", {"calls": [{"method": "load_trainers"}]},
+                              {"authorization": "Bearer segredo"})
+
+    assert status == "200 OK"
+    assert payload == {"results": [{"result": {}}]}
+
+
+@pytest.mark.parametrize("body", [b"{", b"[]", b"{}", b'{"calls": 3}', b"\xff"])
+def test_rpc_rejects_malformed_body(service, body):
+    status, _ = respond(service, "/rpc", body, {"authorization": "Bearer segredo"})
+
+    assert status == "400 Bad Request"
+
+
+def test_rpc_rejects_unknown_method(service):
+    _, payload = respond(service, "/rpc", {"calls": [{"method": "__init__"}]}, {"authorization": "Bearer segredo"})
+
+    assert payload["results"][0]["error"] == "ValueError"
+
+
+def test_sync_routes_are_only_served_on_the_sync_listener(service):
+    assert respond(service, "/sync/login", {"login": "aluno_001", "password": "x"})[0] == "404 Not Found"
+    assert respond(service, "/rpc", {"calls": []}, {"authorization": "Bearer segredo"}, sync=True)[0] == "404 Not Found"
+
+
+def test_sync_login_backs_off_after_repeated_failures(service, student):
+    for _ in range(PlanoT.SYNC_LOGIN_FREE_ATTEMPTS):
+        assert respond(service, "/sync/login", {"login": "aluno_001", "password": "x"}, sync=True)[0] \
+            == "401 Unauthorized"
+
+    status, payload = respond(service, "/sync/login", {"login": "aluno_001", "password": "x"}, sync=True)
+    assert status == "429 Too Many Requests"
+    assert payload["retry_after"] >= 1
+
+
+@pytest.mark.parametrize("url", ["http://0.0.0.0:8765", "http://192.0.2.10:8765", "http://servidor:8765"])
+def test_serve_data_requires_token_off_loopback(monkeypatch, url):
+    monkeypatch.setattr(PlanoT, "DATA_SERVICE_TOKEN", None)
+
+    with pytest.raises(ValueError, match="PLANOT_DATA_TOKEN"):
+        PlanoT.serve_data(url)
+
+
+@pytest.mark.parametrize("url", ["http://127.0.0.1:8765", "http://localhost:8765", "http://[::1]:8765",
+                                 "unix:///tmp/planot.sock"])
+def test_loopback_addresses(url):
+    assert PlanoT.is_loopback_address(PlanoT.parse_data_address(url))
+
+
+# Serviço de dados escutando de verdade (socket Unix, na pasta do teste), num laço de eventos à parte
+
+@contextlib.contextmanager
+def running_service(url, sync=False):
+    service = PlanoT.DataService(PlanoT.JSONStorage(), workers=4, token=None)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.listen(url, sync=sync))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        # Fecha o serviço e as conexões ainda abertas antes de parar o laço de eventos
+        async def stop():
+            server.close()
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def raw_exchange(path, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(5)
+        conn.connect(path)
+        conn.sendall(request)
+        received = b""
+        while chunk := conn.recv(65536):
+            received += chunk
+        return received
+
+
+@pytest.mark.parametrize("sync", [False, True])
+def test_service_rejects_oversized_body_without_reading_it(workdir, sync):
+    path = str(workdir / "data.sock")
+    limit = PlanoT.SYNC_MAX_BODY if sync else PlanoT.DATA_MAX_BODY
+    with running_service(f"unix://{path}", sync=sync):
+        response = raw_exchange(path, f"POST /rpc HTTP/1.1\r\nContent-Length: {limit + 1}\r\n\r\n".encode())
+
+    assert response.startswith(b"HTTP/1.1 413 ")
+
+
+def test_service_closes_stalled_connections(workdir, monkeypatch):
+    monkeypatch.setattr(PlanoT, "DATA_SERVICE_TIMEOUT", 0.2)
+    path = str(workdir / "data.sock")
+    with running_service(f"unix://{path}"):
+        started = time.monotonic()
+        # Cabeçalhos anunciam um corpo que nunca chega
+        response = raw_exchange(path, b"POST /rpc HTTP/1.1\r\nContent-Length: 100\r\n\r\n{")
+
+    assert response == b""
+    assert time.monotonic() - started < 3
+
+
+# Armazenamento remoto: as chamadas passam pelo serviço de dados
+
+@pytest.fixture
+def remote(workdir, monkeypatch):
+    url = f"unix://{workdir / 'data.sock'}"
+    with running_service(url):
+        monkeypatch.setattr(PlanoT, "STORAGE_BACKEND", "remote")
+        monkeypatch.setattr(PlanoT, "DATA_SERVICE_URL", url)
+        st.cache_resource.clear()
+        yield
+
+
+def test_remote_storage_round_trip(remote):
+    assert isinstance(PlanoT.get_storage(), PlanoT.RemoteStorage)
+    PlanoT.get_storage().add_trainer("ana", {"email": "ana@example.com", "password": None})
+    data = PlanoT.new_trainer_students()
+    data["students"]["001"] = {"name": "Maria", "weight": 60.0, "height": 165.0, "email": "maria@example.com",
+                               "initial_weight": 60.0, "login": "maria_001", "password": None, "completed_workouts": 0}
+    data["last_id"] = 1
+    PlanoT.save_trainer_students("ana", data, {"001": PlanoT.new_student_detail()})
+
+    assert PlanoT.unique_student_logins(PlanoT.new_trainer_students(), {"002": "maria_001"}) == {"002": "maria_001_2"}
+    with open("alunos.csv", "w", newline="") as f:
+        f.write("name,weight,height,email\nMaria Souza,61,166,souza@example.com\nJoão,80,180,joao@example.com\n")
+    assert PlanoT.import_students("ana", "alunos.csv", "csv") == 2
+
+    students = PlanoT.load_trainer_students("ana")["students"]
+    assert sorted(student["login"] for student in students.values()) == ["joão_003", "maria_001", "maria_002"]
+    assert PlanoT.find_student("login", "maria_002")[:2] == ("ana", "002")
+
+
+def roster_with(*logins):
+    data = PlanoT.new_trainer_students()
+    for number, login in enumerate(logins, 1):
+        data["students"][f"{number:03d}"] = {
+            "name": login, "weight": 70.0, "height": 170.0, "email": None, "initial_weight": 70.0,
+            "login": login, "password": None, "completed_workouts": 0}
+    data["last_id"] = len(logins)
+    return data
+
+
+def test_find_student_sees_student_saved_without_index_update():
+    storage = PlanoT.get_storage()
+    storage.add_trainer("ana", {"email": "ana@example.com", "password": None})
+    storage.save_trainer_students("ana", roster_with("maria_001"))
+    assert PlanoT.find_student("login", "pedro_002") == (None, None, None)
+
+    # Outro processo grava a lista de alunos e para antes de atualizar o índice
+    data = storage.load_trainer_students("ana")
+    data["students"].update(roster_with("maria_001", "pedro_002")["students"])
+    with open("ana_students.json", "w") as f:
+        json.dump(data, f)
+    index_mtime = os.stat(PlanoT.JSONStorage.STUDENT_INDEX_FILE).st_mtime_ns
+    os.utime("ana_students.json", ns=(index_mtime + 10**9, index_mtime + 10**9))
+
+    assert PlanoT.find_student("login", "pedro_002")[:2] == ("ana", "002")
+    assert PlanoT.find_student("login", "joao_003") == (None, None, None)
+
+
+def test_student_index_updates_after_another_process_rewrites_it():
+    worker, other = PlanoT.JSONStorage(), PlanoT.JSONStorage()
+    worker.add_trainer("ana", {"email": "ana@example.com", "password": None})
+    worker.save_trainer_students("ana", roster_with("maria_001"))
+
+    data = other.load_trainer_students("ana")
+    del data["students"]["001"]
+    other.save_trainer_students("ana", data)
+    assert worker.lookup_student("login", "maria_001") == (None, None)
+
+    data = worker.load_trainer_students("ana")
+    data["students"].update(roster_with("maria_001")["students"])
+    worker.save_trainer_students("ana", data)
+    assert worker.lookup_student("login", "maria_001") == ("ana", "001")
+
+
+# Busca de alunos: IDs por prefixo, nomes por palavras (sem acento) e limite de resultados
+
+@pytest.fixture
+def search_index():
+    names = ["Maria Souza", "Mariana Lima", "João Maria", "Márcio Dias", "Pedro Souza", "Ana Maria Souza"]
+    students = {f"{number:03d}": {"name": name} for number, name in enumerate(names, 1)}
+    students["100"] = {"name": "Zé"}
+    return PlanoT.StudentSearchIndex(students)
+
+
+def test_search_without_term_returns_every_student_by_id(search_index):
+    assert search_index.search("", 10) == ["001", "002", "003", "004", "005", "006", "100"]
+    assert search_index.search(None, 10) == search_index.ids
+
+
+def test_search_by_id_comes_before_names(search_index):
+    assert search_index.search("00", 10)[:6] == ["001", "002", "003", "004", "005", "006"]
+    assert search_index.search("1", 10) == ["100"]
+    assert search_index.search("001", 10) == ["001"]
+
+
+def test_search_by_name_prefix_ignores_case_and_accents(search_index):
+    assert search_index.search("MAR", 10) == ["006", "003", "004", "001", "002"]
+    assert search_index.search("joao", 10) == ["003"]
+    assert search_index.search("marcio", 10) == ["004"]
+
+
+def test_search_ranks_whole_words_before_prefixes(search_index):
+    assert search_index.search("maria", 10) == ["006", "003", "001", "002"]
+
+
+def test_search_requires_every_term(search_index):
+    assert search_index.search("maria souza", 10) == ["006", "001"]
+    assert search_index.search("mar sou", 10) == ["006", "001"]
+    assert search_index.search("maria pedro", 10) == []
+
+
+def test_search_stops_at_the_limit(search_index):
+    assert search_index.search("souza", 2) == ["006", "001"]
+    assert search_index.search("0", 4) == ["001", "002", "003", "004"]
+    # Sem termo a lista inteira é paginada pela página do treinador
+    assert len(search_index.search("", 3)) == 7
+
+
+def test_search_index_is_rebuilt_only_when_the_roster_is_saved():
+    data = {"version": 1, "students": {"001": {"name": "Maria"}}}
+    index = PlanoT.get_search_index("ana", data)
+
+    data["events_applied"] = 5
+    assert PlanoT.get_search_index("ana", data) is index
+    data["students"]["002"] = {"name": "João"}
+    assert PlanoT.get_search_index("ana", data).search("joao", 10) == ["002"]
+    data["version"] = 2
+    assert PlanoT.get_search_index("ana", data) is not index
+
+
+# Histórico de peso em colunas: estatísticas mantidas a cada medição e gráfico reduzido
+
+def test_weight_stats_follow_every_recorded_weight():
+    detail = PlanoT.new_student_detail()
+    weights = [70.0 + (day % 9) - day / 10 for day in range(1, 41)]
+    for day, weight in enumerate(weights, 1):
+        PlanoT.append_weight(detail, weight, f"2026-01-{day:02d}" if day <= 31 else f"2026-02-{day - 31:02d}")
+        assert detail["weight_stats"] == pytest.approx(PlanoT.compute_weight_stats(detail["weight_history"]))
+
+    stats = detail["weight_stats"]
+    assert (stats["count"], stats["latest"], stats["min"], stats["max"]) == (40, weights[-1], min(weights), max(weights))
+    assert stats["ma7"] == pytest.approx(sum(weights[-7:]) / 7)
+    assert stats["ma30"] == pytest.approx(sum(weights[-30:]) / 30)
+
+
+def test_older_weight_recomputes_the_stats():
+    detail = PlanoT.new_student_detail()
+    PlanoT.append_weight(detail, 70.0, "2026-01-10")
+    PlanoT.append_weight(detail, 72.0, "2026-01-20")
+
+    PlanoT.append_weight(detail, 60.0, "2026-01-01")
+
+    assert detail["weight_history"] == {"dates": ["2026-01-01", "2026-01-10", "2026-01-20"], "weights": [60.0, 70.0, 72.0]}
+    assert (detail["weight_stats"]["latest"], detail["weight_stats"]["min"]) == (72.0, 60.0)
+
+
+def test_chart_keeps_short_histories_and_averages_long_ones():
+    short = {"dates": ["2026-01-01", "2026-01-02"], "weights": [70.0, 71.0]}
+    dates, weights = PlanoT.downsample_weight_history(short, 10)
+    assert dates == short["dates"] and list(weights) == short["weights"]
+
+    history = {"dates": [f"d{i:03d}" for i in range(10)], "weights": [float(i) for i in range(10)]}
+    dates, weights = PlanoT.downsample_weight_history(history, 4)
+    assert dates == ["d001", "d004", "d006", "d009"]
+    assert list(weights) == [0.5, 3.0, 5.5, 8.0]
+
+
+# Importação e exportação em lote
+
+def write_csv(filename, text):
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+
+def read_csv(filename):
+    with open(filename, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.fixture
+def trainers():
+    for trainer_login in ("ana", "bia"):
+        PlanoT.get_storage().add_trainer(trainer_login, {"email": f"{trainer_login}@example.com", "password": None})
+
+
+def test_import_reads_every_chunk_and_cleans_the_rows(trainers):
+    write_csv("alunos.csv", "name,weight,height,email,extra\n"
+                            "Maria Souza,61.5,166,maria@example.com,x\n"
+                            ",70,170,sem-nome@example.com,x\n"
+                            "João,abc,,,x\n"
+                            "Pedro Lima,900,180, pedro@example.com ,x\n"
+                            "Ana,55,160,ana@example.com,x\n")
+
+    assert PlanoT.import_students("ana", "alunos.csv", batch_size=2) == 4
+
+    data = PlanoT.load_trainer_students("ana")
+    assert data["last_id"] == 4
+    students = [(student_id, info["name"], info["weight"], info["height"], info["email"], info["login"])
+                for student_id, info in sorted(data["students"].items())]
+    assert students == [("001", "Maria Souza", 61.5, 166.0, "maria@example.com", "maria_001"),
+                        ("002", "João", 0.0, 0.0, "", "joão_002"),
+                        ("003", "Pedro Lima", 0.0, 180.0, "pedro@example.com", "pedro_003"),
+                        ("004", "Ana", 55.0, 160.0, "ana@example.com", "ana_004")]
+    assert PlanoT.load_student_detail("ana", "001")["weight_history"]["weights"] == [61.5]
+    assert PlanoT.find_student("login", "pedro_003")[:2] == ("ana", "003")
+
+
+def test_import_without_name_column_saves_nothing(trainers):
+    write_csv("alunos.csv", "nome,weight\nMaria,60\n")
+
+    with pytest.raises(ValueError, match="name"):
+        PlanoT.import_students("ana", "alunos.csv")
+    assert PlanoT.load_trainer_students("ana")["students"] == {}
+
+
+def test_imported_logins_do_not_repeat_other_trainers_logins(trainers):
+    write_csv("alunos.csv", "name\nMaria\nJoão\n")
+    PlanoT.import_students("ana", "alunos.csv")
+    data = PlanoT.load_trainer_students("bia")
+    data["students"]["009"] = {"name": "Maria", "weight": 0.0, "height": 0.0, "email": "", "initial_weight": 0.0,
+                               "login": "maria_001_2", "password": None, "completed_workouts": 0}
+    PlanoT.save_trainer_students("bia", data)
+
+    assert PlanoT.import_students("bia", "alunos.csv") == 2
+
+    logins = {info["login"] for info in PlanoT.load_trainer_students("bia")["students"].values()}
+    assert logins == {"maria_001_2", "maria_001_3", "joão_002_2"}
+    assert PlanoT.find_student("login", "maria_001")[:2] == ("ana", "001")
+    assert PlanoT.find_student("login", "maria_001_3")[:2] == ("bia", "001")
+
+
+def test_exported_students_import_back_unchanged(trainers):
+    write_csv("alunos.csv", "name,weight,height,email\nMaria Souza,61.5,166,maria@example.com\nJoão,80,180,\n")
+    PlanoT.import_students("ana", "alunos.csv")
+
+    assert PlanoT.export_to_file("ana", "students", "csv", "exportados.csv") == 2
+    exported = read_csv("exportados.csv")
+    assert [row["login"] for row in exported] == ["maria_001", "joão_002"]
+    assert PlanoT.import_students("bia", "exportados.csv") == 2
+
+    def columns(trainer_login):
+        return [(info["name"], info["weight"], info["height"], info["email"])
+                for _, info in sorted(PlanoT.load_trainer_students(trainer_login)["students"].items())]
+    assert columns("bia") == columns("ana")
+
+
+def test_workouts_and_weights_are_exported_one_row_per_item(trainers):
+    PlanoT.save_trainer_students("ana", roster_with("maria_001"))
+    detail = PlanoT.load_student_detail("ana", "001")
+    detail["workouts"].append({"id": "w1", "name": "Treino A", "description": "", "exercises": ["Agachamento", "Supino"],
+                               "completed": [True, False]})
+    PlanoT.append_weight(detail, 70.0, "2026-01-01")
+    PlanoT.append_weight(detail, 69.0, "2026-02-01")
+    PlanoT.save_student_detail("ana", "001", detail)
+
+    assert PlanoT.export_to_file("ana", "workouts", "csv", "treinos.csv") == 2
+    assert [(row["workout"], row["position"], row["exercise"], row["completed"]) for row in read_csv("treinos.csv")] \
+        == [("Treino A", "0", "Agachamento", "True"), ("Treino A", "1", "Supino", "False")]
+    assert PlanoT.export_to_file("ana", "weights", "csv", "pesos.csv") == 2
+    assert [(row["date"], float(row["weight"])) for row in read_csv("pesos.csv")] == [("2026-01-01", 70.0), ("2026-02-01", 69.0)]
+
+
+def test_parquet_round_trip(trainers):
+    pytest.importorskip("pyarrow")
+    write_csv("alunos.csv", "name,weight,height,email\nMaria Souza,61.5,166,maria@example.com\n")
+    PlanoT.import_students("ana", "alunos.csv")
+
+    assert PlanoT.export_to_file("ana", "students", "parquet", "alunos.parquet") == 1
+    assert PlanoT.import_students("bia", "alunos.parquet", "parquet") == 1
+    assert PlanoT.load_trainer_students("bia")["students"]["001"]["weight"] == 61.5
+
+
+# Relatórios pré-calculados
+
+def test_trainer_report_counts_workouts_and_weight_change():
+    data = roster_with("a", "b", "c", "d")
+    students = data["students"]
+    students["001"].update(completed_workouts=0, initial_weight=70.0, weight=70.0)
+    students["002"].update(completed_workouts=3, initial_weight=80.0, weight=76.0)
+    students["003"].update(completed_workouts=12, initial_weight=60.0, weight=62.5)
+    students["004"].update(completed_workouts=25, initial_weight=None, weight=90.0)
+
+    report = PlanoT.build_trainer_report(data)
+
+    assert (report["students"], report["active_students"], report["completed_workouts"]) == (4, 3, 40)
+    assert report["completed_distribution"] == {"0": 1, "1-4": 1, "5-9": 0, "10-19": 1, "20+": 1}
+    assert (report["weight_tracked"], report["weight_change"], report["gained"], report["lost"]) == (3, -1.5, 1, 1)
+    total = PlanoT.combine_reports([report, PlanoT.build_trainer_report(roster_with("e"))])
+    assert (total["students"], total["completed_distribution"]["0"], total["weight_change"]) == (5, 2, -1.5)
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_saved_report_is_not_replaced_by_an_older_one(monkeypatch, backend):
+    monkeypatch.setattr(PlanoT, "STORAGE_BACKEND", backend)
+    storage = PlanoT.get_storage()
+    storage.save_trainer_report("ana", (2, 0), {"students": 2})
+    storage.save_trainer_report("ana", (1, 5), {"students": 1})
+    assert storage.load_reports() == {"ana": {"version": [2, 0], "report": {"students": 2}}}
+
+    storage.save_trainer_report("ana", (2, 1), {"students": 3})
+    assert storage.load_reports()["ana"]["report"] == {"students": 3}
+
+
+def test_saving_and_recording_keep_the_report_current(trainers):
+    PlanoT.save_trainer_students("ana", roster_with("maria_001", "joão_002"))
+    data = PlanoT.load_trainer_students("ana")
+    PlanoT.record_event("ana", data, None, {"type": "workout_finished", "student_id": "001", "workout_id": "w1",
+                                            "action": "remove"})
+
+    entry = PlanoT.get_storage().load_reports()["ana"]
+    assert entry["version"] == [1, 1]
+    assert entry["report"] == PlanoT.build_trainer_report(PlanoT.load_trainer_students("ana"))
+    assert entry["report"]["completed_workouts"] == 1
+
+
+def test_rebuild_reports_recomputes_every_trainer(trainers):
+    PlanoT.save_trainer_students("ana", roster_with("maria_001", "joão_002"))
+    PlanoT.save_trainer_students("bia", roster_with("pedro_001"))
+    storage = PlanoT.get_storage()
+    storage.save_trainer_report("ana", (9, 9), {"students": 99})
+    storage.save_trainer_report("caio", (1, 0), {"students": 1})
+
+    assert PlanoT.rebuild_reports(workers=1) == 2
+
+    reports = storage.load_reports()
+    assert sorted(reports) == ["ana", "bia"]
+    assert reports["ana"] == {"version": [1, 0], "report": PlanoT.build_trainer_report(storage.load_trainer_students("ana"))}
+    assert reports["bia"]["report"]["students"] == 1
+
+
+def test_legacy_reports_file_is_split_per_trainer():
+    with open(PlanoT.JSONStorage.LEGACY_REPORTS_FILE, "w") as f:
+        json.dump({"ana": {"version": [1, 0], "report": {"students": 2}}}, f)
+
+    assert PlanoT.JSONStorage().load_reports() == {"ana": {"version": [1, 0], "report": {"students": 2}}}
+    assert not os.path.exists(PlanoT.JSONStorage.LEGACY_REPORTS_FILE)
+    assert os.path.exists(os.path.join(PlanoT.JSONStorage.REPORTS_DIR, "ana.json"))
+
+
+# Modelos de treino e catálogo de exercícios
+
+def test_catalog_reuses_exercises_regardless_of_case_and_accents():
+    library = PlanoT.new_template_library()
+
+    first = PlanoT.catalog_exercises(library, ["Supino", "Elevação lateral"])
+    second = PlanoT.catalog_exercises(library, ["supino ", "ELEVACAO LATERAL", "Remada"])
+
+    assert second == first + ["3"]
+    assert library["exercises"] == {"1": "Supino", "2": "Elevação lateral", "3": "Remada"}
+
+
+def test_workout_follows_its_template_and_keeps_its_own_fields():
+    library = PlanoT.new_template_library()
+    template_id = PlanoT.save_template(library, "Pernas", "Dia 1", ["Agachamento", "Leg press"])
+    workout = PlanoT.new_template_workout(library, template_id)
+    workout["completed"][0] = True
+
+    assert PlanoT.resolve_workout(workout, library) == dict(
+        workout, name="Pernas", description="Dia 1", exercises=["Agachamento", "Leg press"], completed=[True, False])
+    assert PlanoT.resolve_workout(dict(workout, description="Só hoje"), library)["description"] == "Só hoje"
+
+    PlanoT.save_template(library, "Pernas", "Dia 1", ["Agachamento", "Leg press", "Panturrilha"], template_id)
+    assert PlanoT.resolve_workout(workout, library)["completed"] == [True, False, False]
+    PlanoT.save_template(library, "Pernas", "Dia 1", ["Agachamento"], template_id)
+    assert PlanoT.resolve_workout(workout, library)["completed"] == [True]
+
+    del library["templates"][template_id]
+    assert PlanoT.resolve_workout(workout, library)["name"] == "Treino sem modelo"
+    plain = {"id": "w1", "name": "Livre", "description": "", "exercises": ["Remada"], "completed": [False]}
+    assert PlanoT.resolve_workout(plain, library) is plain
+
+
+def test_mark_on_an_exercise_added_to_the_template_is_kept():
+    detail = PlanoT.new_student_detail()
+    detail["workouts"].append({"id": "w1", "template_id": "t1", "completed": [False]})
+
+    PlanoT.apply_detail_event(detail, {"type": "exercise_toggled", "student_id": "001", "workout_id": "w1",
+                                       "exercise": 2, "completed": True})
+
+    assert detail["workouts"][0]["completed"] == [False, False, True]
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_extract_templates_replaces_repeated_workouts(monkeypatch, backend):
+    monkeypatch.setattr(PlanoT, "STORAGE_BACKEND", backend)
+    PlanoT.save_trainer_students("ana", roster_with("maria_001", "joão_002", "pedro_003"))
+    routines = {"001": ["Agachamento", "Leg press"], "002": ["Agachamento", "Leg press"], "003": ["Remada"]}
+    for student_id, exercises in routines.items():
+        detail = PlanoT.load_student_detail("ana", student_id)
+        detail["workouts"].append({"id": f"w{student_id}", "name": "Pernas", "description": "", "exercises": exercises,
+                                   "completed": [True] + [False] * (len(exercises) - 1)})
+        PlanoT.save_student_detail("ana", student_id, detail)
+
+    assert PlanoT.extract_templates("ana") == 2
+
+    st.cache_resource.clear()
+    library = PlanoT.load_templates("ana")
+    [template] = library["templates"].values()
+    assert [library["exercises"][exercise_id] for exercise_id in template["exercises"]] == ["Agachamento", "Leg press"]
+    for student_id in ("001", "002"):
+        [workout] = PlanoT.load_student_detail("ana", student_id)["workouts"]
+        assert "exercises" not in workout
+        assert PlanoT.resolve_workout(workout, library)["exercises"] == ["Agachamento", "Leg press"]
+        assert PlanoT.resolve_workout(workout, library)["completed"] == [True, False]
+    assert "template_id" not in PlanoT.load_student_detail("ana", "003")["workouts"][0]
+    assert PlanoT.extract_templates("ana") == 0
+
+
+# Histórico de treinos por mês
+
+def test_sessions_are_grouped_by_month_newest_first():
+    sessions = [{"finished_at": "2026-01-31T20:00:00"}, {"finished_at": "2025-12-01T08:00:00"}, {"finished_at": None}]
+
+    assert [PlanoT.history_period(session) for session in sessions] == ["2026-01", "2025-12", PlanoT.LEGACY_HISTORY_PERIOD]
+    assert PlanoT.sort_history_periods(["2025-12", PlanoT.LEGACY_HISTORY_PERIOD, "2026-01"]) \
+        == ["2026-01", "2025-12", PlanoT.LEGACY_HISTORY_PERIOD]
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_finished_workouts_are_read_back_by_month(monkeypatch, backend):
+    monkeypatch.setattr(PlanoT, "STORAGE_BACKEND", backend)
+    PlanoT.save_trainer_students("ana", roster_with("maria_001"))
+    detail = PlanoT.load_student_detail("ana", "001")
+    for name in ("Pernas", "Costas", "Braços"):
+        detail["workouts"].append({"id": name.lower(), "name": name, "description": "", "exercises": ["Exercício"],
+                                   "completed": [True]})
+    PlanoT.save_student_detail("ana", "001", detail)
+
+    data, detail = PlanoT.load_trainer_students("ana"), PlanoT.load_student_detail("ana", "001")
+    for workout, finished_at in zip(list(detail["workouts"]), ["2026-01-05T08:00:00", "2026-02-01T08:00:00",
+                                                               "2026-01-20T08:00:00"]):
+        PlanoT.record_event("ana", data, detail, {
+            "type": "workout_finished", "student_id": "001", "workout_id": workout["id"], "action": "archive",
+            "session": PlanoT.workout_session(workout, finished_at)})
+
+    assert PlanoT.load_student_detail("ana", "001")["workouts"] == []
+    assert PlanoT.load_trainer_students("ana")["students"]["001"]["completed_workouts"] == 3
+    assert PlanoT.load_history_periods("ana", "001") == ["2026-02", "2026-01"]
+    january = PlanoT.load_history("ana", "001", "2026-01")
+    assert [(session["name"], session["workout_id"], session["completed"]) for session in january] \
+        == [("Pernas", "pernas", [True]), ("Braços", "braços", [True])]
+    assert PlanoT.load_history("ana", "001", "2025-12") == []
+
+
+# Autenticação: hashes com parâmetros antigos são regravados no login
+
+@pytest.fixture
+def cheap_hashes(monkeypatch):
+    monkeypatch.setattr(PlanoT, "SCRYPT_N", 2 ** 10)
+    monkeypatch.setattr(PlanoT, "PBKDF2_ITERATIONS", 1000)
+
+
+def pbkdf2_hash(monkeypatch, password):
+    monkeypatch.setattr(PlanoT, "PASSWORD_KDF", "pbkdf2")
+    password_hash = PlanoT.hash_password(password)
+    monkeypatch.setattr(PlanoT, "PASSWORD_KDF", "scrypt")
+    return password_hash
+
+
+def test_verify_password_reports_outdated_hashes(cheap_hashes, monkeypatch):
+    current = PlanoT.hash_password("segredo")
+    assert current.startswith("scrypt$1024$")
+    assert PlanoT.verify_password("segredo", current) == (True, False)
+    assert PlanoT.verify_password("outra", current) == (False, False)
+    assert PlanoT.verify_password("segredo", pbkdf2_hash(monkeypatch, "segredo")) == (True, True)
+    assert PlanoT.verify_password("segredo", "segredo") == (True, True)
+    monkeypatch.setattr(PlanoT, "SCRYPT_N", 2 ** 11)
+    assert PlanoT.verify_password("segredo", current) == (True, True)
+
+
+def test_trainer_pbkdf2_hash_is_rehashed_with_scrypt(cheap_hashes, monkeypatch):
+    storage = PlanoT.get_storage()
+    storage.add_trainer("ana", {"email": "ana@example.com", "password": pbkdf2_hash(monkeypatch, "segredo")})
+    authenticator = PlanoT.Authenticator(storage)
+
+    assert not authenticator.authenticate("trainer", "ana", "errada")
+    assert storage.load_trainers()["ana"]["password"].startswith("pbkdf2_sha256$")
+    assert authenticator.authenticate("trainer", "ana", "segredo")
+
+    stored = storage.load_trainers()["ana"]["password"]
+    assert stored.startswith("scrypt$")
+    assert PlanoT.verify_password("segredo", stored) == (True, False)
+    assert authenticator.authenticate("trainer", "ana", "segredo")
+    assert storage.load_trainers()["ana"]["password"] == stored
+
+
+def test_student_plain_password_is_rehashed(cheap_hashes, trainers):
+    data = roster_with("maria_001")
+    data["students"]["001"]["password"] = "segredo"
+    PlanoT.save_trainer_students("ana", data)
+    authenticator = PlanoT.Authenticator(PlanoT.get_storage())
+
+    assert authenticator.authenticate("student", ("ana", "001"), "segredo")
+
+    stored = PlanoT.get_storage().load_trainer_students("ana")["students"]["001"]["password"]
+    assert stored.startswith("scrypt$") and PlanoT.verify_password("segredo", stored) == (True, False)
+    assert not authenticator.authenticate("student", ("ana", "001"), "outra")
+
+
+def test_cached_credentials_follow_password_changes(cheap_hashes):
+    storage = PlanoT.get_storage()
+    storage.add_trainer("ana", {"email": "ana@example.com", "password": PlanoT.hash_password("antiga")})
+    authenticator = PlanoT.Authenticator(storage)
+    assert authenticator.authenticate("trainer", "ana", "antiga")
+
+    PlanoT.JSONStorage().set_trainer_password("ana", PlanoT.hash_password("nova"))
+
+    assert not authenticator.authenticate("trainer", "ana", "antiga")
+    assert authenticator.authenticate("trainer", "ana", "nova")
+    assert not authenticator.authenticate("trainer", "bia", "nova")
+
+
+def test_temporary_password_replaces_the_password_until_it_expires(cheap_hashes, trainers):
+    data = roster_with("maria_001", "joão_002")
+    for student_id, expires in (("001", time.time() + 60), ("002", time.time() - 60)):
+        data["students"][student_id].update(password=PlanoT.hash_password("antiga"),
+                                            reset_password=PlanoT.hash_password("temporaria"), reset_expires=expires)
+    PlanoT.save_trainer_students("ana", data)
+    authenticator = PlanoT.Authenticator(PlanoT.get_storage())
+
+    assert not authenticator.authenticate("student", ("ana", "002"), "temporaria")
+    assert authenticator.authenticate("student", ("ana", "001"), "temporaria")
+
+    student = PlanoT.load_trainer_students("ana")["students"]["001"]
+    assert (student["reset_password"], student["reset_expires"]) == (None, None)
+    assert authenticator.authenticate("student", ("ana", "001"), "temporaria")
+    assert not authenticator.authenticate("student", ("ana", "001"), "antiga")
+
+
+# Benchmark: cenários executados com poucos dados e comparação com um resultado anterior
+
+def test_benchmark_data_scenarios_run_on_generated_data():
+    import benchmark
+
+    logins = benchmark.generate_data(PlanoT, trainers=2, students=3, workouts=2, history=5, seed=1)
+    results = benchmark.run_data_benchmarks(PlanoT, logins, repeat=4, seed=1)
+
+    assert len(logins) == 6
+    assert PlanoT.find_student("login", logins[-1][1])[0] == logins[-1][0]
+    assert set(results) >= {"load_trainer_students_cold", "save_trainer_students", "record_event_toggle",
+                            "find_student_login", "search_students"}
+    assert all(result["ops"] == 4 and result["p99_ms"] >= result["p50_ms"] for result in results.values())
+
+
+def test_benchmark_reports_regressions_beyond_the_tolerance():
+    import benchmark
+
+    baseline = {"results": {"rapido": {"p50_ms": 1.0}, "lento": {"p50_ms": 1.0}}}
+    results = {"rapido": {"p50_ms": 1.4}, "lento": {"p50_ms": 2.0}, "novo": {"p50_ms": 9.0}}
+
+    assert benchmark.compare_with_baseline(results, baseline, 1.5) == ["lento: p50 1.00 ms -> 2.00 ms"]
+
+
+# Instrumentação: medições por execução da página e totais do processo
+
+def test_rerun_record_has_its_own_timings_and_io(monkeypatch, workdir):
+    monkeypatch.setattr(PlanoT, "METRICS_LOG_FILE", str(workdir / "metrics.jsonl"))
+    metrics = PlanoT.Metrics()
+    metrics.count_io(read=100)
+
+    metrics.begin_rerun()
+    with metrics.timed("load"):
+        metrics.count_io(read=10)
+    metrics.count_io(written=5)
+    record = metrics.end_rerun()
+
+    assert (record["bytes_read"], record["bytes_written"], record["files_opened"]) == (10, 5, 2)
+    assert record["timings"]["load"][0] == 1
+    assert (metrics.counters["bytes_read"], metrics.counters["files_opened"], metrics.counters["reruns"]) == (110, 3, 1)
+    with open(workdir / "metrics.jsonl") as f:
+        assert [json.loads(line)["bytes_read"] for line in f] == [10]
+    assert metrics.end_rerun() is None
+
+
+def test_prometheus_text_has_quantiles_and_counters():
+    metrics = PlanoT.Metrics()
+    for seconds in (0.1, 0.2, 0.3):
+        metrics.observe("find_student", seconds)
+    metrics.count_io(read=7)
+
+    text = metrics.prometheus_text()
+
+    assert 'planot_operation_seconds{operation="find_student",quantile="0.5"} 0.200000' in text
+    assert 'planot_operation_seconds_count{operation="find_student"} 3' in text
+    assert "planot_bytes_read_total 7" in text
+
+
+def test_instrumented_functions_are_timed():
+    PlanoT.find_student("login", "ninguem_001")
+
+    assert PlanoT.get_metrics().durations["find_student"][0] == 1
@@ -0,0 +1,611 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import PlanoT
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def storage(request):
+    if request.param == "sqlite":
+        return PlanoT.SQLiteStorage("planot.db")
+    return PlanoT.JSONStorage()
+
+
+def student_info(name, login, weight=70.0):
+    return {"name": name, "weight": weight, "height": 170.0, "email": f"{login}@example.com",
+            "initial_weight": weight, "login": login, "password": None, "completed_workouts": 0}
+
+
+def student_detail(workouts=(), weights=()):
+    detail = PlanoT.new_student_detail()
+    detail["workouts"] = [dict(workout) for workout in workouts]
+    for date, weight in weights:
+        PlanoT.append_weight(detail, weight, date)
+    return detail
+
+
+def roster(**students):
+    data = PlanoT.new_trainer_students()
+    data["students"] = students
+    data["last_id"] = len(students)
+    return data
+
+
+WORKOUT = {"id": "w1", "name": "Treino A", "description": "Pernas",
+           "exercises": ["Agachamento", "Leg press"], "completed": [True, False]}
+
+
+def summaries(data):
+    return {student_id: {field: info.get(field) for field in PlanoT.SQLiteStorage.SUMMARY_FIELDS}
+            for student_id, info in data["students"].items()}
+
+
+def contents(detail):
+    return {field: detail[field] for field in ("workouts", "weight_history", "weight_stats")}
+
+
+# Armazenamentos JSON e SQLite: mesmos dados gravados e lidos
+
+def test_new_roster_is_empty(storage):
+    data = storage.load_trainer_students("ana")
+
+    assert data["students"] == {}
+    assert (data["version"], data["events_applied"], data["last_id"]) == (0, 0, 0)
+    assert contents(storage.load_student_detail("ana", "001")) == contents(PlanoT.new_student_detail())
+
+
+def test_trainers_round_trip(storage):
+    assert storage.add_trainer("ana", {"email": "ana@example.com", "password": "hash"})
+    assert not storage.add_trainer("ana", {"email": "outro@example.com", "password": None})
+    version = storage.get_trainers_version()
+    assert storage.set_trainer_password("ana", "novo")
+    assert not storage.set_trainer_password("bia", "novo")
+
+    assert storage.load_trainers() == {"ana": {"email": "ana@example.com", "password": "novo"}}
+    assert storage.get_trainers_version() != version
+
+
+def test_save_with_new_details_round_trip(storage):
+    data = roster(**{"001": student_info("Maria", "maria_001"), "002": student_info("João", "joão_002", 80.0)})
+    details = {"001": student_detail([WORKOUT], [("2026-01-01", 70.0), ("2026-02-01", 68.5)]),
+               "002": student_detail()}
+
+    version = storage.save_trainer_students("ana", data, details)
+
+    stored = storage.load_trainer_students("ana")
+    assert data["version"] == stored["version"] == 1
+    assert storage.get_version("ana") == version
+    assert summaries(stored) == summaries(data)
+    assert stored["last_id"] == 2
+    assert contents(storage.load_student_detail("ana", "001")) == contents(details["001"])
+    assert {student_id: contents(detail) for student_id, detail in storage.load_student_details("ana", ["001", "002"]).items()} \
+        == {student_id: contents(detail) for student_id, detail in details.items()}
+
+
+def test_save_adds_details_without_touching_existing_students(storage):
+    data = roster(**{"001": student_info("Maria", "maria_001")})
+    first = student_detail([WORKOUT], [("2026-01-01", 70.0)])
+    storage.save_trainer_students("ana", data, {"001": first})
+
+    data = storage.load_trainer_students("ana")
+    data["students"]["002"] = student_info("João", "joão_002", 80.0)
+    data["last_id"] = 2
+    second = student_detail(weights=[("2026-03-01", 80.0)])
+    storage.save_trainer_students("ana", data, {"002": second})
+
+    assert sorted(storage.load_trainer_students("ana")["students"]) == ["001", "002"]
+    assert contents(storage.load_student_detail("ana", "001")) == contents(first)
+    assert contents(storage.load_student_detail("ana", "002")) == contents(second)
+    assert storage.lookup_students("login", ["maria_001", "joão_002", "pedro_003"]) == {
+        "maria_001": ("ana", "001"), "joão_002": ("ana", "002")}
+
+
+def test_save_detail_round_trip(storage):
+    storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}),
+                                  {"001": student_detail([WORKOUT], [("2026-01-01", 70.0)])})
+    detail = storage.load_student_detail("ana", "001")
+    detail["workouts"][0]["completed"] = [True, True]
+    detail["workouts"].append({"id": "w2", "name": "Treino B", "description": "", "exercises": ["Remada"],
+                               "completed": [False]})
+    PlanoT.append_weight(detail, 69.0, "2026-02-01")
+
+    version = storage.save_student_detail("ana", "001", detail)
+
+    stored = storage.load_student_detail("ana", "001")
+    assert stored["version"] == detail["version"] == 1
+    assert storage.get_version("ana", "001") == version
+    assert contents(stored) == contents(detail)
+
+
+def test_deleted_student_loses_details_and_history(storage):
+    data = roster(**{"001": student_info("Maria", "maria_001"), "002": student_info("João", "joão_002")})
+    storage.save_trainer_students("ana", data, {"001": student_detail([WORKOUT]), "002": student_detail()})
+    storage.archive_session("ana", "001", PlanoT.workout_session(WORKOUT, "2026-01-10T08:00:00"))
+
+    data = storage.load_trainer_students("ana")
+    del data["students"]["001"]
+    storage.save_trainer_students("ana", data)
+
+    assert list(storage.load_trainer_students("ana")["students"]) == ["002"]
+    assert storage.load_student_detail("ana", "001")["workouts"] == []
+    assert storage.load_history_periods("ana", "001") == []
+    assert storage.lookup_student("login", "maria_001") == (None, None)
+
+
+def test_backends_store_the_same_data(workdir):
+    results = []
+    for storage in (PlanoT.JSONStorage(), PlanoT.SQLiteStorage("planot.db")):
+        data = roster(**{"001": student_info("Maria", "maria_001"), "002": student_info("João", "joão_002")})
+        storage.save_trainer_students("ana", data, {"001": student_detail([WORKOUT], [("2026-01-01", 70.0)]),
+                                                    "002": student_detail()})
+        storage.append_event("ana", {"type": "exercise_toggled", "student_id": "001", "workout_id": "w1",
+                                     "exercise": 1, "completed": True})
+        storage.append_event("ana", {"type": "weight_recorded", "student_id": "001", "weight": 69.0,
+                                     "date": "2026-02-01", "latest": True})
+        data = storage.load_trainer_students("ana")
+        results.append((summaries(data), data["events_applied"],
+                        {student_id: contents(detail)
+                         for student_id, detail in storage.load_student_details("ana", ["001", "002"]).items()}))
+
+    assert results[0] == results[1]
+    assert results[0][0]["001"]["weight"] == 69.0
+    assert results[0][2]["001"]["workouts"][0]["completed"] == [True, True]
+
+
+# Migrações do formato dos dados
+
+def legacy_trainer_file():
+    return {"students": {
+        "001": {"name": "Maria Souza", "weight": 68.0, "height": 165.0,
+                "weight_history": [{"weight": 70.0, "date": "2025-01-01"}, {"weight": 68.0, "date": "2025-02-01"}],
+                "workouts": [{"name": "Treino A", "description": "", "exercises": ["Agachamento", "Supino"]},
+                             {"name": "Treino B", "description": "", "exercises": ["Remada"], "completed": [True],
+                              "hidden": True}]},
+        "007": {"name": "João", "weight": 80.0, "height": 180.0, "login": "jj", "email": "joao@example.com",
+                "password": "segredo", "completed_workouts": 3, "weight_history": [], "workouts": []},
+    }}
+
+
+def write_json(filename, obj):
+    with open(filename, "w") as f:
+        json.dump(obj, f)
+
+
+def read_file(filename):
+    with open(filename, "rb") as f:
+        return f.read()
+
+
+def test_legacy_json_file_is_migrated_to_the_current_schema():
+    write_json("trainers.json", {"ana": {"email": "ana@example.com", "password": None}})
+    write_json("ana_students.json", legacy_trainer_file())
+    storage = PlanoT.JSONStorage()
+
+    data = storage.load_trainer_students("ana")
+
+    assert data["schema_version"] == PlanoT.SCHEMA_VERSION
+    assert data["last_id"] == 7
+    maria, joao = data["students"]["001"], data["students"]["007"]
+    assert not set(PlanoT.DETAIL_FIELDS) & set(maria)
+    assert (maria["login"], maria["email"], maria["password"], maria["completed_workouts"]) == ("maria_001", "", None, 0)
+    assert (joao["login"], joao["password"], joao["completed_workouts"]) == ("jj", "segredo", 3)
+    assert (maria["initial_weight"], joao["initial_weight"]) == (70.0, 80.0)
+
+    detail = storage.load_student_detail("ana", "001")
+    assert detail["weight_history"] == {"dates": ["2025-01-01", "2025-02-01"], "weights": [70.0, 68.0]}
+    assert detail["weight_stats"] == PlanoT.compute_weight_stats(detail["weight_history"])
+    [workout] = detail["workouts"]
+    assert (workout["name"], workout["completed"]) == ("Treino A", [False, False])
+    assert workout["id"]
+    [session] = storage.load_history("ana", "001", PlanoT.LEGACY_HISTORY_PERIOD)
+    assert (session["name"], session["finished_at"], session["completed"]) == ("Treino B", None, [True])
+    assert storage.lookup_student("login", "maria_001") == ("ana", "001")
+
+
+def test_json_migration_runs_only_once():
+    write_json("ana_students.json", legacy_trainer_file())
+    PlanoT.JSONStorage().load_trainer_students("ana")
+    migrated = read_file("ana_students.json")
+    detail = read_file(PlanoT.JSONStorage().detail_filename("ana", "001"))
+
+    data = PlanoT.JSONStorage().load_trainer_students("ana")
+
+    assert not PlanoT.migrate_trainer_students(data)
+    assert read_file("ana_students.json") == migrated
+    assert read_file(PlanoT.JSONStorage().detail_filename("ana", "001")) == detail
+    assert len(PlanoT.JSONStorage().load_history("ana", "001", PlanoT.LEGACY_HISTORY_PERIOD)) == 1
+
+
+def test_split_details_in_old_format_are_migrated():
+    data = legacy_trainer_file()
+    for number, migration in enumerate(PlanoT.SCHEMA_MIGRATIONS[:3], start=1):
+        migration(data)
+        data["schema_version"] = number
+    details = data.pop("details")
+    write_json("ana_students.json", data)
+    storage = PlanoT.JSONStorage()
+    for student_id, detail in details.items():
+        storage.write_detail("ana", student_id, detail)
+
+    detail = storage.load_student_detail("ana", "001")
+
+    assert storage.load_trainer_students("ana")["schema_version"] == PlanoT.SCHEMA_VERSION
+    assert detail["weight_history"] == {"dates": ["2025-01-01", "2025-02-01"], "weights": [70.0, 68.0]}
+    assert [workout["name"] for workout in detail["workouts"]] == ["Treino A"]
+    assert PlanoT.JSONStorage().load_history_periods("ana", "001") == [PlanoT.LEGACY_HISTORY_PERIOD]
+
+
+def test_migrate_all_trainer_files_skips_current_files():
+    write_json("trainers.json", {"ana": {"email": None, "password": None}, "bia": {"email": None, "password": None}})
+    write_json("ana_students.json", legacy_trainer_file())
+
+    assert PlanoT.migrate_all_trainer_files() == 1
+    assert PlanoT.migrate_all_trainer_files() == 0
+
+
+def test_sqlite_upgrades_from_the_initial_schema(workdir):
+    conn = sqlite3.connect("planot.db")
+    conn.executescript(PlanoT.SQLiteStorage.SCHEMA)
+    conn.execute("INSERT INTO students (trainer_login, student_id, name, weight, login) VALUES ('ana', '001', 'Maria', 68, 'maria_001')")
+    conn.executemany("INSERT INTO weight_history (trainer_login, student_id, weight, date) VALUES ('ana', '001', ?, ?)",
+                     [(70.0, "2025-01-01"), (68.0, "2025-02-01")])
+    for position, (name, hidden) in enumerate([("Treino A", 0), ("Treino B", 1)]):
+        cursor = conn.execute("INSERT INTO workouts (trainer_login, student_id, position, name, description, hidden) "
+                              "VALUES ('ana', '001', ?, ?, '', ?)", (position, name, hidden))
+        conn.execute("INSERT INTO exercises (workout_id, position, name, completed) VALUES (?, 0, 'Remada', ?)",
+                     (cursor.lastrowid, hidden))
+    conn.commit()
+    conn.close()
+
+    storage = PlanoT.SQLiteStorage("planot.db")
+
+    assert storage.connect().execute("PRAGMA user_version").fetchone()[0] == len(PlanoT.SQLiteStorage.UPGRADES)
+    assert storage.load_trainer_students("ana")["students"]["001"]["initial_weight"] == 70.0
+    [workout] = storage.load_student_detail("ana", "001")["workouts"]
+    assert workout["name"] == "Treino A" and workout["id"]
+    [session] = storage.load_history("ana", "001", PlanoT.LEGACY_HISTORY_PERIOD)
+    assert session == {"workout_id": session["workout_id"], "name": "Treino B", "description": "",
+                       "exercises": ["Remada"], "completed": [True]}
+
+
+def test_sqlite_upgrades_run_only_once(workdir):
+    storage = PlanoT.SQLiteStorage("planot.db")
+    storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}),
+                                  {"001": student_detail([WORKOUT], [("2026-01-01", 70.0)])})
+
+    reopened = PlanoT.SQLiteStorage("planot.db")
+
+    assert reopened.connect().execute("PRAGMA user_version").fetchone()[0] == len(PlanoT.SQLiteStorage.UPGRADES)
+    assert reopened.load_trainer_students("ana")["version"] == 1
+    assert contents(reopened.load_student_detail("ana", "001")) == contents(storage.load_student_detail("ana", "001"))
+
+
+def test_json_to_sqlite_migration_can_run_again():
+    json_storage = PlanoT.JSONStorage()
+    json_storage.add_trainer("ana", {"email": "ana@example.com", "password": None})
+    json_storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}),
+                                       {"001": student_detail([WORKOUT], [("2026-01-01", 70.0)])})
+    json_storage.archive_session("ana", "001", PlanoT.workout_session(WORKOUT, "2026-01-10T08:00:00"))
+
+    assert PlanoT.migrate_json_to_sqlite("planot.db") == 1
+    assert PlanoT.migrate_json_to_sqlite("planot.db") == 1
+
+    sqlite = PlanoT.SQLiteStorage("planot.db")
+    assert summaries(sqlite.load_trainer_students("ana")) == summaries(json_storage.load_trainer_students("ana"))
+    assert contents(sqlite.load_student_detail("ana", "001")) == contents(json_storage.load_student_detail("ana", "001"))
+    assert len(sqlite.load_history("ana", "001", "2026-01")) == 1
+
+
+# Gravações concorrentes: quem salva sobre dados desatualizados recebe StaleDataError
+
+def test_second_save_of_the_same_roster_is_stale(storage):
+    storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}), {"001": student_detail()})
+    first, second = storage.load_trainer_students("ana"), storage.load_trainer_students("ana")
+    first["students"]["001"]["name"] = "Maria Souza"
+    second["students"]["001"]["name"] = "Maria Silva"
+
+    storage.save_trainer_students("ana", first)
+    with pytest.raises(PlanoT.StaleDataError):
+        storage.save_trainer_students("ana", second)
+
+    assert storage.load_trainer_students("ana")["students"]["001"]["name"] == "Maria Souza"
+    assert second["version"] == 1
+
+
+def test_roster_save_after_an_event_is_stale(storage):
+    storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}), {"001": student_detail()})
+    data = storage.load_trainer_students("ana")
+    storage.append_event("ana", {"type": "weight_recorded", "student_id": "001", "weight": 69.0, "date": "2026-02-01"})
+
+    with pytest.raises(PlanoT.StaleDataError):
+        storage.save_trainer_students("ana", data)
+    assert storage.load_trainer_students("ana")["students"]["001"]["weight"] == 69.0
+
+
+def test_second_save_of_the_same_detail_is_stale(storage):
+    storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}),
+                                  {"001": student_detail([WORKOUT])})
+    first, second = storage.load_student_detail("ana", "001"), storage.load_student_detail("ana", "001")
+    first["workouts"][0]["name"] = "Treino de pernas"
+    second["workouts"] = []
+
+    storage.save_student_detail("ana", "001", first)
+    with pytest.raises(PlanoT.StaleDataError):
+        storage.save_student_detail("ana", "001", second)
+
+    assert [workout["name"] for workout in storage.load_student_detail("ana", "001")["workouts"]] == ["Treino de pernas"]
+
+
+def test_detail_save_after_an_event_is_stale(storage):
+    storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}),
+                                  {"001": student_detail([WORKOUT])})
+    detail = storage.load_student_detail("ana", "001")
+    storage.append_event("ana", {"type": "exercise_toggled", "student_id": "001", "workout_id": "w1",
+                                 "exercise": 1, "completed": True})
+
+    with pytest.raises(PlanoT.StaleDataError):
+        storage.save_student_detail("ana", "001", detail)
+    assert storage.load_student_detail("ana", "001")["workouts"][0]["completed"] == [True, True]
+
+
+def test_second_save_of_the_same_templates_is_stale(storage):
+    first, second = storage.load_templates("ana"), storage.load_templates("ana")
+    PlanoT.save_template(first, "Pernas", "", ["Agachamento"])
+    PlanoT.save_template(second, "Costas", "", ["Remada"])
+
+    storage.save_templates("ana", first)
+    with pytest.raises(PlanoT.StaleDataError):
+        storage.save_templates("ana", second)
+
+    assert [template["name"] for template in storage.load_templates("ana")["templates"].values()] == ["Pernas"]
+
+
+def test_concurrent_saves_with_retry_lose_no_update(storage):
+    storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}), {"001": student_detail()})
+
+    def finish_workout():
+        while True:
+            data = storage.load_trainer_students("ana")
+            data["students"]["001"]["completed_workouts"] += 1
+            try:
+                storage.save_trainer_students("ana", data)
+                return
+            except PlanoT.StaleDataError:
+                continue
+
+    threads = [threading.Thread(target=finish_workout) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    data = storage.load_trainer_students("ana")
+    assert data["students"]["001"]["completed_workouts"] == 8
+    assert data["version"] == 9
+
+
+# Diário de eventos (armazenamento JSON): eventos reaplicados na leitura e incorporados na compactação
+
+def toggle(student_id, exercise, completed=True):
+    return {"type": "exercise_toggled", "student_id": student_id, "workout_id": "w1", "exercise": exercise,
+            "completed": completed}
+
+
+@pytest.fixture
+def journaled():
+    storage = PlanoT.JSONStorage()
+    storage.add_trainer("ana", {"email": "ana@example.com", "password": None})
+    data = roster(**{"001": student_info("Maria", "maria_001"), "002": student_info("João", "joão_002")})
+    storage.save_trainer_students("ana", data, {"001": student_detail([WORKOUT]), "002": student_detail([WORKOUT])})
+    return storage
+
+
+def test_events_are_replayed_without_rewriting_the_files(journaled):
+    summary, detail = read_file("ana_students.json"), read_file(journaled.detail_filename("ana", "001"))
+
+    journaled.append_event("ana", toggle("001", 1))
+    journaled.append_events("ana", [
+        {"type": "weight_recorded", "student_id": "001", "weight": 69.0, "date": "2026-02-01", "latest": True},
+        {"type": "workout_finished", "student_id": "001", "workout_id": "w1", "action": "archive",
+         "session": PlanoT.workout_session(WORKOUT, "2026-02-01T08:00:00")}])
+
+    assert (read_file("ana_students.json"), read_file(journaled.detail_filename("ana", "001"))) == (summary, detail)
+    data = journaled.load_trainer_students("ana")
+    assert data["events_applied"] == 3
+    assert (data["students"]["001"]["weight"], data["students"]["001"]["completed_workouts"]) == (69.0, 1)
+    replayed = journaled.load_student_detail("ana", "001")
+    assert replayed["workouts"] == []
+    assert replayed["weight_history"] == {"dates": ["2026-02-01"], "weights": [69.0]}
+    assert journaled.load_student_details("ana", ["002"])["002"]["workouts"][0]["completed"] == [True, False]
+    assert journaled.load_history("ana", "001", "2026-02")[0]["workout_id"] == "w1"
+
+
+def test_compaction_keeps_the_replayed_data(journaled):
+    journaled.append_event("ana", toggle("001", 1))
+    journaled.append_event("ana", toggle("002", 0, False))
+    replayed = (journaled.load_trainer_students("ana"), journaled.load_student_details("ana", ["001", "002"]))
+
+    journaled.compact_journal("ana")
+
+    assert not os.path.exists("ana_events.jsonl")
+    assert (journaled.load_trainer_students("ana"), journaled.load_student_details("ana", ["001", "002"])) == replayed
+    assert journaled.load_trainer_students("ana")["version"] == 1
+
+
+def test_incomplete_journal_line_is_ignored(journaled):
+    journaled.append_event("ana", toggle("001", 1))
+    with open("ana_events.jsonl", "a") as f:
+        f.write('{"type": "exercise_toggled", "student_id": "001"')
+
+    assert journaled.load_trainer_students("ana")["events_applied"] == 1
+    assert journaled.load_student_detail("ana", "001")["workouts"][0]["completed"] == [True, True]
+
+
+def test_events_of_a_deleted_student_are_dropped(journaled):
+    journaled.append_event("ana", toggle("002", 1))
+    journaled.append_event("ana", {"type": "weight_recorded", "student_id": "002", "weight": 81.0,
+                                   "date": "2026-02-01", "latest": True})
+    data = journaled.load_trainer_students("ana")
+    del data["students"]["002"]
+
+    journaled.save_trainer_students("ana", data)
+
+    assert not os.path.exists("ana_events.jsonl")
+    assert not os.path.exists(journaled.detail_filename("ana", "002"))
+    assert list(journaled.load_trainer_students("ana")["students"]) == ["001"]
+
+
+def test_compaction_skips_students_deleted_after_their_events(journaled):
+    journaled.append_event("ana", toggle("002", 1))
+    # Outro processo exclui o aluno e grava o resumo sem passar pelo diário
+    data = json.loads(read_file("ana_students.json"))
+    del data["students"]["002"]
+    write_json("ana_students.json", data)
+    os.remove(journaled.detail_filename("ana", "002"))
+
+    journaled.compact_journal("ana")
+
+    assert not os.path.exists(journaled.detail_filename("ana", "002"))
+    assert journaled.load_trainer_students("ana")["events_applied"] == 1
+
+
+def test_large_journal_is_compacted_in_the_background(journaled, monkeypatch):
+    monkeypatch.setattr(PlanoT, "JOURNAL_COMPACT_BYTES", 0)
+
+    journaled.append_event("ana", toggle("001", 1))
+
+    deadline = time.monotonic() + 5
+    while os.path.exists("ana_events.jsonl") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not os.path.exists("ana_events.jsonl")
+    assert json.loads(read_file(journaled.detail_filename("ana", "001")))["workouts"][0]["completed"] == [True, True]
+
+
+# Cache compartilhado: cada leitura recebe uma cópia, relida só quando a versão muda
+
+class CountingStorage(PlanoT.JSONStorage):
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+
+    def load_trainer_students(self, trainer_login):
+        self.loads += 1
+        return super().load_trainer_students(trainer_login)
+
+
+@pytest.fixture
+def cache():
+    storage = CountingStorage()
+    storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}),
+                                  {"001": student_detail([WORKOUT], [("2026-01-01", 70.0)])})
+    return PlanoT.StudentCache(storage, max_trainers=2, max_details=2)
+
+
+def test_cache_returns_copies(cache):
+    data = cache.get("ana")
+    data["students"]["001"]["name"] = "Alterado"
+    data["students"]["002"] = student_info("João", "joão_002")
+    detail = cache.get_detail("ana", "001")
+    detail["workouts"][0]["completed"][0] = False
+    PlanoT.append_weight(detail, 60.0, "2026-02-01")
+    library = cache.get_templates("ana")
+    PlanoT.save_template(library, "Pernas", "", ["Agachamento"])
+
+    assert list(cache.get("ana")["students"]) == ["001"]
+    assert cache.get("ana")["students"]["001"]["name"] == "Maria"
+    assert cache.get_detail("ana", "001")["workouts"][0]["completed"] == [True, False]
+    assert cache.get_detail("ana", "001")["weight_history"]["weights"] == [70.0]
+    assert cache.get_templates("ana")["templates"] == {}
+    assert cache.storage.loads == 1
+
+
+def test_cache_reloads_when_the_storage_changes(cache):
+    cache.get("ana")
+    other = PlanoT.JSONStorage()
+    data = other.load_trainer_students("ana")
+    data["students"]["001"]["name"] = "Maria Souza"
+    other.save_trainer_students("ana", data)
+
+    assert cache.get("ana")["students"]["001"]["name"] == "Maria Souza"
+    assert cache.storage.loads == 2
+
+
+def test_saved_data_is_cached_as_a_copy(cache):
+    data = cache.get("ana")
+    data["students"]["001"]["name"] = "Maria Souza"
+    cache.save("ana", data)
+    data["students"]["001"]["name"] = "Depois de salvar"
+
+    assert cache.get("ana")["students"]["001"]["name"] == "Maria Souza"
+    assert cache.storage.loads == 1
+
+
+def test_stale_save_drops_the_cached_entry(cache):
+    first, second = cache.get("ana"), cache.get("ana")
+    cache.save("ana", first)
+
+    with pytest.raises(PlanoT.StaleDataError):
+        cache.save("ana", second)
+
+    assert cache.get("ana")["version"] == 2
+    assert cache.storage.loads == 2
+
+
+def test_recorded_event_updates_the_cached_entries(cache):
+    data, detail = cache.get("ana"), cache.get_detail("ana", "001")
+
+    cache.record("ana", data, detail, {"type": "exercise_toggled", "student_id": "001", "workout_id": "w1",
+                                       "exercise": 1, "completed": True})
+
+    assert detail["workouts"][0]["completed"] == [True, True]
+    assert cache.get_detail("ana", "001")["workouts"][0]["completed"] == [True, True]
+    assert cache.get("ana")["events_applied"] == data["events_applied"] == 1
+    assert cache.storage.loads == 1
+
+
+def test_least_recently_used_trainer_is_evicted(cache):
+    for trainer_login in ("ana", "bia", "ana", "caio"):
+        cache.get(trainer_login)
+
+    assert list(cache.entries["summary"]) == ["ana", "caio"]
+
+
+# Leitura sob demanda: a lista de alunos não carrega treinos nem histórico de peso
+
+def test_roster_is_read_without_the_details(storage):
+    storage.save_trainer_students("ana", roster(**{"001": student_info("Maria", "maria_001")}),
+                                  {"001": student_detail([WORKOUT], [("2026-01-01", 70.0)])})
+    if isinstance(storage, PlanoT.JSONStorage):
+        # Um arquivo de detalhes ilegível só atrapalha quem abre o aluno
+        with open(storage.detail_filename("ana", "001"), "w") as f:
+            f.write("{")
+
+    data = storage.load_trainer_students("ana")
+
+    assert list(data["students"]) == ["001"]
+    assert not set(PlanoT.DETAIL_FIELDS) & set(data["students"]["001"])
+
+
+def test_details_are_read_in_batches():
+    class BatchCountingStorage(PlanoT.JSONStorage):
+        def __init__(self):
+            super().__init__()
+            self.batches = []
+
+        def load_student_details(self, trainer_login, student_ids):
+            self.batches.append(list(student_ids))
+            return super().load_student_details(trainer_login, student_ids)
+
+    storage = BatchCountingStorage()
+    students = {f"{number:03d}": student_info(f"Aluno {number}", f"aluno_{number:03d}") for number in range(1, 6)}
+    storage.save_trainer_students("ana", roster(**students), {student_id: student_detail() for student_id in students})
+
+    read = [student_id for student_id, _ in PlanoT.iter_student_details(storage, "ana", iter(students), batch_size=2)]
+
+    assert read == list(students)
+    assert storage.batches == [["001", "002"], ["003", "004"], ["005"]]